@@ -231,19 +231,20 @@ echo_cmds(){
         echo "# $DATASET_ID: Ingest"
         local S3_DIR="s3://decision-support-tool-app-${DEPLOY_ENV}/${DATASET_ID}"
         local S3_SCRAPINGS_FILE="${S3_DIR}/${DATASET_ID}_scrapings-${TODAY}.json"
+        # Ingest with --incremental so that only changed pages are re-embedded
+        local INGEST_CMD="./bin/run-command app $DEPLOY_ENV '[\"ingest-runner\", \"$DATASET_ID\", \"--json_input\", \"$S3_SCRAPINGS_FILE\", \"--incremental\"]'"
         if [ "$DATASET_ID" == "edd" ] || [ "$DATASET_ID" == "la_policy" ]; then
             echo "{"
-            echo "#   Dropping table first so ingestion can use --resume in subsequent runs"
-            echo "./bin/run-command app $DEPLOY_ENV '[\"ingest-runner\", \"$DATASET_ID\", \"--drop-only\"]'"
-            echo "#   Ingest with --resume since it's a large dataset and can fail due to resource limits"
+            echo "#   Retry since it's a large dataset and can fail due to resource limits;"
+            echo "#   --incremental skips documents that were updated in previous attempts"
             echo "date"
-            echo "while ! ./bin/run-command app $DEPLOY_ENV '[\"ingest-runner\", \"$DATASET_ID\", \"--json_input\", \"$S3_SCRAPINGS_FILE\", \"--resume\"]'; do"
+            echo "while ! $INGEST_CMD; do"
             echo "   date"
-            echo "   echo \"Resuming/retrying ...\""
+            echo "   echo \"Retrying ...\""
             echo "done"
             echo "} &> ${DEPLOY_ENV}-task-${DATASET_ID}.log &"
         else
-            echo "./bin/run-command app $DEPLOY_ENV '[\"ingest-runner\", \"$DATASET_ID\", \"--json_input\", \"$S3_SCRAPINGS_FILE\"]' &> ${DEPLOY_ENV}-task-${DATASET_ID}.log &"
+            echo "$INGEST_CMD &> ${DEPLOY_ENV}-task-${DATASET_ID}.log &"
         fi
         echo "sleep 5"
         } >> $REFRESH_SH
@@ -18,10 +18,14 @@ Usage:
         session.query(...)
         with session.begin():
             session.add(...)
+
+    # asyncio ORM style usage
+    async with db_client.get_async_session() as session:
+        await session.execute(...)
 """
 
 # Re-export for convenience
-from src.adapters.db.client import Connection, DBClient, Session
+from src.adapters.db.client import AsyncSession, Connection, DBClient, Session
 from src.adapters.db.clients.postgres_client import PostgresDBClient
 
-__all__ = ["Connection", "DBClient", "Session", "PostgresDBClient"]
+__all__ = ["AsyncSession", "Connection", "DBClient", "Session", "PostgresDBClient"]
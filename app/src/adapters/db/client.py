@@ -8,6 +8,7 @@ import abc
 import logging
 
 import sqlalchemy
+from sqlalchemy.ext import asyncio as sqlalchemy_asyncio
 from sqlalchemy.orm import session
 
 # Re-export the Connection type that is returned by the get_connection() method
@@ -18,6 +19,10 @@ Connection = sqlalchemy.engine.Connection
 # to be used for type hints.
 Session = session.Session
 
+# Re-export the AsyncSession type that is returned by the get_async_session() method
+# to be used for type hints.
+AsyncSession = sqlalchemy_asyncio.AsyncSession
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,9 +33,11 @@ class DBClient(abc.ABC, metaclass=abc.ABCMeta):
     It has methods for getting a new connection or session object.
 
     A derived class must initialize _engine in the __init__ function
+    and _async_engine if get_async_session() is used
     """
 
     _engine: sqlalchemy.engine.Engine
+    _async_engine: sqlalchemy_asyncio.AsyncEngine
 
     @abc.abstractmethod
     def check_db_connection(self) -> None:
@@ -64,3 +71,15 @@ class DBClient(abc.ABC, metaclass=abc.ABCMeta):
                 # or rolled back if an exception is raised
         """
         return Session(bind=self._engine, expire_on_commit=False, autocommit=False)
+
+    def get_async_session(self) -> AsyncSession:
+        """Return a new asyncio session object.
+
+        Use this instead of get_session() in async code (e.g., chat engine
+        request handling) so that queries don't block the event loop.
+
+        Example:
+            async with db.get_async_session() as session:
+                result = await session.execute(...)
+        """
+        return AsyncSession(bind=self._async_engine, expire_on_commit=False, autocommit=False)
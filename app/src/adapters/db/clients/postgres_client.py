@@ -6,6 +6,7 @@ import boto3
 import psycopg
 import sqlalchemy
 import sqlalchemy.pool as pool
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 from src.adapters.db.client import DBClient
 from src.adapters.db.clients.postgres_config import PostgresDBConfig, get_db_config
@@ -23,6 +24,8 @@ class PostgresDBClient(DBClient):
         if not db_config:
             db_config = get_db_config()
         self._engine = self._configure_engine(db_config)
+        # Connections are only opened once the async engine is first used
+        self._async_engine = self._configure_async_engine(db_config)
 
         if db_config.check_connection_on_init:
             self.check_db_connection()
@@ -52,6 +55,20 @@ class PostgresDBClient(DBClient):
             # json_serializer=lambda o: json.dumps(o, default=pydantic.json.pydantic_encoder),
         )
 
+    def _configure_async_engine(self, db_config: PostgresDBConfig) -> AsyncEngine:
+        # Like _configure_engine(), connection parameters are determined for each
+        # connection so that fresh IAM auth tokens can be used.
+        async def get_async_conn() -> Any:
+            return await psycopg.AsyncConnection.connect(**get_connection_parameters(db_config))
+
+        return create_async_engine(
+            "postgresql+psycopg://",
+            async_creator=get_async_conn,
+            max_overflow=10,
+            pool_size=20,
+            hide_parameters=db_config.hide_sql_parameter_logs,
+        )
+
     def check_db_connection(self) -> None:
         with self.get_connection() as conn:
             conn_info = conn.connection.dbapi_connection.info  # type: ignore
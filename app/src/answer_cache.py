@@ -0,0 +1,170 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from src.app_config import app_config
+from src.db.models.document import ChunkWithScore, Subsection
+from src.embeddings.cache import normalize_query
+from src.embeddings.model import EmbeddingModel
+from src.generate import MessageAttributes
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCacheKey(NamedTuple):
+    "Answers are only reused for questions with the same key"
+
+    engine_id: str
+    # Hash of the engine's settings, including its prompts, that affect answers
+    settings_hash: str
+    llm: str
+    # See src.retrieve.corpus_version()
+    corpus_version: str
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    response: str
+    system_prompt: str
+    attributes: MessageAttributes
+    subsections: Sequence[Subsection]
+    chunks_with_scores: Sequence[ChunkWithScore]
+
+
+class _Entry(NamedTuple):
+    key: AnswerCacheKey
+    embedding: npt.NDArray[np.float32]
+    answer: CachedAnswer
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache of answers to questions that reuses an answer for a new question whose
+    embedding is similar enough to the cached question's, e.g., "How do I apply for CalFresh?"
+    and "how can I apply for calfresh".
+
+    Only answers that don't depend on a conversation (i.e., to first-turn questions) should be
+    cached. Entries for an older corpus version are dropped as soon as a key with a new
+    corpus version is used, so answers aren't reused once the corpus is re-ingested.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        min_score: float,
+        embedding_model: Optional[EmbeddingModel] = None,
+    ):
+        """
+        Args:
+            max_size: Maximum number of answers to keep; least recently used ones are evicted
+            min_score: Minimum cosine similarity between questions for an answer to be reused
+            embedding_model: Model used to embed questions; defaults to app_config.embedding_model
+        """
+        self.max_size = max_size
+        self.min_score = min_score
+        self._embedding_model = embedding_model
+        self._entries: OrderedDict[tuple[AnswerCacheKey, str], _Entry] = OrderedDict()
+        self._corpus_version: Optional[str] = None
+        # Answers are looked up from multiple threads, e.g., via asyncio.to_thread()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def embedding_model(self) -> EmbeddingModel:
+        return self._embedding_model or app_config.embedding_model
+
+    def get(self, key: AnswerCacheKey, question: str) -> Optional[CachedAnswer]:
+        "Returns the answer to the most similar cached question with the same key, if any"
+        question = normalize_query(question)
+        with self._lock:
+            self._drop_old_corpus_versions(key.corpus_version)
+            entry = self._entries.get((key, question))
+            candidates = (
+                [entry]
+                if entry
+                else [entry for entry in self._entries.values() if entry.key == key]
+            )
+        if not candidates:
+            self._record_miss(question)
+            return None
+
+        score = 1.0
+        if not entry:
+            # Embed the question outside of the lock so that other threads aren't blocked
+            embedding = self._embed(question)
+            scores = np.stack([candidate.embedding for candidate in candidates]) @ embedding
+            best = int(np.argmax(scores))
+            entry, score = candidates[best], float(scores[best])
+            if score < self.min_score:
+                self._record_miss(question)
+                return None
+
+        with self._lock:
+            self.hits += 1
+            entry_key = (entry.key, normalize_query(entry.answer.question))
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+        logger.info(
+            "Answer cache hit for %r (score %.3f, cached question %r)",
+            question,
+            score,
+            entry.answer.question,
+        )
+        return entry.answer
+
+    def put(self, key: AnswerCacheKey, answer: CachedAnswer) -> None:
+        "Caches the answer to answer.question"
+        question = normalize_query(answer.question)
+        entry = _Entry(key, self._embed(question), answer)
+        with self._lock:
+            self._drop_old_corpus_versions(key.corpus_version)
+            self._entries[(key, question)] = entry
+            self._entries.move_to_end((key, question))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def cache_info(self) -> dict[str, int]:
+        """
+        Returns the cache's hit and miss counts and current size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+    def clear(self) -> None:
+        """
+        Removes all cached answers and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _record_miss(self, question: str) -> None:
+        with self._lock:
+            self.misses += 1
+        logger.info("Answer cache miss for %r", question)
+
+    def _embed(self, question: str) -> npt.NDArray[np.float32]:
+        embedding = np.asarray(self.embedding_model.encode(question), dtype=np.float32)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def _drop_old_corpus_versions(self, corpus_version: str) -> None:
+        # Must be called while holding the lock
+        if corpus_version == self._corpus_version:
+            return
+        if self._entries:
+            logger.info("Corpus version changed; dropping %d cached answers", len(self._entries))
+            self._entries.clear()
+        self._corpus_version = corpus_version
@@ -1,3 +1,6 @@
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -5,7 +8,16 @@ from chainlit.utils import mount_chainlit
 from src.app_config import app_config
 from src.healthcheck import healthcheck_router
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncGenerator[None, None]:
+    # Fail at startup rather than when chunks are retrieved
+    app_config.check_embedding_dimension()
+    app_config.check_quantized_embedding_index()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1,6 +1,11 @@
 from functools import cached_property
+from typing import Literal
+
+from sqlalchemy import text
 
 from src.adapters import db
+from src.db.models.document import EMBEDDING_DIMENSION
+from src.embeddings.cache import CachedEmbeddingModel
 from src.embeddings.cohere import COHERE_EMBEDDING_MODELS, CohereEmbedding
 from src.embeddings.model import EmbeddingModel
 from src.embeddings.openai import OPENAI_EMBEDDING_MODELS, OpenAIEmbedding
@@ -29,6 +34,62 @@ class AppConfig(PydanticBaseEnvConfig):
 
     # Used for ingestion (before chatbot application starts) and retrieval (during chatbot interactions)
     embedding_model_name: str = "multi-qa-mpnet-base-cos-v1"
+    # Number of dimensions of the embeddings returned by the embedding model. Models with larger
+    # embeddings return shorter ones (e.g., via OpenAI's dimensions option), which trades a little
+    # recall for smaller indexes and faster search. It must match the chunk embedding column,
+    # which is checked at startup; see EMBEDDING_DIMENSION in src.db.models.document.
+    embedding_dimension: int = EMBEDDING_DIMENSION
+    # Runtime for SentenceTransformer embedding models; "onnx" is faster on CPU than "torch"
+    # but requires the optimum and onnxruntime packages
+    embedding_backend: Literal["torch", "onnx"] = "torch"
+    # If set with the "onnx" backend, this ONNX file in the model's directory is used instead of
+    # onnx/model.onnx, e.g., an int8-quantized one (see export_quantized_onnx_model())
+    embedding_onnx_file_name: str | None = None
+    # Number of query embeddings to cache; set to 0 to disable caching
+    embedding_cache_size: int = 1024
+    # If set, the query embedding cache is loaded from and saved to this file
+    embedding_cache_path: str | None = None
+
+    # Size of the candidate list when searching the HNSW index on chunk embeddings (pgvector's
+    # hnsw.ef_search). Higher values improve recall at the cost of speed.
+    # At least retrieval_k candidates are always searched since it limits the number of results.
+    hnsw_ef_search: int = 40
+    # Parameters of the HNSW indexes on chunk embeddings (pgvector's m and ef_construction).
+    # Higher values improve recall but make the indexes larger and slower to build.
+    # Migrations build the indexes with the defaults; to apply other values, run
+    # `python -m src.util.rebuild_hnsw_indexes`.
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    # If set, retrieval searches a quantized copy of the chunk embeddings -- "halfvec" (16 bits per
+    # dimension) or "binary" (1 bit per dimension, compared by Hamming distance) -- whose index is
+    # much smaller, and re-scores retrieval_k * quantized_rerank_factor candidates using the full
+    # embeddings. Requires pgvector 0.7+. Compare recall@k with exact_search before enabling it.
+    retrieval_quantization: Literal["none", "halfvec", "binary"] = "none"
+    quantized_rerank_factor: int = 4
+
+    # Number of answers to first-turn questions to cache per process; set to 0 to disable caching.
+    # A cached answer is reused for a question whose embedding is at least answer_cache_min_score
+    # similar (cosine similarity) to the cached question's, so keep it high.
+    answer_cache_size: int = 0
+    answer_cache_min_score: float = 0.97
+    # Where chunks are retrieved from: "pgvector" searches the DB, "numpy" searches an in-process
+    # replica of all chunk embeddings, which is faster if they fit in memory. The replica is
+    # a memory-mapped file in vector_index_dir (or the temp directory) and is reloaded from the DB
+    # when the corpus changes.
+    retrieval_backend: Literal["pgvector", "numpy"] = "pgvector"
+    vector_index_dir: str | None = None
+
+    # Number of retrieval results to cache per process; set to 0 to disable caching
+    retrieval_cache_size: int = 256
+    # Seconds for which the corpus version is reused before checking whether documents have been
+    # re-ingested by another process. By default, it's checked (using a cheap query) on every cache
+    # lookup so that cached answers and retrievals from before re-ingestion are never used;
+    # a positive value saves that query but allows them to be used for up to that long.
+    corpus_version_ttl: float = 0
+
+    # Number of processes used to chunk documents during ingestion;
+    # if not set, the number of CPUs is used
+    chunking_workers: int | None = None
 
     # Default chat engine
     chat_engine: str = "imagine-la"
@@ -49,14 +110,88 @@ class AppConfig(PydanticBaseEnvConfig):
     def db_session(self) -> db.Session:
         return self.db_client.get_session()
 
+    def async_db_session(self) -> db.AsyncSession:
+        return self.db_client.get_async_session()
+
     @cached_property
     def embedding_model(self) -> EmbeddingModel:
+        model = self._create_embedding_model()
+        if self.embedding_cache_size <= 0:
+            return model
+        return CachedEmbeddingModel(
+            model,
+            # Shortened embeddings differ from the model's full ones
+            f"{self.embedding_model_name}:{self.embedding_dimension}",
+            max_size=self.embedding_cache_size,
+            cache_path=self.embedding_cache_path,
+        )
+
+    def check_embedding_dimension(self) -> None:
+        """
+        Raises a ValueError if embedding_dimension doesn't match the chunk embedding column, which
+        would otherwise only fail when chunks are saved or retrieved.
+        """
+        with self.db_session() as db_session:
+            # A vector column's type modifier is its number of dimensions
+            column_dimension = db_session.execute(
+                text(
+                    "SELECT atttypmod FROM pg_attribute "
+                    "WHERE attrelid = to_regclass('chunk') AND attname = 'mpnet_embedding'"
+                )
+            ).scalar()
+        for name, dimension in [
+            ("Chunk.mpnet_embedding", EMBEDDING_DIMENSION),
+            ("the chunk.mpnet_embedding column in the DB", column_dimension),
+        ]:
+            # The column doesn't exist before the DB is migrated
+            if dimension is not None and dimension != self.embedding_dimension:
+                raise ValueError(
+                    f"EMBEDDING_DIMENSION is {self.embedding_dimension} but {name} has "
+                    f"{dimension} dimensions. Changing the embedding dimension requires a "
+                    "migration of the chunk embedding column and re-ingesting all datasets."
+                )
+
+    def check_quantized_embedding_index(self) -> None:
+        """
+        Raises a ValueError if retrieval_quantization is set but the DB doesn't have a valid index
+        on the quantized embeddings, without which every retrieval would scan all chunks.
+        """
+        if self.retrieval_quantization == "none":
+            return
+        index_name = f"chunk_mpnet_embedding_{self.retrieval_quantization}_idx"
+        with self.db_session() as db_session:
+            chunk_table_exists, index_is_valid = db_session.execute(
+                text(
+                    "SELECT to_regclass('chunk') IS NOT NULL, "
+                    "(SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name))"
+                ),
+                {"name": index_name},
+            ).one()
+        # The table doesn't exist before the DB is migrated
+        if chunk_table_exists and not index_is_valid:
+            raise ValueError(
+                f"RETRIEVAL_QUANTIZATION is {self.retrieval_quantization!r} but the DB has no "
+                f"valid {index_name} index. It's created by the migrations, which require "
+                "pgvector 0.7+. An invalid index, e.g., from an interrupted build, can be rebuilt "
+                "using `python -m src.util.rebuild_hnsw_indexes`."
+            )
+
+    def hnsw_index_options(self) -> dict[str, int]:
+        "Returns the storage parameters of the HNSW indexes on chunk embeddings"
+        return {"m": self.hnsw_m, "ef_construction": self.hnsw_ef_construction}
+
+    def _create_embedding_model(self) -> EmbeddingModel:
         if self.embedding_model_name in OPENAI_EMBEDDING_MODELS:
-            return OpenAIEmbedding(self.embedding_model_name)
+            return OpenAIEmbedding(self.embedding_model_name, self.embedding_dimension)
         elif self.embedding_model_name in COHERE_EMBEDDING_MODELS:
-            return CohereEmbedding(self.embedding_model_name)
-
-        return SentenceTransformerEmbedding(self.embedding_model_name)
+            return CohereEmbedding(self.embedding_model_name, self.embedding_dimension)
+
+        return SentenceTransformerEmbedding(
+            self.embedding_model_name,
+            self.embedding_dimension,
+            backend=self.embedding_backend,
+            onnx_file_name=self.embedding_onnx_file_name,
+        )
 
 
 app_config = AppConfig()
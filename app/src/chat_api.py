@@ -14,7 +14,6 @@ from contextvars import ContextVar
 from dataclasses import dataclass
 from typing import Any, AsyncGenerator, Coroutine, Generator, Optional, Sequence
 
-from asyncer import asyncify
 from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
 from lazify import LazyProxy
 from pydantic import BaseModel
@@ -33,7 +32,7 @@ from src.chat_engine import ChatEngineInterface
 from src.citations import simplify_citation_numbers
 from src.db.models.conversation import ChatMessage, UserSession
 from src.db.models.document import Subsection
-from src.generate import ChatHistory
+from src.generate import ChatHistory, MessageAttributes
 from src.healthcheck import HealthCheck, health
 from src.util.string_utils import format_highlighted_uri
 
@@ -562,14 +561,17 @@ async def query_stream(
                 full_response = ""
                 async for chunk in response_generator:
                     if await request.is_disconnected():
-                        break
+                        # Don't save the cut-off response, which would be in the chat history
+                        # of the next message as if it were the whole answer
+                        logger.info("Client disconnected from query_stream for message %s", id)
+                        await response_generator.aclose()
+                        return
                     full_response += chunk
                     yield {"event": "chunk", "data": chunk}
 
-                # Process final response with citations
-                query_response, meta = await run_query(
-                    engine, question_content, chat_history, streaming=True
-                )
+                # Process final response with citations, reusing the streamed response and
+                # retrieved subsections rather than calling the engine (and LLM) again
+                query_response, meta = _build_query_response(full_response, attributes, subsections)
 
                 # Send the remapped final response so client can update displayed text
                 yield {"event": "remapped_response", "data": query_response.response_text}
@@ -659,24 +661,23 @@ async def run_query(
         async for chunk in response_generator:
             full_response += chunk
 
-        final_result = simplify_citation_numbers(full_response.strip(), subsections)
-        logger.info("Response: %s", final_result.response)
-        citations = [
-            Citation.from_subsection(subsection) for subsection in final_result.subsections
-        ]
+        return _build_query_response(full_response, attributes, subsections)
+
+    result = await engine.on_message_async(question, chat_history)
+    return _build_query_response(result.response, result.attributes, result.subsections)
 
-        alert_msg = getattr(attributes, "alert_message", None)
-    else:
-        result = await asyncify(lambda: engine.on_message(question, chat_history))()
-        final_result = simplify_citation_numbers(result.response, result.subsections)
-        logger.info("Response: %s", final_result.response)
-        citations = [
-            Citation.from_subsection(subsection) for subsection in final_result.subsections
-        ]
 
-        alert_msg = getattr(result.attributes, "alert_message", None)
-        attributes = result.attributes
+def _build_query_response(
+    response: str,
+    attributes: MessageAttributes,
+    subsections: Sequence[Subsection],
+) -> tuple[QueryResponse, dict[str, Any]]:
+    """Builds the QueryResponse (with remapped citations) for an already-generated response"""
+    final_result = simplify_citation_numbers(response.strip(), subsections)
+    logger.info("Response: %s", final_result.response)
+    citations = [Citation.from_subsection(subsection) for subsection in final_result.subsections]
 
+    alert_msg = getattr(attributes, "alert_message", None)
     if INCLUDE_ALERT_IN_RESPONSE and alert_msg:
         response_msg = f"{alert_msg}\n\n{final_result.response}"
     else:
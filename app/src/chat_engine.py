@@ -1,20 +1,38 @@
+import asyncio
+import hashlib
+import json
 import logging
+import re
 import time
 from abc import ABC, abstractmethod
-from typing import AsyncGenerator, Optional, Sequence
+from typing import AsyncGenerator, NamedTuple, Optional, Sequence, cast
 
+from src.answer_cache import AnswerCache, AnswerCacheKey, CachedAnswer
+from src.app_config import app_config
 from src.citations import CitationFactory, create_prompt_context, split_into_subsections
 from src.db.models.document import ChunkWithScore, Subsection
+from src.embeddings.cache import normalize_query
 from src.format import FormattingConfig
 from src.generate import (
     ChatHistory,
     MessageAttributes,
     MessageAttributesT,
+    PartialJsonObject,
     analyze_message,
+    analyze_message_async,
+    analyze_message_streaming_async,
     generate,
+    generate_async,
     generate_streaming_async,
+    parse_message_attributes,
+)
+from src.intent_router import Intent, IntentMatch, IntentRouter
+from src.retrieve import (
+    corpus_version,
+    corpus_version_async,
+    retrieve_with_scores,
+    retrieve_with_scores_async,
 )
-from src.retrieve import retrieve_with_scores
 from src.util.class_utils import all_subclasses
 
 logger = logging.getLogger(__name__)
@@ -93,6 +111,12 @@ class ChatEngineInterface(ABC):
     ) -> OnMessageResult:
         pass
 
+    @abstractmethod
+    async def on_message_async(
+        self, question: str, chat_history: Optional[ChatHistory] = None
+    ) -> OnMessageResult:
+        pass
+
     @abstractmethod
     async def on_message_streaming(
         self, question: str, chat_history: Optional[ChatHistory] = None
@@ -120,6 +144,27 @@ def create_engine(engine_id: str) -> ChatEngineInterface | None:
     return chat_engine_class()
 
 
+class _PendingRetrieval(NamedTuple):
+    "Context retrieval for a query that was started before the message analysis completed"
+
+    query: str
+    task: asyncio.Task[Sequence[ChunkWithScore]]
+
+
+def _cancel(pending_retrieval: Optional[_PendingRetrieval]) -> None:
+    # Stop retrieving context that won't be used
+    if pending_retrieval:
+        pending_retrieval.task.cancel()
+
+
+# Shared by all engines since answers are cached by engine_id and settings
+_answer_cache = (
+    AnswerCache(app_config.answer_cache_size, app_config.answer_cache_min_score)
+    if app_config.answer_cache_size > 0
+    else None
+)
+
+
 # Subclasses of ChatEngineInterface can be extracted into a separate file if it gets too large
 class BaseEngine(ChatEngineInterface):
     datasets: list[str] = []
@@ -129,6 +174,21 @@ class BaseEngine(ChatEngineInterface):
     retrieval_k: int = 8
     retrieval_k_min_score: float = 0.45
 
+    # If True, the async methods retrieve context for the question while analyze_message()
+    # is running rather than after it. The retrieved context is used if the question doesn't need
+    # to be translated; otherwise, context is retrieved again for the translated question.
+    speculative_retrieval: bool = False
+
+    # If True, the async methods parse analyze_message()'s response as it streams from the LLM
+    # so that context is retrieved as soon as needs_context and translated_message are known
+    # and, in on_message_streaming(), a canned_response is streamed as soon as it starts arriving.
+    # Requires an LLM that streams structured output.
+    stream_message_analysis: bool = False
+
+    # If set, answers to first-turn questions are cached and reused for similar questions;
+    # enabled by setting app_config.answer_cache_size
+    answer_cache: Optional[AnswerCache] = _answer_cache
+
     user_settings = [
         "llm",
         "retrieval_k",
@@ -142,152 +202,446 @@ class BaseEngine(ChatEngineInterface):
 
     formatting_config = FormattingConfig()
 
+    # The attributes that analyze_message() populates using system_prompt_1
+    message_attributes: type[MessageAttributes] = MessageAttributes
+
     def on_message(
         self, question: str, chat_history: Optional[ChatHistory] = None
     ) -> OnMessageResult:
-        # Start timing system_prompt_1
-        start_time = time.perf_counter()
-        attributes = analyze_message(self.llm, self.system_prompt_1, question, MessageAttributes)
-        system_prompt_1_duration = time.perf_counter() - start_time
-        logger.info(
-            f"System Prompt 1 (analyze_message) took {system_prompt_1_duration:.2f} seconds"
-        )
+        answer_cache = self._answer_cache_for(chat_history)
+        if not answer_cache:
+            return self._on_message(question, chat_history)
 
-        if attributes.needs_context:
-            return self._build_response_with_context(question, attributes, chat_history)
+        cache_key = self._answer_cache_key(corpus_version())
+        if cached := answer_cache.get(cache_key, question):
+            return _cached_result(cached)
+
+        result = self._on_message(question, chat_history)
+        answer_cache.put(cache_key, _cached_answer(question, result))
+        return result
 
-        return self._build_response(question, attributes, chat_history)
+    async def on_message_async(
+        self, question: str, chat_history: Optional[ChatHistory] = None
+    ) -> OnMessageResult:
+        answer_cache = self._answer_cache_for(chat_history)
+        if not answer_cache:
+            return await self._on_message_async(question, chat_history)
+
+        cache_key = self._answer_cache_key(await corpus_version_async())
+        if cached := await asyncio.to_thread(answer_cache.get, cache_key, question):
+            return _cached_result(cached)
+
+        result = await self._on_message_async(question, chat_history)
+        await asyncio.to_thread(answer_cache.put, cache_key, _cached_answer(question, result))
+        return result
 
     async def on_message_streaming(
         self, question: str, chat_history: Optional[ChatHistory] = None
     ) -> tuple[AsyncGenerator[str, None], MessageAttributes, Sequence[Subsection]]:
-        # Start timing system_prompt_1
-        start_time = time.perf_counter()
-        attributes = analyze_message(self.llm, self.system_prompt_1, question, MessageAttributes)
-        system_prompt_1_duration = time.perf_counter() - start_time
-        logger.info(
-            f"System Prompt 1 (analyze_message) took {system_prompt_1_duration:.2f} seconds"
+        answer_cache = self._answer_cache_for(chat_history)
+        if not answer_cache:
+            return await self._on_message_streaming(question, chat_history)
+
+        cache_key = self._answer_cache_key(await corpus_version_async())
+        if cached := await asyncio.to_thread(answer_cache.get, cache_key, question):
+            return _replay(cached.response), cached.attributes, cached.subsections
+
+        generator, attributes, subsections = await self._on_message_streaming(
+            question, chat_history
+        )
+        cached_stream = self._cache_streamed_answer(
+            answer_cache, cache_key, question, generator, attributes, subsections
+        )
+        return cached_stream, attributes, subsections
+
+    def _answer_cache_for(self, chat_history: Optional[ChatHistory]) -> Optional[AnswerCache]:
+        # Answers to follow-up questions depend on the conversation, so they aren't cached
+        return None if chat_history else self.answer_cache
+
+    def _answer_cache_key(self, corpus_version: str) -> AnswerCacheKey:
+        # User settings (e.g., the prompts) can be changed per session, so they're part of the key
+        settings = {name: getattr(self, name) for name in self.user_settings}
+        settings["datasets"] = self.datasets
+        settings_json = json.dumps(settings, sort_keys=True, default=str)
+        return AnswerCacheKey(
+            self.engine_id,
+            hashlib.sha256(settings_json.encode()).hexdigest(),
+            self.llm,
+            corpus_version,
+        )
+
+    async def _cache_streamed_answer(
+        self,
+        answer_cache: AnswerCache,
+        cache_key: AnswerCacheKey,
+        question: str,
+        generator: AsyncGenerator[str, None],
+        attributes: MessageAttributes,
+        subsections: Sequence[Subsection],
+    ) -> AsyncGenerator[str, None]:
+        chunks = []
+        async for chunk in generator:
+            chunks.append(chunk)
+            yield chunk
+
+        # Only complete responses are cached. Streamed canned responses complete the attributes.
+        system_prompt = (
+            self.system_prompt_1
+            if getattr(attributes, "canned_response", "")
+            else self.system_prompt_2
+        )
+        answer = CachedAnswer(question, "".join(chunks), system_prompt, attributes, subsections, [])
+        await asyncio.to_thread(answer_cache.put, cache_key, answer)
+
+    # The sync and async methods below only differ in how they call the LLM and the database;
+    # the canned responses, prompt context and results are handled by the shared helpers.
+    def _on_message(
+        self, question: str, chat_history: Optional[ChatHistory] = None
+    ) -> OnMessageResult:
+        attributes = self._analyze_message(question, self.message_attributes)
+        if result := self._canned_result(attributes):
+            return result
+
+        chunks_with_scores = (
+            self._retrieve(attributes.translated_message or question)
+            if attributes.needs_context
+            else None
+        )
+        return self._build_response(question, attributes, chat_history, chunks_with_scores)
+
+    async def _on_message_async(
+        self, question: str, chat_history: Optional[ChatHistory] = None
+    ) -> OnMessageResult:
+        attributes, speculative_retrieval = await self._analyze_message_async(
+            question, self.message_attributes
+        )
+        if result := self._canned_result(attributes):
+            _cancel(speculative_retrieval)
+            return result
+
+        chunks_with_scores = None
+        if attributes.needs_context:
+            chunks_with_scores = await self._retrieve_for_message_async(
+                question, attributes, speculative_retrieval
+            )
+        else:
+            _cancel(speculative_retrieval)
+        return await self._build_response_async(
+            question, attributes, chat_history, chunks_with_scores
+        )
+
+    async def _on_message_streaming(
+        self, question: str, chat_history: Optional[ChatHistory] = None
+    ) -> tuple[AsyncGenerator[str, None], MessageAttributes, Sequence[Subsection]]:
+        attributes, speculative_retrieval = await self._analyze_message_async(
+            question, self.message_attributes
         )
 
         # Directly return the result of _build_streaming_response
-        return await self._build_streaming_response(question, attributes, chat_history)
+        return await self._build_streaming_response(
+            question, attributes, chat_history, speculative_retrieval
+        )
+
+    def _analyze_message(
+        self, question: str, response_format: type[MessageAttributesT]
+    ) -> MessageAttributesT:
+        start_time = time.perf_counter()
+        attributes = analyze_message(self.llm, self.system_prompt_1, question, response_format)
+        _log_duration("System Prompt 1 (analyze_message)", start_time)
+        return attributes
+
+    async def _analyze_message_async(
+        self, question: str, response_format: type[MessageAttributesT]
+    ) -> tuple[MessageAttributesT, Optional[_PendingRetrieval]]:
+        """
+        Like _analyze_message() but calls analyze_message_async() and, if speculative_retrieval is
+        enabled, starts retrieving context for the question beforehand. The returned retrieval must
+        be passed to _retrieve_for_message_async() or cancelled using _cancel().
+        """
+        if self.stream_message_analysis:
+            attributes, pending_retrieval, _ = await self._stream_message_analysis(
+                question, response_format
+            )
+            return attributes, pending_retrieval
+
+        speculative_retrieval = (
+            self._start_retrieval(question) if self.speculative_retrieval else None
+        )
+        start_time = time.perf_counter()
+        try:
+            attributes = await analyze_message_async(
+                self.llm, self.system_prompt_1, question, response_format
+            )
+        except BaseException:
+            _cancel(speculative_retrieval)
+            raise
+        _log_duration("System Prompt 1 (analyze_message)", start_time)
+        return attributes, speculative_retrieval
+
+    async def _stream_message_analysis(
+        self,
+        question: str,
+        response_format: type[MessageAttributesT],
+        stream_canned_response: bool = False,
+    ) -> tuple[
+        MessageAttributesT, Optional[_PendingRetrieval], Optional[AsyncGenerator[str, None]]
+    ]:
+        """
+        Like _analyze_message_async() but parses analyze_message()'s response as it streams in.
+        Context is retrieved as soon as needs_context and translated_message are known.
+
+        If stream_canned_response is True and the response has a canned_response, a generator that
+        streams it is returned as soon as it starts arriving, along with attributes that only have
+        the fields received so far; the attributes are completed once the generator is exhausted.
+        """
+        pending_retrieval = self._start_retrieval(question) if self.speculative_retrieval else None
+        retrieval_decided = False
+        response = PartialJsonObject()
+        stream = analyze_message_streaming_async(
+            self.llm, self.system_prompt_1, question, response_format
+        )
+        start_time = time.perf_counter()
+        try:
+            async for text in stream:
+                response.feed(text)
+                fields = response.fields
+                if (
+                    not retrieval_decided
+                    and "needs_context" in fields
+                    and "translated_message" in fields
+                ):
+                    retrieval_decided = True
+                    query = fields["translated_message"] or question
+                    if not fields["needs_context"]:
+                        _cancel(pending_retrieval)
+                        pending_retrieval = None
+                    elif not pending_retrieval or normalize_query(query) != normalize_query(
+                        pending_retrieval.query
+                    ):
+                        _cancel(pending_retrieval)
+                        pending_retrieval = self._start_retrieval(query)
+
+                if response.value_so_far("canned_response"):
+                    # Context isn't needed for a canned response
+                    retrieval_decided = True
+                    _cancel(pending_retrieval)
+                    pending_retrieval = None
+                    if not stream_canned_response:
+                        continue
+
+                    attributes = cast(
+                        MessageAttributesT,
+                        response_format.model_construct(
+                            **{name: "" for name in response_format.model_fields} | fields
+                        ),
+                    )
+                    generator = self._stream_canned_response(
+                        stream, response, attributes, start_time
+                    )
+                    return attributes, None, generator
+        except BaseException:
+            _cancel(pending_retrieval)
+            raise
+
+        _log_duration("System Prompt 1 (analyze_message)", start_time)
+        try:
+            return parse_message_attributes(response.text, response_format), pending_retrieval, None
+        except BaseException:
+            _cancel(pending_retrieval)
+            raise
+
+    async def _stream_canned_response(
+        self,
+        stream: AsyncGenerator[str, None],
+        response: PartialJsonObject,
+        attributes: MessageAttributesT,
+        start_time: float,
+    ) -> AsyncGenerator[str, None]:
+        sent = 0
+        while True:
+            canned_response = response.value_so_far("canned_response")
+            if len(canned_response) > sent:
+                yield canned_response[sent:]
+                sent = len(canned_response)
+            try:
+                response.feed(await anext(stream))
+            except StopAsyncIteration:
+                break
+
+        _log_duration("System Prompt 1 (analyze_message)", start_time)
+        # Fill in the fields that arrived after the attributes were returned
+        final_attributes = parse_message_attributes(response.text, type(attributes))
+        for name in type(attributes).model_fields:
+            setattr(attributes, name, getattr(final_attributes, name))
+
+    def _start_retrieval(self, query: str) -> _PendingRetrieval:
+        return _PendingRetrieval(query, asyncio.create_task(self._retrieve_async(query)))
+
+    def _canned_result(self, attributes: MessageAttributes) -> Optional[OnMessageResult]:
+        # Engines whose message attributes have a canned_response respond with it without context
+        canned_response = getattr(attributes, "canned_response", "")
+        if not canned_response:
+            return None
+        return OnMessageResult(canned_response, self.system_prompt_1, attributes)
 
     def _build_response(
         self,
         question: str,
         attributes: MessageAttributesT,
         chat_history: Optional[ChatHistory] = None,
+        chunks_with_scores: Optional[Sequence[ChunkWithScore]] = None,
     ) -> OnMessageResult:
-        # Start timing system_prompt_2
+        "Generates a response using the retrieved chunks as context, if any were retrieved"
+        subsections, context_text = _prompt_context(chunks_with_scores)
         start_time = time.perf_counter()
-        response = generate(
-            self.llm,
-            self.system_prompt_2,
-            question,
-            None,
-            chat_history,
-        )
-        system_prompt_2_duration = time.perf_counter() - start_time
-        logger.info(
-            f"System Prompt 2 (generate without context) took {system_prompt_2_duration:.2f} seconds"
-        )
-
-        return OnMessageResult(response, self.system_prompt_2, attributes)
+        response = generate(self.llm, self.system_prompt_2, question, context_text, chat_history)
+        _log_generate_duration(start_time, context_text)
+        return self._result(response, attributes, chunks_with_scores, subsections)
 
-    def _build_response_with_context(
+    async def _build_response_async(
         self,
         question: str,
         attributes: MessageAttributesT,
         chat_history: Optional[ChatHistory] = None,
+        chunks_with_scores: Optional[Sequence[ChunkWithScore]] = None,
     ) -> OnMessageResult:
-        question_for_retrieval = attributes.translated_message or question
+        subsections, context_text = _prompt_context(chunks_with_scores)
+        start_time = time.perf_counter()
+        response = await generate_async(
+            self.llm, self.system_prompt_2, question, context_text, chat_history
+        )
+        _log_generate_duration(start_time, context_text)
+        return self._result(response, attributes, chunks_with_scores, subsections)
+
+    def _result(
+        self,
+        response: str,
+        attributes: MessageAttributesT,
+        chunks_with_scores: Optional[Sequence[ChunkWithScore]],
+        subsections: Sequence[Subsection],
+    ) -> OnMessageResult:
+        return OnMessageResult(
+            response,
+            self.system_prompt_2,
+            attributes,
+            chunks_with_scores=chunks_with_scores,
+            subsections=subsections,
+        )
 
-        # Time the retrieval separately since we know it's fast
-        retrieval_start = time.perf_counter()
+    def _retrieve(self, question_for_retrieval: str) -> Sequence[ChunkWithScore]:
+        start_time = time.perf_counter()
         chunks_with_scores = retrieve_with_scores(
             question_for_retrieval,
             retrieval_k=self.retrieval_k,
             retrieval_k_min_score=self.retrieval_k_min_score,
             datasets=self.datasets,
         )
-        retrieval_duration = time.perf_counter() - retrieval_start
-        logger.info(f"Vector retrieval took {retrieval_duration:.2f} seconds")
+        _log_duration("Vector retrieval", start_time)
+        return chunks_with_scores
 
-        chunks = [chunk_with_score.chunk for chunk_with_score in chunks_with_scores]
-        # Provide a factory to reset the citation id counter
-        subsections = split_into_subsections(chunks, factory=CitationFactory())
-        context_text = create_prompt_context(subsections)
-
-        # Start timing system_prompt_2
+    async def _retrieve_async(self, question_for_retrieval: str) -> Sequence[ChunkWithScore]:
         start_time = time.perf_counter()
-        response = generate(
-            self.llm,
-            self.system_prompt_2,
-            question,
-            context_text,
-            chat_history,
-        )
-        system_prompt_2_duration = time.perf_counter() - start_time
-        logger.info(
-            f"System Prompt 2 (generate with context) took {system_prompt_2_duration:.2f} seconds"
+        chunks_with_scores = await retrieve_with_scores_async(
+            question_for_retrieval,
+            retrieval_k=self.retrieval_k,
+            retrieval_k_min_score=self.retrieval_k_min_score,
+            datasets=self.datasets,
         )
+        _log_duration("Vector retrieval", start_time)
+        return chunks_with_scores
 
-        return OnMessageResult(
-            response,
-            self.system_prompt_2,
-            attributes,
-            chunks_with_scores=chunks_with_scores,
-            subsections=subsections,
-        )
+    async def _retrieve_for_message_async(
+        self,
+        question: str,
+        attributes: MessageAttributes,
+        speculative_retrieval: Optional[_PendingRetrieval] = None,
+    ) -> Sequence[ChunkWithScore]:
+        question_for_retrieval = attributes.translated_message or question
+        if speculative_retrieval:
+            if normalize_query(question_for_retrieval) != normalize_query(
+                speculative_retrieval.query
+            ):
+                # The question was translated, so its context needs to be retrieved again
+                _cancel(speculative_retrieval)
+            else:
+                try:
+                    chunks_with_scores = await speculative_retrieval.task
+                    logger.info("Using context retrieved while analyzing the message")
+                    return chunks_with_scores
+                except Exception:
+                    logger.warning("Speculative retrieval failed; retrying", exc_info=True)
+
+        return await self._retrieve_async(question_for_retrieval)
 
     async def _build_streaming_response(
         self,
         question: str,
         attributes: MessageAttributes,
         chat_history: Optional[ChatHistory] = None,
+        speculative_retrieval: Optional[_PendingRetrieval] = None,
     ) -> tuple[AsyncGenerator[str, None], MessageAttributes, Sequence[Subsection]]:
         """Helper method to build a streaming response with or without context"""
-        subsections: Sequence[Subsection] = []
-
+        chunks_with_scores = None
         if attributes.needs_context:
-            # Get retrieval question
-            question_for_retrieval = attributes.translated_message or question
-
-            # Retrieve context - this is the same code used in _build_response_with_context
-            start_time = time.perf_counter()
-            chunks_with_scores = retrieve_with_scores(
-                question_for_retrieval,
-                retrieval_k=self.retrieval_k,
-                retrieval_k_min_score=self.retrieval_k_min_score,
-                datasets=self.datasets,
-            )
-            retrieval_duration = time.perf_counter() - start_time
-            logger.info(f"Vector retrieval took {retrieval_duration:.2f} seconds")
-
-            # Prepare context
-            chunks = [chunk_with_score.chunk for chunk_with_score in chunks_with_scores]
-            subsections = split_into_subsections(chunks, factory=CitationFactory())
-            context_text = create_prompt_context(subsections)
-
-            # Stream response with context
-            generator = generate_streaming_async(
-                self.llm,
-                self.system_prompt_2,
-                question,
-                context_text,
-                chat_history,
+            chunks_with_scores = await self._retrieve_for_message_async(
+                question, attributes, speculative_retrieval
             )
-            return generator, attributes, subsections
         else:
-            # Stream response without context
-            generator = generate_streaming_async(
-                self.llm,
-                self.system_prompt_2,
-                question,
-                None,
-                chat_history,
-            )
-            return generator, attributes, subsections
+            _cancel(speculative_retrieval)
+
+        subsections, context_text = _prompt_context(chunks_with_scores)
+        generator = generate_streaming_async(
+            self.llm, self.system_prompt_2, question, context_text, chat_history
+        )
+        return generator, attributes, subsections
+
+
+def _prompt_context(
+    chunks_with_scores: Optional[Sequence[ChunkWithScore]],
+) -> tuple[Sequence[Subsection], Optional[str]]:
+    "Returns the citable subsections of the chunks and the context for system_prompt_2"
+    if chunks_with_scores is None:
+        return [], None
+    chunks = [chunk_with_score.chunk for chunk_with_score in chunks_with_scores]
+    # Provide a factory to reset the citation id counter
+    subsections = split_into_subsections(chunks, factory=CitationFactory())
+    return subsections, create_prompt_context(subsections)
+
+
+def _log_duration(step: str, start_time: float) -> None:
+    logger.info(f"{step} took {time.perf_counter() - start_time:.2f} seconds")
+
+
+def _log_generate_duration(start_time: float, context_text: Optional[str]) -> None:
+    context = "with" if context_text is not None else "without"
+    _log_duration(f"System Prompt 2 (generate {context} context)", start_time)
+
+
+def _cached_result(cached: CachedAnswer) -> OnMessageResult:
+    return OnMessageResult(
+        cached.response,
+        cached.system_prompt,
+        cached.attributes,
+        chunks_with_scores=cached.chunks_with_scores,
+        subsections=cached.subsections,
+    )
+
+
+def _cached_answer(question: str, result: OnMessageResult) -> CachedAnswer:
+    return CachedAnswer(
+        question,
+        result.response,
+        result.system_prompt,
+        result.attributes,
+        result.subsections,
+        result.chunks_with_scores,
+    )
+
+
+async def _replay(response: str) -> AsyncGenerator[str, None]:
+    "Streams a cached response word by word, like an LLM would"
+    for chunk in re.findall(r"\s*\S+\s*|\s+", response):
+        yield chunk
 
 
 class CaEddWebEngine(BaseEngine):
@@ -315,6 +669,224 @@ class ImagineLA_MessageAttributes(MessageAttributes):
     alert_message: str
 
 
+# Fixed responses that system_prompt_1 tells the LLM to use for some messages. They're also used
+# by the intent router to respond to those messages without the LLM.
+_PASSWORD_RESET_RESPONSE = (
+    "If you forgot the password for your personal login, click "
+    "[Log In My Clients and Reports](https://benefitnavigator.web.app/casemanager/auth) "
+    "from the Navigator home page, then "
+    "[forgot password](https://benefitnavigator.web.app/casemanager/auth/forgot) "
+    "at the bottom of the text on the login page. "
+    "You should receive an email with a link to set a new password. Remember that it may take "
+    "a few minutes for the email to show up, or you may find the email in your Spam folder."
+)
+
+_SUPPORT_RESPONSE = (
+    "To get support with that issue, select 'Need help? Contact the support team' at the top of "
+    "this chatbot to open a ticket with the operations team. You can also email us at "
+    "[socialbenefithelp@imaginela.org](mailto:socialbenefithelp@imaginela.org)"
+)
+
+_REFERRAL_RESPONSE = (
+    "Here's a trusted link to learn more: [{title}]({link}). "
+    "I can give more detail about the benefit programs and tax credits in the "
+    "[Benefits Information Hub](https://benefitnavigator.web.app/contenthub)."
+)
+
+# Referral link title -> (referral link, example messages asking for it)
+_REFERRAL_LINKS = {
+    "Get an ID card": (
+        "https://www.dmv.ca.gov/portal/driver-licenses-identification-cards/identification-id-cards/",
+        ["How do I get an ID card?", "Where can I get a California ID?"],
+    ),
+    "Get a Passport": (
+        "https://travel.state.gov/content/travel/en/passports/need-passport/apply-in-person.html",
+        ["Where can I apply for a passport?", "How do I get a passport?"],
+    ),
+    "Request Birth Certificates": (
+        "https://www.cdph.ca.gov/Programs/CHSI/Pages/Vital-Records-Obtaining-Certified-Copies-of-Birth-Records.aspx",
+        [
+            "How do I request a birth certificate?",
+            "Where can I get a copy of my birth certificate?",
+        ],
+    ),
+    "Request a Social Security Number": (
+        "https://www.ssa.gov/number-card/request-number-first-time",
+        ["How do I get a Social Security number?", "How do I request a Social Security card?"],
+    ),
+    "Request an ITIN": (
+        "https://www.irs.gov/tin/itin/how-to-apply-for-an-itin",
+        ["How do I apply for an ITIN?", "Where can I get an ITIN?"],
+    ),
+    "Apply for Citizenship": (
+        "https://www.uscis.gov/citizenship/apply-for-citizenship",
+        ["How do I apply for citizenship?", "How do I become a US citizen?"],
+    ),
+    "Apply for a Green Card": (
+        "https://www.uscis.gov/green-card/how-to-apply-for-a-green-card",
+        ["How do I apply for a green card?", "Where do I apply for permanent residency?"],
+    ),
+    "Get Transit Cards (TAP cards)": (
+        "https://www.metro.net/riding/fares/life/",
+        ["How do I get a TAP card?", "Where can I get a reduced fare transit card?"],
+    ),
+    "Find DPSS contact info or office locations": (
+        "https://dpss.lacounty.gov/en/resources/offices.html",
+        ["Where is the nearest DPSS office?", "How do I contact DPSS?"],
+    ),
+    "Learn about DPSS appeals": (
+        "https://dpss.lacounty.gov/en/rights/ash/request-hearing.html",
+        ["How do I appeal a DPSS decision?", "How do I request a DPSS fair hearing?"],
+    ),
+    "Transportation for people with disabilities": (
+        "https://accessla.org/",
+        ["How do I get Access paratransit?", "How do I get a ride for a person with a disability?"],
+    ),
+    "Find Food Banks": (
+        "https://www.lafoodbank.org/find-food/pantry-locator/",
+        ["Where is the nearest food bank?", "How do I find a food pantry?"],
+    ),
+    "Get Wildfire Resources": (
+        "https://recovery.lacounty.gov/resources/",
+        ["Where can I find wildfire resources?", "How do I get help after the fires?"],
+    ),
+    "Start a Benefit Navigator screening": (
+        "https://benefitnavigator.web.app/start",
+        ["How do I start a Benefit Navigator screening?", "Where do I start a new screening?"],
+    ),
+    "Find Hospitals and Clinics": (
+        "https://dhs.lacounty.gov/find-a-clinic-or-hospital/",
+        ["How do I find a clinic near me?", "Where is the nearest county hospital?"],
+    ),
+    "Find LGBTQ Resources": (
+        "https://dpss.lacounty.gov/en/rights/rights/sogie.html",
+        ["Where can I find LGBTQ resources?"],
+    ),
+    "Learn about LIHEAP": (
+        "https://www.ladwp.com/residential-services/assistance-programs/low-income-home-energy-assistance-program-liheap",
+        ["How do I apply for LIHEAP?", "Where can I learn about LIHEAP?"],
+    ),
+    "Search Affordable and Accessible Housing": (
+        "https://lahousing.lacity.org/AAHR/ComCon/Tab/RenderTab?tabName=Search%20for%20Accessible%20Housing",
+        [
+            "How do I search for affordable housing?",
+            "Where can I find accessible housing listings?",
+        ],
+    ),
+    "Find LADWP contact info": (
+        "https://www.ladwp.com/account/customer-service/customer-service-centers",
+        ["How do I contact LADWP?", "What is the LADWP customer service number?"],
+    ),
+    "Find Legal Aid": (
+        "https://lafla.org/get-help/",
+        ["How do I find legal aid?", "Where can I get free legal help?"],
+    ),
+    "See Federal Poverty Levels": (
+        "https://aspe.hhs.gov/topics/poverty-economic-mobility/poverty-guidelines",
+        ["Where can I see the federal poverty levels?", "Where are the poverty guidelines?"],
+    ),
+    "Find Diapers": (
+        "https://www.phfewic.org/en/diaper-resources-in-la-county",
+        ["Where can I get free diapers?", "How do I find diaper resources?"],
+    ),
+}
+
+# Policy update topic -> (alert_message, example messages about it)
+_POLICY_ALERTS = {
+    "Medi-Cal for immigrants": (
+        "**Policy update**: Since January 1, 2024, everyone who lives in California can qualify for "
+        "full-scope Medi-Cal, regardless of immigration status. All other Medi-Cal eligibility "
+        "rules, including income limits, still apply. "
+        "[Read more](https://www.coveredca.com/learning-center/information-for-immigrants/).\n"
+        "The rest of this answer may be outdated.",
+        [
+            "Can undocumented immigrants get Medi-Cal?",
+            "Does immigration status affect Medi-Cal eligibility?",
+        ],
+    ),
+    "Medi-Cal asset limits": (
+        "**Policy update**: As of January 1, 2024, assets will no longer be counted to determine "
+        "Medi-Cal eligibility. "
+        "[Read more](https://www.dhcs.ca.gov/Get-Medi-Cal/Pages/asset-limits.aspx)\n"
+        "The rest of this answer may be outdated.",
+        ["What is the Medi-Cal asset limit?", "Do assets count for Medi-Cal eligibility?"],
+    ),
+    "CalFresh work requirements (ABAWDs, time limits)": (
+        "**Policy update**: California has a statewide waiver through October 31, 2025. "
+        "This means no ABAWDs living in California will have to meet the work requirement to keep "
+        "receiving CalFresh benefits. ABAWDs who have lost their CalFresh benefits may reapply and "
+        "continue to receive CalFresh if otherwise eligible. "
+        "[Read more](https://www.cdss.ca.gov/inforesources/calfresh/abawd)\n"
+        "The rest of this answer may be outdated.",
+        [
+            "What are the CalFresh work requirements for ABAWDs?",
+            "Is there a time limit on CalFresh for able-bodied adults?",
+        ],
+    ),
+    "Calfresh asset limits/resource limits": (
+        "**Policy update**: California has dramatically modified its rules for 'categorical "
+        "eligibility' in the CalFresh program, such that asset limits have all but been removed. "
+        "The only exceptions would be if either the household includes one or more members who "
+        "are aged or disabled, with household income over 200% of the Federal Poverty Level (FPL); "
+        "or the household fits within a narrow group of cases where it has been disqualified "
+        "because of an intentional program violation, or some other specific compliance "
+        "requirement; or there is a disputed claim for benefits paid in the past. "
+        "[Read more](https://calfresh.guide/how-many-resources-a-household-can-have/"
+        "#:~:text=In%20California%2C%20if%20the%20household,recipients%20have%20a%20resource%20limit)\n"
+        "The rest of this answer may be outdated.",
+        ["What is the CalFresh asset limit?", "What are the CalFresh resource limits?"],
+    ),
+}
+
+IMAGINE_LA_INTENTS = [
+    Intent(
+        "Password reset",
+        [
+            "How do I reset my password?",
+            "I forgot my password",
+            "I can't log in because I forgot my Benefit Navigator password",
+            "How do I change my password for the Navigator?",
+        ],
+        canned_response=_PASSWORD_RESET_RESPONSE,
+    ),
+    Intent(
+        "Support ticket",
+        [
+            "How do I change the phone number for two-factor authentication?",
+            "I can't create or save clients",
+            "I can't save my reports",
+            "I can't find my clients in the user portal",
+            "The Benefit Navigator isn't working, who do I contact?",
+        ],
+        canned_response=_SUPPORT_RESPONSE,
+    ),
+    *[
+        Intent(
+            f"Referral: {title}",
+            examples,
+            canned_response=_REFERRAL_RESPONSE.format(title=title, link=link),
+        )
+        for title, (link, examples) in _REFERRAL_LINKS.items()
+    ],
+    *[
+        Intent(f"Policy update: {topic}", examples, alert_message=alert_message)
+        for topic, (alert_message, examples) in _POLICY_ALERTS.items()
+    ],
+]
+
+
+def _quoted(text: str) -> str:
+    return '"' + text + '"'
+
+
+_REFERRAL_LINKS_LIST = "\n".join(
+    f"- [{title}]({link})" for title, (link, _) in _REFERRAL_LINKS.items()
+)
+_POLICY_ALERTS_LIST = "\n".join(
+    f"- {topic}: {_quoted(alert_message)}" for topic, (alert_message, _) in _POLICY_ALERTS.items()
+)
+
+
 class ImagineLaEngine(BaseEngine):
     retrieval_k: int = 25
     retrieval_k_min_score: float = -1
@@ -325,6 +897,19 @@ class ImagineLaEngine(BaseEngine):
 
     show_msg_attributes: bool = False
 
+    message_attributes = ImagineLA_MessageAttributes
+
+    # Most questions are in English, so the context retrieved while analyzing them can be used
+    speculative_retrieval: bool = True
+    # system_prompt_1 is long, so start on its results before the whole analysis has arrived
+    stream_message_analysis: bool = True
+
+    # Recognizes messages that get a fixed canned_response or alert_message so that they can be
+    # answered without analyze_message(). In shadow mode, messages are still analyzed by the LLM
+    # to measure the router's agreement with it; check intent_router.stats() before turning
+    # shadow mode off or lowering min_score.
+    intent_router: Optional[IntentRouter] = IntentRouter(IMAGINE_LA_INTENTS, min_score=0.9)
+
     user_settings = [
         "llm",
         "retrieval_k",
@@ -348,7 +933,7 @@ class ImagineLaEngine(BaseEngine):
         "SSA",
     ]
 
-    system_prompt_1 = """You're supporting users of the Benefit Navigator tool, which is an online one-stop shop \
+    system_prompt_1 = f"""You're supporting users of the Benefit Navigator tool, which is an online one-stop shop \
 case managers use when working with individuals and families to help them understand, access, and \
 navigate the complex public benefits and tax credit landscape in the Los Angeles region.
 
@@ -393,9 +978,7 @@ translated to the same language as the user's question. \
 Example prompts: "What do you know about?" "What info do you have?" "What can I ask you?" "What programs do you cover?" "What benefits do you cover?" "What topics do you know?"
 
 If the user's question is about how to reset their password for the Benefit Navigator, set canned_response to \
-"If you forgot the password for your personal login, click [Log In My Clients and Reports](https://benefitnavigator.web.app/casemanager/auth) \
-from the Navigator home page, then [forgot password](https://benefitnavigator.web.app/casemanager/auth/forgot) at the bottom of the text on the login page. \
-You should receive an email with a link to set a new password. Remember that it may take a few minutes for the email to show up, or you may find the email in your Spam folder."
+{_quoted(_PASSWORD_RESET_RESPONSE)}
 
 If the user's question is about these questions related to the benefit navigator:
 - Change phone number for two-factor authentication
@@ -403,7 +986,7 @@ If the user's question is about these questions related to the benefit navigator
 - Cannot create or save reports
 - Cannot find clients in user portal
 - Or other kinds of support questions for the Benefit Navigator tool
-then set canned_response to: "To get support with that issue, select 'Need help? Contact the support team' at the top of this chatbot to open a ticket with the operations team. You can also email us at [socialbenefithelp@imaginela.org](mailto:socialbenefithelp@imaginela.org)", \
+then set canned_response to: {_quoted(_SUPPORT_RESPONSE)}, \
 but translated to the same language as the user's question.
 
 For referral links below, only set canned_response to a referral link if:
@@ -412,33 +995,11 @@ For referral links below, only set canned_response to a referral link if:
 - Question does not appear to be about eligibility, benefits programs, or resources for specific populations
 
 If these criteria are met, then set canned_response to:
-"Here's a trusted link to learn more: [referral link title](referral link). \
-I can give more detail about the benefit programs and tax credits in the [Benefits Information Hub](https://benefitnavigator.web.app/contenthub).", \
+{_quoted(_REFERRAL_RESPONSE.format(title="referral link title", link="referral link"))}, \
 but translated to the same language as the user's question.
 
 Referral links: Format: [referral link title](referral link):
-- [Get an ID card](https://www.dmv.ca.gov/portal/driver-licenses-identification-cards/identification-id-cards/)
-- [Get a Passport](https://travel.state.gov/content/travel/en/passports/need-passport/apply-in-person.html)
-- [Request Birth Certificates](https://www.cdph.ca.gov/Programs/CHSI/Pages/Vital-Records-Obtaining-Certified-Copies-of-Birth-Records.aspx)
-- [Request a Social Security Number](https://www.ssa.gov/number-card/request-number-first-time)
-- [Request an ITIN](https://www.irs.gov/tin/itin/how-to-apply-for-an-itin)
-- [Apply for Citizenship](https://www.uscis.gov/citizenship/apply-for-citizenship)
-- [Apply for a Green Card](https://www.uscis.gov/green-card/how-to-apply-for-a-green-card)
-- [Get Transit Cards (TAP cards)](https://www.metro.net/riding/fares/life/)
-- [Find DPSS contact info or office locations](https://dpss.lacounty.gov/en/resources/offices.html)
-- [Learn about DPSS appeals](https://dpss.lacounty.gov/en/rights/ash/request-hearing.html)
-- [Transportation for people with disabilities](https://accessla.org/)
-- [Find Food Banks](https://www.lafoodbank.org/find-food/pantry-locator/)
-- [Get Wildfire Resources](https://recovery.lacounty.gov/resources/)
-- [Start a Benefit Navigator screening](https://benefitnavigator.web.app/start)
-- [Find Hospitals and Clinics](https://dhs.lacounty.gov/find-a-clinic-or-hospital/)
-- [Find LGBTQ Resources](https://dpss.lacounty.gov/en/rights/rights/sogie.html)
-- [Learn about LIHEAP](https://www.ladwp.com/residential-services/assistance-programs/low-income-home-energy-assistance-program-liheap)
-- [Search Affordable and Accessible Housing](https://lahousing.lacity.org/AAHR/ComCon/Tab/RenderTab?tabName=Search%20for%20Accessible%20Housing)
-- [Find LADWP contact info](https://www.ladwp.com/account/customer-service/customer-service-centers)
-- [Find Legal Aid](https://lafla.org/get-help/)
-- [See Federal Poverty Levels](https://aspe.hhs.gov/topics/poverty-economic-mobility/poverty-guidelines)
-- [Find Diapers](https://www.phfewic.org/en/diaper-resources-in-la-county)
+{_REFERRAL_LINKS_LIST}
 
 Examples to illustrate correct referral link decisions:
 - Question: "How do I get an ID card?" → Use referral link for "Get an ID card"
@@ -449,19 +1010,7 @@ Examples to illustrate correct referral link decisions:
 If the user's question is related to any of the following policy updates listed below, \
 set canned_response to empty string and set alert_message to a translation of one or more of the following text in the same language as the user's question:
 
-- Medi-Cal for immigrants: "**Policy update**: Since January 1, 2024, everyone who lives in California can qualify for full-scope Medi-Cal, regardless of immigration status. All other Medi-Cal eligibility rules, including income limits, still apply. [Read more](https://www.coveredca.com/learning-center/information-for-immigrants/).
-The rest of this answer may be outdated."
-- Medi-Cal asset limits: "**Policy update**: As of January 1, 2024, assets will no longer be counted to determine Medi-Cal eligibility. [Read more](https://www.dhcs.ca.gov/Get-Medi-Cal/Pages/asset-limits.aspx)
-The rest of this answer may be outdated."
-- CalFresh work requirements (ABAWDs, time limits): "**Policy update**: California has a statewide waiver through October 31, 2025. \
-This means no ABAWDs living in California will have to meet the work requirement to keep receiving CalFresh benefits. ABAWDs who have lost their CalFresh benefits may reapply and continue to receive CalFresh if otherwise eligible. [Read more](https://www.cdss.ca.gov/inforesources/calfresh/abawd)
-The rest of this answer may be outdated."
-- Calfresh asset limits/resource limits: "**Policy update**: California has dramatically modified its rules for 'categorical eligibility' in the CalFresh program, \
-such that asset limits have all but been removed. The only exceptions would be if either the household includes one or more members who are aged or disabled, \
-with household income over 200% of the Federal Poverty Level (FPL); or the household fits within a narrow group of cases where it has been disqualified \
-because of an intentional program violation, or some other specific compliance requirement; or there is a disputed claim for benefits paid in the past. \
-[Read more](https://calfresh.guide/how-many-resources-a-household-can-have/#:~:text=In%20California%2C%20if%20the%20household,recipients%20have%20a%20resource%20limit)
-The rest of this answer may be outdated."
+{_POLICY_ALERTS_LIST}
 
 Translate canned_response and alert_message strings to be in the same language as the user's question.
 If the user's question is to translate text, set needs_context to False.
@@ -521,43 +1070,44 @@ No, your client can't get Unemployment Insurance (UI) and State Disability Insur
 They need to choose the one that works best for their situation. If they're not sure which one to apply for, \
 they can apply for both, and the state will check if they qualify for either one. (citation-2) (citation-3)"""
 
-    def on_message(
-        self, question: str, chat_history: Optional[ChatHistory] = None
-    ) -> OnMessageResult:
-        # Keep timing code from BaseEngine for consistent profiling across all engines
-        # Start timing system_prompt_1
-        start_time = time.perf_counter()
-        attributes = analyze_message(
-            self.llm, self.system_prompt_1, question, response_format=ImagineLA_MessageAttributes
-        )
-        system_prompt_1_duration = time.perf_counter() - start_time
-        logger.info(
-            f"System Prompt 1 (analyze_message) took {system_prompt_1_duration:.2f} seconds"
-        )
+    def _analyze_message(
+        self, question: str, response_format: type[MessageAttributesT]
+    ) -> MessageAttributesT:
+        match = self._classify(question)
+        if match and self.intent_router and self.intent_router.should_route(match):
+            return _routed_attributes(match, response_format)
 
-        if attributes.canned_response:
-            return OnMessageResult(attributes.canned_response, self.system_prompt_1, attributes)
-
-        if attributes.needs_context:
-            return self._build_response_with_context(question, attributes, chat_history)
+        attributes = super()._analyze_message(question, response_format)
+        self._record_llm_result(match, attributes)
+        return attributes
 
-        return self._build_response(question, attributes, chat_history)
-
-    async def on_message_streaming(
+    async def _on_message_streaming(
         self, question: str, chat_history: Optional[ChatHistory] = None
     ) -> tuple[AsyncGenerator[str, None], ImagineLA_MessageAttributes, Sequence[Subsection]]:
-        # Start timing system_prompt_1
-        start_time = time.perf_counter()
-        attributes = analyze_message(
-            self.llm, self.system_prompt_1, question, response_format=ImagineLA_MessageAttributes
-        )
-        system_prompt_1_duration = time.perf_counter() - start_time
-        logger.info(
-            f"System Prompt 1 (analyze_message) took {system_prompt_1_duration:.2f} seconds"
+        routed_attributes, classification = await self._route_message_async(
+            question, ImagineLA_MessageAttributes
         )
+        if routed_attributes:
+            attributes, speculative_retrieval = routed_attributes, None
+        elif self.stream_message_analysis:
+            attributes, speculative_retrieval, canned_stream = await self._stream_message_analysis(
+                question, ImagineLA_MessageAttributes, stream_canned_response=True
+            )
+            if canned_stream:
+                recorded_stream = self._record_after_stream(
+                    canned_stream, classification, attributes
+                )
+                return recorded_stream, attributes, []
+            self._record_when_classified(classification, attributes)
+        else:
+            attributes, speculative_retrieval = await super()._analyze_message_async(
+                question, ImagineLA_MessageAttributes
+            )
+            self._record_when_classified(classification, attributes)
 
         # Handle canned responses - return the entire response at once with empty subsections
         if attributes.canned_response:
+            _cancel(speculative_retrieval)
 
             async def canned_generator() -> AsyncGenerator[str, None]:
                 yield attributes.canned_response
@@ -566,6 +1116,99 @@ they can apply for both, and the state will check if they qualify for either one
             return canned_generator(), attributes, empty_subsections
 
         generator, _, subsections = await self._build_streaming_response(
-            question, attributes, chat_history
+            question, attributes, chat_history, speculative_retrieval
         )
         return generator, attributes, subsections
+
+    async def _analyze_message_async(
+        self, question: str, response_format: type[MessageAttributesT]
+    ) -> tuple[MessageAttributesT, Optional[_PendingRetrieval]]:
+        routed_attributes, classification = await self._route_message_async(
+            question, response_format
+        )
+        if routed_attributes:
+            return routed_attributes, None
+
+        attributes, speculative_retrieval = await super()._analyze_message_async(
+            question, response_format
+        )
+        self._record_when_classified(classification, attributes)
+        return attributes, speculative_retrieval
+
+    async def _route_message_async(
+        self, question: str, response_format: type[MessageAttributesT]
+    ) -> tuple[Optional[MessageAttributesT], asyncio.Task[Optional[IntentMatch]]]:
+        """
+        Returns the attributes for the message's fixed response if the intent router routes it.
+        Otherwise, the message should be analyzed by the LLM and the returned classification
+        passed to _record_llm_result() along with the LLM's attributes.
+        In shadow mode, the message is classified while the LLM analyzes it.
+        """
+        classification = asyncio.create_task(asyncio.to_thread(self._classify, question))
+        if self.intent_router and not self.intent_router.shadow:
+            match = await classification
+            if match and self.intent_router.should_route(match):
+                return _routed_attributes(match, response_format), classification
+        return None, classification
+
+    def _classify(self, question: str) -> Optional[IntentMatch]:
+        if not self.intent_router:
+            return None
+        try:
+            return self.intent_router.classify(question)
+        except Exception:
+            # The message can still be analyzed by the LLM
+            logger.warning("Failed to classify the message's intent", exc_info=True)
+            return None
+
+    def _record_llm_result(
+        self, match: Optional[IntentMatch], attributes: MessageAttributes
+    ) -> None:
+        if not match or not self.intent_router:
+            return
+        assert isinstance(attributes, ImagineLA_MessageAttributes)
+        # Routed responses are in English, so they don't agree with responses to translated messages
+        llm_response = (
+            ""
+            if attributes.translated_message
+            else attributes.canned_response + attributes.alert_message
+        )
+        self.intent_router.record_llm_result(match, llm_response)
+
+    def _record_when_classified(
+        self, classification: asyncio.Task[Optional[IntentMatch]], attributes: MessageAttributes
+    ) -> None:
+        def record(task: asyncio.Task[Optional[IntentMatch]]) -> None:
+            if not task.cancelled():
+                self._record_llm_result(task.result(), attributes)
+
+        # Don't delay the response if the message is still being classified
+        classification.add_done_callback(record)
+
+    async def _record_after_stream(
+        self,
+        stream: AsyncGenerator[str, None],
+        classification: asyncio.Task[Optional[IntentMatch]],
+        attributes: MessageAttributes,
+    ) -> AsyncGenerator[str, None]:
+        async for chunk in stream:
+            yield chunk
+        # The attributes are complete once the canned response has been streamed
+        self._record_when_classified(classification, attributes)
+
+
+def _routed_attributes(
+    match: IntentMatch, response_format: type[MessageAttributesT]
+) -> MessageAttributesT:
+    logger.info("Responding to intent %r without analyze_message", match.intent.name)
+    return response_format.model_validate(
+        {
+            # An alert_message is shown with a response generated using context
+            "needs_context": True,
+            "users_language": "English",
+            "translated_message": "",
+            "benefit_program": "",
+            "canned_response": match.intent.canned_response,
+            "alert_message": match.intent.alert_message,
+        }
+    )
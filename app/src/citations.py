@@ -1,11 +1,11 @@
 import logging
 import re
 from itertools import count
-from typing import Callable, Match, NamedTuple, Optional, Sequence, Tuple
+from typing import Any, Callable, Match, NamedTuple, Optional, Sequence, Tuple
 
 from nutree import Node
 
-from src.db.models.document import Chunk, Subsection
+from src.db.models.document import Chunk, ChunkData, Subsection
 from src.ingestion.markdown_tree import create_markdown_tree, get_parent_headings_raw
 from src.util.string_utils import parse_heading_markdown
 
@@ -24,7 +24,7 @@ class CitationFactory:
 
     def create_citation(
         self,
-        chunk: Chunk,
+        chunk: Chunk | ChunkData,
         subsection_index: int,
         text: str,
         text_headings: Optional[Sequence[str]] = None,
@@ -33,7 +33,7 @@ class CitationFactory:
             logger.warning("Text not found in chunk: %r\n%r", text, chunk.content)
         return Subsection(self.next_id(), chunk, subsection_index, text, text_headings)
 
-    def _text_in_chunk(self, text: str, chunk: Chunk) -> bool:
+    def _text_in_chunk(self, text: str, chunk: Chunk | ChunkData) -> bool:
         # Check that text is in chunk.content, ignoring whitespace and dashes
         stripped_text = re.sub(r"\s+|-", "", text)
         stripped_chunk_text = re.sub(r"\s+|-", "", chunk.content)
@@ -44,8 +44,32 @@ citation_factory = CitationFactory()
 
 
 def default_chunk_splitter(
-    chunk: Chunk, factory: CitationFactory = citation_factory
+    chunk: Chunk | ChunkData, factory: CitationFactory = citation_factory
 ) -> list[Subsection]:
+    if chunk.subsections is not None:
+        # Use the subsections that were computed when the chunk was ingested
+        return [
+            Subsection(factory.next_id(), chunk, index, subsection["text"], subsection["headings"])
+            for index, subsection in enumerate(chunk.subsections)
+        ]
+
+    # Chunks ingested before subsections were stored need to be split now
+    return _split_chunk(chunk, factory)
+
+
+def compute_subsections(chunk: Chunk) -> list[dict[str, Any]]:
+    """
+    Splits the chunk into subsections for storing in chunk.subsections when it is ingested,
+    so that default_chunk_splitter() doesn't need to parse the chunk's markdown for every response.
+    Each subsection's subsection_index is its index in the returned list.
+    """
+    return [
+        {"text": subsection.text, "headings": list(subsection.text_headings)}
+        for subsection in _split_chunk(chunk, CitationFactory())
+    ]
+
+
+def _split_chunk(chunk: Chunk | ChunkData, factory: CitationFactory) -> list[Subsection]:
     try:
         return tree_based_chunk_splitter(chunk, factory)
     except RuntimeError as e:
@@ -57,7 +81,7 @@ def default_chunk_splitter(
 
 
 def basic_chunk_splitter(
-    chunk: Chunk, factory: CitationFactory = citation_factory
+    chunk: Chunk | ChunkData, factory: CitationFactory = citation_factory
 ) -> list[Subsection]:
     splits = [split for split in chunk.content.split("\n\n") if split]
     better_splits = []
@@ -79,7 +103,7 @@ def basic_chunk_splitter(
 
 
 def tree_based_chunk_splitter(
-    chunk: Chunk, factory: CitationFactory = citation_factory
+    chunk: Chunk | ChunkData, factory: CitationFactory = citation_factory
 ) -> list[Subsection]:
     tree = create_markdown_tree(chunk.content)
     subsections: list[Subsection] = []
@@ -90,7 +114,7 @@ def tree_based_chunk_splitter(
 def _split_section(
     subsections: list[Subsection],
     hs_node: Node,
-    chunk: Chunk,
+    chunk: Chunk | ChunkData,
     factory: CitationFactory = citation_factory,
 ) -> None:
     base_headings = chunk.headings or []
@@ -128,7 +152,7 @@ def _split_section(
 
 
 def split_into_subsections(
-    chunks: Sequence[Chunk],
+    chunks: Sequence[Chunk | ChunkData],
     chunk_splitter: Callable = default_chunk_splitter,
     factory: CitationFactory = citation_factory,
 ) -> Sequence[Subsection]:
@@ -1,10 +1,10 @@
 """Bulk database operations for performance.
 
-Provides a bulk_upsert function for use with
+Provides bulk_insert and bulk_upsert functions for use with
 Postgres and the psycopg library.
 """
 
-from typing import Any, Sequence
+from typing import Any, Iterable, Sequence
 
 import psycopg
 from psycopg import rows, sql
@@ -53,6 +53,27 @@ def bulk_upsert(
     )
 
 
+def bulk_insert(
+    cur: psycopg.Cursor,
+    table: str,
+    attributes: Sequence[str],
+    objects: Iterable[Any],
+    types: Sequence[str] | None = None,
+) -> None:
+    """Bulk insert a sequence of objects directly into a table.
+
+    Args:
+      cur: the Cursor object from the pyscopg library
+      table: the name of the table to insert into
+      attributes: a sequence of attribute names to copy from each object
+      objects: objects to insert
+      types: optional Postgres type names of the attributes; if provided,
+        the data is copied in binary format, which is faster for large
+        values such as pgvector embeddings
+    """
+    _bulk_insert(cur, table=table, columns=attributes, objects=objects, types=types)
+
+
 def _create_temp_table(cur: psycopg.Cursor, temp_table: str, src_table: str) -> None:
     """
     Create table that lives only for the current transaction.
@@ -78,23 +99,28 @@ def _bulk_insert(
     cur: psycopg.Cursor,
     table: str,
     columns: Sequence[str],
-    objects: Sequence[Any],
+    objects: Iterable[Any],
+    types: Sequence[str] | None = None,
 ) -> None:
     """
-    Write data from a sequence of objects to a temp table.
+    Write data from a sequence of objects to a table.
     This function uses the PostgreSQL COPY command which is highly performant.
     Args:
       cur: the Cursor object from the pyscopg library
-      table: the name of the temporary table
+      table: the name of the table
       columns: a sequence of column names that are attributes of each object
       objects: a sequence of objects with attributes defined by columns
+      types: optional Postgres type names of the columns for copying in binary format
     """
     columns_sql = sql.SQL(",").join(map(sql.Identifier, columns))
-    query = sql.SQL("COPY {table}({columns}) FROM STDIN").format(
+    query = sql.SQL("COPY {table}({columns}) FROM STDIN {options}").format(
         table=sql.Identifier(table),
         columns=columns_sql,
+        options=sql.SQL("(FORMAT BINARY)" if types else ""),
     )
     with cur.copy(query) as copy:
+        if types:
+            copy.set_types(types)
         for obj in objects:
             values = [getattr(obj, column) for column in columns]
             copy.write_row(values)
@@ -149,4 +175,4 @@ def _write_from_table_to_table(
     cur.execute(query)
 
 
-__all__ = ["bulk_upsert"]
+__all__ = ["bulk_insert", "bulk_upsert"]
@@ -0,0 +1,42 @@
+"""Add content_hash to document and chunk
+
+Revision ID: 9e3f5a1b7c24
+Revises: 4c1d2e8f9a07
+Create Date: 2026-10-17 14:05:12.604117
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9e3f5a1b7c24"
+down_revision = "4c1d2e8f9a07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "document",
+        sa.Column(
+            "content_hash",
+            sa.Text(),
+            nullable=True,
+            comment="Hash of the name and content, used to detect changes when re-ingesting",
+        ),
+    )
+    op.add_column(
+        "chunk",
+        sa.Column(
+            "content_hash",
+            sa.Text(),
+            nullable=True,
+            comment="Hash of the text used for the embedding, used to reuse embeddings when re-ingesting",
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("chunk", "content_hash")
+    op.drop_column("document", "content_hash")
@@ -0,0 +1,34 @@
+"""Add HNSW index on chunk embedding
+
+Revision ID: 4c1d2e8f9a07
+Revises: 86bc6d1f2e5a
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4c1d2e8f9a07"
+down_revision = "86bc6d1f2e5a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # vector_ip_ops matches the max_inner_product ordering used for retrieval.
+    # pgvector's default m and ef_construction, like the model. Other values are applied by
+    # src.util.rebuild_hnsw_indexes so that this revision always creates the same schema.
+    op.create_index(
+        "chunk_mpnet_embedding_idx",
+        "chunk",
+        ["mpnet_embedding"],
+        unique=False,
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+        postgresql_ops={"mpnet_embedding": "vector_ip_ops"},
+    )
+
+
+def downgrade():
+    op.drop_index("chunk_mpnet_embedding_idx", table_name="chunk")
@@ -0,0 +1,54 @@
+"""Add HNSW indexes on quantized chunk embeddings
+
+Revision ID: 7d2a9c4e1b36
+Revises: 5b8e2d0c6f13
+Create Date: 2026-10-17 21:03:15.482731
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from src.db.models.document import QUANTIZED_EMBEDDING_INDEXES
+
+# revision identifiers, used by Alembic.
+revision = "7d2a9c4e1b36"
+down_revision = "5b8e2d0c6f13"
+branch_labels = None
+depends_on = None
+
+
+def _check_pgvector_version() -> None:
+    version = (
+        op.get_bind()
+        .execute(sa.text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))
+        .scalar()
+    )
+    # Skipping the indexes would record this revision as applied without them, so that retrieval
+    # with app_config.retrieval_quantization would silently scan every chunk
+    if not version or tuple(int(part) for part in version.split(".")[:2]) < (0, 7):
+        raise RuntimeError(
+            f"Indexes on quantized chunk embeddings require pgvector 0.7+, not {version}. "
+            "Update pgvector and run `ALTER EXTENSION vector UPDATE`, then re-run the migrations."
+        )
+
+
+def upgrade():
+    _check_pgvector_version()
+
+    # The indexes store the quantized embeddings, so the chunk table doesn't need extra columns.
+    # Their expressions use the same dimension as the retrieval query so that it uses them.
+    for name, expression in QUANTIZED_EMBEDDING_INDEXES.items():
+        op.create_index(
+            name,
+            "chunk",
+            [sa.text(expression)],
+            unique=False,
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+        )
+
+
+def downgrade():
+    for name in reversed(QUANTIZED_EMBEDDING_INDEXES):
+        op.drop_index(name, table_name="chunk", if_exists=True)
@@ -0,0 +1,33 @@
+"""Add subsections to chunk
+
+Revision ID: 5b8e2d0c6f13
+Revises: 9e3f5a1b7c24
+Create Date: 2026-10-17 16:42:37.218504
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "5b8e2d0c6f13"
+down_revision = "9e3f5a1b7c24"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "chunk",
+        sa.Column(
+            "subsections",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="Text and headings of the subsections used as citations, computed when ingesting",
+        ),
+    )
+
+
+def downgrade():
+    op.drop_column("chunk", "subsections")
@@ -1,16 +1,35 @@
 import logging
-from typing import NamedTuple, Optional, Sequence
+from typing import Any, NamedTuple, Optional, Sequence
 from uuid import UUID
 
 import numpy as np
 from pgvector.sqlalchemy import Vector
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.db.models.base import Base, IdMixin, TimestampMixin
 
 logger = logging.getLogger(__name__)
 
+# Number of dimensions of Chunk.mpnet_embedding, which app_config.embedding_dimension must match
+# (see AppConfig.check_embedding_dimension()). Changing it requires a migration that alters the
+# column and re-creates its indexes, and re-embedding every chunk by re-ingesting the datasets.
+EMBEDDING_DIMENSION = 768
+
+# Expression indexes on the quantized embeddings, used when app_config.retrieval_quantization is set
+# and named after it (see AppConfig.check_quantized_embedding_index()). They're created by a
+# migration since they require pgvector 0.7+. The expressions must match the ones in
+# src.retrieve._quantized_top_chunks(), or retrieval scans every chunk instead.
+QUANTIZED_EMBEDDING_INDEXES = {
+    "chunk_mpnet_embedding_halfvec_idx": (
+        f"(mpnet_embedding::halfvec({EMBEDDING_DIMENSION})) halfvec_ip_ops"
+    ),
+    "chunk_mpnet_embedding_binary_idx": (
+        f"(binary_quantize(mpnet_embedding)::bit({EMBEDDING_DIMENSION})) bit_hamming_ops"
+    ),
+}
+
 
 class Document(Base, IdMixin, TimestampMixin):
     __tablename__ = "document"
@@ -29,14 +48,32 @@ class Document(Base, IdMixin, TimestampMixin):
     program: Mapped[str] = mapped_column(comment="benefit program")
     region: Mapped[str] = mapped_column(comment="geographical region of the benefit program")
 
+    content_hash: Mapped[str | None] = mapped_column(
+        comment="Hash of the name and content, used to detect changes when re-ingesting"
+    )
+
 
 class Chunk(Base, IdMixin, TimestampMixin):
     __tablename__ = "chunk"
+    __table_args__ = (
+        # Approximate nearest neighbor index for retrieval, which orders by max_inner_product.
+        # Built with pgvector's default m and ef_construction, which must match the migration;
+        # src.util.rebuild_hnsw_indexes applies app_config.hnsw_m and hnsw_ef_construction.
+        # ef_search is set for each retrieval query -- see app_config.hnsw_ef_search
+        Index(
+            "chunk_mpnet_embedding_idx",
+            "mpnet_embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"mpnet_embedding": "vector_ip_ops"},
+        ),
+        # See QUANTIZED_EMBEDDING_INDEXES for the indexes on the quantized embeddings
+    )
 
     content: Mapped[str] = mapped_column(comment="Content of the chunk")
     tokens: Mapped[int | None] = mapped_column(comment="Number of tokens in the content")
     mpnet_embedding: Mapped[np.ndarray] = mapped_column(
-        Vector(768), comment="MPNet embedding of the content"
+        Vector(EMBEDDING_DIMENSION), comment="MPNet embedding of the content"
     )
 
     document_id: Mapped[UUID] = mapped_column(ForeignKey("document.id", ondelete="CASCADE"))
@@ -54,6 +91,13 @@ class Chunk(Base, IdMixin, TimestampMixin):
     split_index: Mapped[int] = mapped_column(
         default=0, comment="Index of this chunk within splits (0-based)"
     )
+    content_hash: Mapped[str | None] = mapped_column(
+        comment="Hash of the text used for the embedding, used to reuse embeddings when re-ingesting"
+    )
+    subsections: Mapped[list[dict[str, Any]] | None] = mapped_column(
+        JSONB,
+        comment="Text and headings of the subsections used as citations, computed when ingesting",
+    )
 
     def to_json(self) -> dict[str, str | int | list[str]]:
         as_json: dict[str, str | int | list[str]] = {
@@ -69,8 +113,99 @@ class Chunk(Base, IdMixin, TimestampMixin):
         return as_json
 
 
+class DocumentData:
+    """
+    Copy of a Document's metadata, without its content, as returned by retrieval.
+    Unlike a Document, it isn't attached to a DB session, so it can be cached and shared
+    across threads. It should not be modified.
+    """
+
+    __slots__ = ("id", "name", "source", "dataset", "program", "region")
+
+    def __init__(
+        self,
+        id: UUID,
+        name: str,
+        source: str | None,
+        dataset: str,
+        program: str,
+        region: str,
+    ) -> None:
+        self.id = id
+        self.name = name
+        self.source = source
+        self.dataset = dataset
+        self.program = program
+        self.region = region
+
+    # Compare by id like Documents loaded in the same DB session, e.g., to group chunks by document
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, DocumentData) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f"DocumentData(id={self.id!r}, name={self.name!r})"
+
+
+class ChunkData:
+    """
+    Copy of a Chunk's columns, without its embedding, as returned by retrieval.
+    Like DocumentData, it can be cached and shared across threads and should not be modified.
+    """
+
+    __slots__ = (
+        "id",
+        "document_id",
+        "document",
+        "content",
+        "tokens",
+        "page_number",
+        "headings",
+        "num_splits",
+        "split_index",
+        "content_hash",
+        "subsections",
+    )
+
+    def __init__(
+        self,
+        id: UUID,
+        document: DocumentData,
+        content: str,
+        tokens: int | None,
+        page_number: int | None,
+        headings: list[str] | None,
+        num_splits: int,
+        split_index: int,
+        content_hash: str | None,
+        subsections: list[dict[str, Any]] | None,
+    ) -> None:
+        self.id = id
+        self.document_id = document.id
+        self.document = document
+        self.content = content
+        self.tokens = tokens
+        self.page_number = page_number
+        self.headings = headings
+        self.num_splits = num_splits
+        self.split_index = split_index
+        self.content_hash = content_hash
+        self.subsections = subsections
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ChunkData) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self) -> str:
+        return f"ChunkData(id={self.id!r}, document={self.document!r})"
+
+
 class ChunkWithScore(NamedTuple):
-    chunk: Chunk
+    chunk: Chunk | ChunkData
     score: float
 
 
@@ -85,7 +220,7 @@ class Subsection:
     def __init__(
         self,
         id: str,
-        chunk: Chunk,
+        chunk: Chunk | ChunkData,
         subsection_index: int,
         text: str,
         text_headings: Optional[Sequence[str]] = None,
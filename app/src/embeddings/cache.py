@@ -0,0 +1,187 @@
+import atexit
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Sequence
+
+from src.embeddings.model import EmbeddingModel
+from src.embeddings.token_counter import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalizes text used as a cache key so that queries that differ only in
+    surrounding or repeated whitespace share a cache entry.
+    """
+    return " ".join(text.split())
+
+
+class CachedEmbeddingModel(EmbeddingModel):
+    """
+    Implementation of EmbeddingModel that wraps another EmbeddingModel and caches
+    the embeddings of single-string inputs (i.e., queries) in a bounded LRU cache.
+
+    Lists of texts (e.g., chunks during ingestion) are passed through to the wrapped model
+    since they are rarely repeated.
+    """
+
+    def __init__(
+        self,
+        model: EmbeddingModel,
+        model_name: str,
+        max_size: int = 1024,
+        cache_path: str | None = None,
+    ):
+        """
+        Initialize the cache around an embedding model.
+
+        Args:
+            model: The EmbeddingModel to cache
+            model_name: Name of the wrapped model, which is included in cache keys so that
+                        a persisted cache is not reused with a different model
+            max_size: Maximum number of embeddings to keep; least recently used ones are evicted
+            cache_path: Optional file to load the cache from and save it to on exit
+        """
+        self._model = model
+        self._model_name = model_name
+        self._max_size = max_size
+        self._cache_path = cache_path
+        self._cache: OrderedDict[tuple[str, str], Any] = OrderedDict()
+        # encode() may be called from multiple threads, e.g., via run_in_executor()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if cache_path:
+            self._load()
+            atexit.register(self.save)
+
+    @property
+    def max_seq_length(self) -> int:
+        """
+        Returns the maximum sequence length supported by the wrapped model.
+        """
+        return self._model.max_seq_length
+
+    @property
+    def batch_size(self) -> int:
+        """
+        Returns the number of texts to encode per call for the wrapped model.
+        """
+        return self._model.batch_size
+
+    @property
+    def token_counter(self) -> TokenCounter:
+        """
+        Returns the wrapped model's TokenCounter so that token counts are shared with it.
+        """
+        return self._model.token_counter
+
+    def token_length(self, text: str) -> int:
+        """
+        Returns the number of tokens of the input text using the wrapped model.
+        """
+        return self._model.token_length(text)
+
+    def token_lengths(self, texts: Sequence[str]) -> list[int]:
+        """
+        Returns the number of tokens of each of the input texts using the wrapped model.
+        """
+        return self._model.token_lengths(texts)
+
+    def encode(
+        self, texts: str | list[str], show_progress_bar: bool = False
+    ) -> list[float] | list[list[float]]:
+        """
+        Encodes text(s) into embedding vector(s), returning the cached embedding for a
+        previously encoded string.
+
+        Args:
+            texts: Text string or sequence of text strings to encode
+            show_progress_bar: Whether to show a progress bar when encoding multiple texts
+
+        Returns:
+            A single embedding vector (if texts is a string) or
+            a list of embedding vectors (if texts is a sequence of strings)
+        """
+        if not isinstance(texts, str):
+            return self._model.encode(texts, show_progress_bar=show_progress_bar)
+
+        key = (self._model_name, normalize_query(texts))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        # Encode outside of the lock so that other threads aren't blocked by a slow model or API;
+        # concurrent misses for the same text may both encode it, which is harmless
+        embedding = self._model.encode(key[1], show_progress_bar=show_progress_bar)
+
+        with self._lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+        return embedding
+
+    def cache_info(self) -> dict[str, int]:
+        """
+        Returns the cache's hit and miss counts and current size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "max_size": self._max_size,
+            }
+
+    def clear(self) -> None:
+        """
+        Removes all cached embeddings and resets the counters.
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self) -> None:
+        """
+        Saves the cached embeddings to cache_path, if one was provided.
+        """
+        if not self._cache_path:
+            return
+
+        with self._lock:
+            entries = list(self._cache.items())
+
+        # Write to a temporary file first so that a partially written cache is never loaded
+        tmp_path = f"{self._cache_path}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(entries, file)
+        os.replace(tmp_path, self._cache_path)
+        logger.info("Saved %d query embeddings to %s", len(entries), self._cache_path)
+
+    def _load(self) -> None:
+        assert self._cache_path
+        if not os.path.exists(self._cache_path):
+            return
+
+        try:
+            with open(self._cache_path, "rb") as file:
+                entries = pickle.load(file)  # nosec
+        except Exception as e:
+            logger.warning("Ignoring unreadable embedding cache %s: %s", self._cache_path, e)
+            return
+
+        # Entries for other models are dropped, e.g., if EMBEDDING_MODEL_NAME changed
+        for key, embedding in entries[-self._max_size :]:
+            if key[0] == self._model_name:
+                self._cache[key] = embedding
+        logger.info("Loaded %d query embeddings from %s", len(self._cache), self._cache_path)
@@ -1,9 +1,10 @@
 import time
 from enum import Enum
+from typing import Any
 
 import cohere
 
-from src.embeddings.model import EmbeddingModel
+from src.embeddings.model import EmbeddingModel, truncate_embeddings
 
 COHERE_EMBEDDING_MODELS = [
     "embed-v4.0",
@@ -12,6 +13,12 @@ COHERE_EMBEDDING_MODELS = [
 MAX_RETRY_COUNT = 3
 MAX_RETRY_DELAY_SECONDS = 0.5
 
+# The embed API accepts at most 96 texts per call
+MAX_TEXTS_PER_CALL = 96
+
+# Numbers of dimensions that embed-v4.0 can return, using the API's output_dimension parameter
+OUTPUT_DIMENSIONS = [256, 512, 1024, 1536]
+
 
 class CohereInputType(Enum):
     SEARCH_DOCUMENT = "search_document"
@@ -23,16 +30,28 @@ class CohereEmbedding(EmbeddingModel):
     Implementation of EmbeddingModel that uses Cohere's embedding models.
     """
 
-    def __init__(self, model_name: str = "embed-v4.0"):
+    def __init__(self, model_name: str = "embed-v4.0", dimensions: int | None = None):
         """
         Initialize with Cohere client and model name.
 
         Args:
             model_name: Name of the Cohere embedding model to use
                        (e.g., 'embed-english-v3.0')
+            dimensions: Number of dimensions of the embeddings; defaults to the model's default.
+                        Other sizes than OUTPUT_DIMENSIONS are truncated from the next larger one.
         """
         self._model_name = model_name
         self._client = cohere.ClientV2()
+        self._dimensions = dimensions
+        self._output_dimension = None
+        if dimensions is not None:
+            self._output_dimension = next(
+                (size for size in OUTPUT_DIMENSIONS if size >= dimensions), None
+            )
+            if self._output_dimension is None:
+                raise ValueError(
+                    f"{model_name} embeddings have at most {OUTPUT_DIMENSIONS[-1]} dimensions"
+                )
 
         # embed-v4.0 supports up to 128,000 tokens
         self._max_seq_length = 128_000
@@ -44,6 +63,13 @@ class CohereEmbedding(EmbeddingModel):
         """
         return self._max_seq_length
 
+    @property
+    def batch_size(self) -> int:
+        """
+        Returns the number of texts to encode per call when encoding many texts.
+        """
+        return MAX_TEXTS_PER_CALL
+
     def token_length(self, text: str) -> int:
         """
         Returns the number of tokens of the tokenized text.
@@ -76,6 +102,9 @@ class CohereEmbedding(EmbeddingModel):
         input_texts = [texts] if single_input else list(texts)
 
         # The Cohere API is particularly flakey and will frequently return 500 errors
+        options: dict[str, Any] = {}
+        if self._output_dimension:
+            options["output_dimension"] = self._output_dimension
         retry_count = 0
         while retry_count < MAX_RETRY_COUNT:
             try:
@@ -84,6 +113,7 @@ class CohereEmbedding(EmbeddingModel):
                     model=self._model_name,
                     input_type=input_type.value,
                     embedding_types=["float"],
+                    **options,
                 )
                 break
             except Exception as e:
@@ -93,6 +123,9 @@ class CohereEmbedding(EmbeddingModel):
                 time.sleep(MAX_RETRY_DELAY_SECONDS)
 
         embeddings = response.embeddings.float_
+        if self._dimensions and self._dimensions != self._output_dimension:
+            # embed-v4.0 is trained so that its embeddings can be truncated
+            embeddings = truncate_embeddings(embeddings, self._dimensions)
 
         # Return single embedding if input was a single string
         return embeddings[0] if single_input else embeddings  # type: ignore
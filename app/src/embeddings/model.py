@@ -1,4 +1,21 @@
 from abc import ABC, abstractmethod
+from functools import cached_property
+from typing import Any, Sequence
+
+import numpy as np
+
+from src.embeddings.token_counter import TokenCounter
+
+
+def truncate_embeddings(embeddings: Sequence[Sequence[float]] | Any, dimensions: int) -> Any:
+    """
+    Shortens embeddings from a Matryoshka-trained model, whose leading dimensions carry the most
+    information, to their first `dimensions` dimensions. The shortened embeddings are re-normalized
+    so that their inner products are still cosine similarities.
+    """
+    array = np.asarray(embeddings, dtype=np.float32)[:, :dimensions]
+    norms = np.linalg.norm(array, axis=1, keepdims=True)
+    return (array / np.maximum(norms, 1e-12)).tolist()
 
 
 class EmbeddingModel(ABC):
@@ -17,6 +34,13 @@ class EmbeddingModel(ABC):
         """
         pass
 
+    @property
+    def batch_size(self) -> int:
+        """
+        Returns the number of texts to encode per call when encoding many texts (e.g., chunks).
+        """
+        return 64
+
     @abstractmethod
     def token_length(self, text: str) -> int:
         """
@@ -24,6 +48,21 @@ class EmbeddingModel(ABC):
         """
         pass
 
+    def token_lengths(self, texts: Sequence[str]) -> list[int]:
+        """
+        Returns the number of tokens of each of the input texts.
+        Override this if the tokenizer can tokenize a batch of texts faster.
+        """
+        return [self.token_length(text) for text in texts]
+
+    @cached_property
+    def token_counter(self) -> TokenCounter:
+        """
+        Returns a TokenCounter that memoizes the token counts from token_lengths().
+        Use this instead of token_length() when the same texts may be counted repeatedly.
+        """
+        return TokenCounter(self.token_lengths)
+
     @abstractmethod
     def encode(
         self, texts: str | list[str], show_progress_bar: bool = False
@@ -1,5 +1,7 @@
+from typing import Sequence
+
 import tiktoken
-from openai import OpenAI
+from openai import NOT_GIVEN, OpenAI
 
 from src.embeddings.model import EmbeddingModel
 
@@ -9,21 +11,42 @@ OPENAI_EMBEDDING_MODELS = [
     "text-embedding-ada-002",
 ]
 
+# Number of dimensions of each model's embeddings
+_FULL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Models that can return shorter embeddings, using the API's dimensions parameter
+_SHORTENABLE_MODELS = ["text-embedding-3-small", "text-embedding-3-large"]
+
 
 class OpenAIEmbedding(EmbeddingModel):
     """
     Implementation of EmbeddingModel that uses OpenAI's embedding models.
     """
 
-    def __init__(self, model_name: str = "text-embedding-3-small"):
+    def __init__(self, model_name: str = "text-embedding-3-small", dimensions: int | None = None):
         """
         Initialize with OpenAI client and model name.
 
         Args:
             model_name: Name of the OpenAI embedding model to use
                        (e.g., 'text-embedding-3-small')
+            dimensions: Number of dimensions of the embeddings, if fewer than the model's;
+                        only supported by the text-embedding-3 models
         """
         self._model_name = model_name
+        full_dimensions = _FULL_DIMENSIONS.get(model_name)
+        self._dimensions = None if dimensions == full_dimensions else dimensions
+        if self._dimensions is not None:
+            if model_name not in _SHORTENABLE_MODELS:
+                raise ValueError(f"{model_name} can't return {dimensions}-dimensional embeddings")
+            if full_dimensions and self._dimensions > full_dimensions:
+                raise ValueError(
+                    f"{model_name} embeddings have at most {full_dimensions} dimensions"
+                )
         self._client = OpenAI()
         self._tokenizer = tiktoken.get_encoding(
             "cl100k_base"
@@ -37,12 +60,26 @@ class OpenAIEmbedding(EmbeddingModel):
         # The models listed in OPENAI_EMBEDDING_MODELS all have this maximum.
         return 8191
 
+    @property
+    def batch_size(self) -> int:
+        """
+        Returns the number of texts to encode per call when encoding many texts.
+        """
+        # Well below the API's limit of 2048 inputs and 300,000 tokens per request
+        return 256
+
     def token_length(self, text: str) -> int:
         """
         Returns the number of tokens of the tokenized text.
         """
         return len(self._tokenizer.encode(text))
 
+    def token_lengths(self, texts: Sequence[str]) -> list[int]:
+        """
+        Returns the number of tokens of each of the tokenized texts, which are tokenized in parallel.
+        """
+        return [len(tokens) for tokens in self._tokenizer.encode_batch(list(texts))]
+
     def encode(
         self, texts: str | list[str], show_progress_bar: bool = False
     ) -> list[float] | list[list[float]]:
@@ -62,7 +99,12 @@ class OpenAIEmbedding(EmbeddingModel):
         single_input = isinstance(texts, str)
         input_texts = [texts] if single_input else list(texts)
 
-        response = self._client.embeddings.create(model=self._model_name, input=input_texts)  # type: ignore
+        response = self._client.embeddings.create(
+            model=self._model_name,
+            input=input_texts,  # type: ignore
+            # The API shortens and re-normalizes the embeddings
+            dimensions=self._dimensions or NOT_GIVEN,
+        )
 
         embeddings = [data.embedding for data in response.data]
 
@@ -1,6 +1,8 @@
+from typing import Literal, Sequence
+
 from sentence_transformers import SentenceTransformer
 
-from src.embeddings.model import EmbeddingModel
+from src.embeddings.model import EmbeddingModel, truncate_embeddings
 
 
 class SentenceTransformerEmbedding(EmbeddingModel):
@@ -8,15 +10,41 @@ class SentenceTransformerEmbedding(EmbeddingModel):
     Implementation of EmbeddingModel that uses SentenceTransformer models.
     """
 
-    def __init__(self, model_name: str):
+    def __init__(
+        self,
+        model_name: str,
+        dimensions: int | None = None,
+        backend: Literal["torch", "onnx"] = "torch",
+        onnx_file_name: str | None = None,
+    ):
         """
         Initialize with a SentenceTransformer model name.
 
         Args:
             model_name: Name of the SentenceTransformer model to use
                         (e.g., '/app/models/multi-qa-mpnet-base-cos-v1')
+            dimensions: Number of dimensions of the embeddings, if fewer than the model's;
+                        only use this with Matryoshka-trained models
+            backend: "onnx" runs the model with ONNX Runtime, which is faster on CPU than PyTorch;
+                     it requires sentence-transformers 3.2+ and the optimum and onnxruntime
+                     packages
+            onnx_file_name: ONNX file to load, relative to the model's directory
+                            (e.g., 'onnx/model_qint8_avx512_vnni.onnx' created by
+                            export_quantized_onnx_model()); defaults to 'onnx/model.onnx',
+                            which is exported from the PyTorch model if it doesn't exist
         """
-        self._model = SentenceTransformer(model_name)
+        # The backend and model_kwargs arguments require sentence-transformers 3.2+,
+        # so they're only passed when needed
+        kwargs: dict = {}
+        if backend != "torch":
+            kwargs["backend"] = backend
+            if onnx_file_name:
+                kwargs["model_kwargs"] = {"file_name": onnx_file_name}
+        self._model = SentenceTransformer(model_name, **kwargs)
+        full_dimensions = self._model.get_sentence_embedding_dimension()
+        if dimensions and full_dimensions and dimensions > full_dimensions:
+            raise ValueError(f"{model_name} embeddings have {full_dimensions} dimensions")
+        self._dimensions = None if dimensions == full_dimensions else dimensions
 
     @property
     def max_seq_length(self) -> int:
@@ -25,6 +53,14 @@ class SentenceTransformerEmbedding(EmbeddingModel):
         """
         return self._model.max_seq_length
 
+    @property
+    def batch_size(self) -> int:
+        """
+        Returns the number of texts to encode per call when encoding many texts.
+        """
+        # The model encodes in mini-batches of 32 internally; larger calls amortize the overhead
+        return 256
+
     def token_length(self, text: str) -> int:
         """
         Returns the number of tokens of the input text.
@@ -38,6 +74,15 @@ class SentenceTransformerEmbedding(EmbeddingModel):
         """
         return len(self._model.tokenizer.tokenize(text, add_special_tokens=True))
 
+    def token_lengths(self, texts: Sequence[str]) -> list[int]:
+        """
+        Returns the number of tokens of each of the input texts, which are tokenized as a batch.
+        """
+        # verbose=False suppresses warnings about texts longer than max_seq_length,
+        # which token_length() doesn't warn about either
+        encodings = self._model.tokenizer(list(texts), add_special_tokens=True, verbose=False)
+        return [len(input_ids) for input_ids in encodings["input_ids"]]
+
     def encode(
         self, texts: str | list[str], show_progress_bar: bool = False
     ) -> list[float] | list[list[float]]:
@@ -52,4 +97,28 @@ class SentenceTransformerEmbedding(EmbeddingModel):
             A single embedding vector (if texts is a string) or
             a list of embedding vectors (if texts is a sequence of strings)
         """
-        return self._model.encode(texts, show_progress_bar=show_progress_bar)  # type: ignore
+        embeddings = self._model.encode(texts, show_progress_bar=show_progress_bar)
+        if not self._dimensions:
+            return embeddings  # type: ignore
+        if isinstance(texts, str):
+            return truncate_embeddings([embeddings], self._dimensions)[0]
+        return truncate_embeddings(embeddings, self._dimensions)
+
+
+def export_quantized_onnx_model(
+    model_name: str,
+    quantization_config: Literal["arm64", "avx2", "avx512", "avx512_vnni"] = "avx512_vnni",
+) -> str:
+    """
+    Saves an int8-quantized ONNX version of a model stored in a local directory to that directory,
+    for use with SentenceTransformerEmbedding's onnx_file_name.
+    The quantization_config should match the CPUs that the model will run on.
+
+    Returns:
+        The quantized model's file name, relative to the model's directory
+    """
+    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+
+    model = SentenceTransformer(model_name, backend="onnx")
+    export_dynamic_quantized_onnx_model(model, quantization_config, model_name)
+    return f"onnx/model_qint8_{quantization_config}.onnx"
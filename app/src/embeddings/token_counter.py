@@ -0,0 +1,130 @@
+import functools
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Callable, Sequence
+
+import tiktoken
+
+# Enough for the distinct texts measured while chunking and embedding a large dataset
+DEFAULT_MAX_SIZE = 200_000
+
+
+class TokenCounter:
+    """
+    Counts tokens using a tokenizer, memoizing the count of each distinct text in a bounded
+    LRU cache. During ingestion, the same strings are measured repeatedly (e.g., while
+    chunking, when creating each Split, and again when embedding), so this avoids
+    re-tokenizing them.
+
+    Use tiktoken_counter() or EmbeddingModel.token_counter rather than instantiating this class
+    so that each tokenizer is loaded once and its cache is shared.
+    """
+
+    def __init__(
+        self,
+        token_lengths: Callable[[Sequence[str]], list[int]],
+        max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        """
+        Args:
+            token_lengths: Function that tokenizes a batch of texts and returns their token counts
+            max_size: Maximum number of counts to keep; least recently used ones are evicted
+        """
+        self._token_lengths = token_lengths
+        self._max_size = max_size
+        # Keys are hashes of the texts so that long texts (e.g., whole documents) aren't retained
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+        # Counts may be requested from multiple threads, e.g., the embedding thread in save_to_db()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text: str) -> int:
+        """
+        Returns the number of tokens in text.
+        """
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts: Sequence[str]) -> list[int]:
+        """
+        Returns the number of tokens in each of texts. Texts that haven't been counted before
+        are tokenized in a single call to the tokenizer.
+        """
+        keys = [_text_key(text) for text in texts]
+        counts: dict[bytes, int] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    counts[key] = self._cache[key]
+                    self.hits += 1
+
+        # Tokenize outside of the lock; each distinct missing text is tokenized once
+        missing = {key: text for key, text in zip(keys, texts, strict=True) if key not in counts}
+        if missing:
+            new_counts = dict(
+                zip(missing, self._token_lengths(list(missing.values())), strict=True)
+            )
+            counts.update(new_counts)
+            with self._lock:
+                self.misses += len(new_counts)
+                self._cache.update(new_counts)
+                while len(self._cache) > self._max_size:
+                    self._cache.popitem(last=False)
+
+        return [counts[key] for key in keys]
+
+    def prime(self, texts: Sequence[str], counts: Sequence[int]) -> None:
+        """
+        Caches counts that were computed elsewhere, e.g., in another process.
+        """
+        with self._lock:
+            for text, count in zip(texts, counts, strict=True):
+                key = _text_key(text)
+                self._cache[key] = count
+                self._cache.move_to_end(key)
+            while len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def cache_info(self) -> dict[str, int]:
+        """
+        Returns the cache's hit and miss counts and current size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "max_size": self._max_size,
+            }
+
+    def clear(self) -> None:
+        """
+        Removes all cached counts and resets the counters.
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _text_key(text: str) -> bytes:
+    return blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+@functools.cache
+def tiktoken_counter(model_name: str) -> TokenCounter:
+    """
+    Returns the shared TokenCounter for the tiktoken encoding used by model_name (e.g., "gpt-4").
+    """
+    encoding = tiktoken.encoding_for_model(model_name)
+    # Same as the length function of RecursiveCharacterTextSplitter.from_tiktoken_encoder()
+    return TokenCounter(
+        lambda texts: [
+            len(tokens)
+            for tokens in encoding.encode_batch(
+                list(texts), allowed_special=set(), disallowed_special="all"
+            )
+        ]
+    )
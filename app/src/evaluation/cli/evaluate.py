@@ -4,7 +4,11 @@
 import argparse
 from pathlib import Path
 
-from ..metrics.runner import create_retrieval_function, run_evaluation
+from ..metrics.runner import (
+    create_batch_retrieval_function,
+    create_retrieval_function,
+    run_evaluation,
+)
 from ..utils.dataset_mapping import map_dataset_name
 from ..utils.storage import QAPairStorage
 
@@ -42,6 +46,16 @@ def create_parser() -> argparse.ArgumentParser:
     parser.add_argument(
         "--min-score", type=float, default=-1.0, help="Minimum similarity score for retrieval"
     )
+    parser.add_argument(
+        "--exact-search",
+        action="store_true",
+        help="Use exact nearest neighbor search instead of the HNSW index, e.g., to measure its recall",
+    )
+    parser.add_argument(
+        "--filter-retrieval",
+        action="store_true",
+        help="Only retrieve chunks from the evaluated datasets, like chat engines that filter by dataset",
+    )
     parser.add_argument("--sampling", type=float, help="Fraction of questions to sample (e.g. 0.1)")
     parser.add_argument("--min-samples", type=int, help="Minimum number of samples per dataset")
     parser.add_argument("--random-seed", type=int, help="Random seed for reproducible sampling")
@@ -85,7 +99,14 @@ def main() -> None:
         print(f"Available datasets: {metadata['datasets']}")
 
         # Create retrieval function with min_score
-        retrieval_func = create_retrieval_function(args.min_score)
+        retrieval_datasets = db_datasets if args.filter_retrieval else None
+        retrieval_func = create_retrieval_function(
+            args.min_score, args.exact_search, retrieval_datasets
+        )
+        # Retrieve for many questions per DB query
+        batch_retrieval_func = create_batch_retrieval_function(
+            args.min_score, args.exact_search, retrieval_datasets
+        )
 
         # Use evaluation logs directory within our module's data directory
         eval_logs_dir = base_path / "logs" / "evaluations"
@@ -101,6 +122,7 @@ def main() -> None:
             retrieval_func=retrieval_func,
             log_dir=str(eval_logs_dir),  # Pass the module-specific log directory
             commit=args.commit,
+            batch_retrieval_func=batch_retrieval_func,
         )
     except Exception as e:
         print(f"Error running evaluation: {str(e)}")
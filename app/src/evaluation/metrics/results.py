@@ -2,7 +2,7 @@
 
 import uuid
 from hashlib import md5
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from tqdm import tqdm
 
@@ -11,6 +11,9 @@ from src.evaluation.data_models import EvaluationResult, ExpectedChunk, Retrieve
 
 from ..utils.timer import measure_time
 
+# Number of questions to retrieve chunks for in each call to a batch retrieval function
+RETRIEVAL_BATCH_SIZE = 100
+
 
 def generate_qa_pair_id(question: str, answer: str, dataset: str) -> str:
     """Generate a stable UUID for a QA pair based on content.
@@ -117,7 +120,10 @@ def process_retrieved_chunks(
 
 
 def batch_process_results(
-    questions: List[Dict], retrieval_func: Any, k: int
+    questions: List[Dict],
+    retrieval_func: Any,
+    k: int,
+    batch_retrieval_func: Optional[Any] = None,
 ) -> List[EvaluationResult]:
     """Process multiple questions in batches.
 
@@ -125,11 +131,38 @@ def batch_process_results(
         questions: List of questions to process
         retrieval_func: Function to retrieve chunks for a question
         k: Number of chunks to retrieve
+        batch_retrieval_func: Optional function to retrieve chunks for many questions at once,
+            which is used instead of retrieval_func if provided
 
     Returns:
         List of EvaluationResult objects
     """
-    results = []
+    retrievals = retrieve_for_questions(questions, retrieval_func, k, batch_retrieval_func)
+    return process_retrievals(questions, retrievals, k)
+
+
+def retrieve_for_questions(
+    questions: List[Dict],
+    retrieval_func: Any,
+    k: int,
+    batch_retrieval_func: Optional[Any] = None,
+) -> List[Tuple[Sequence[Any], float]]:
+    """Retrieve chunks for multiple questions.
+
+    Args:
+        questions: List of questions to retrieve chunks for
+        retrieval_func: Function to retrieve chunks for a question
+        k: Number of chunks to retrieve
+        batch_retrieval_func: Optional function to retrieve chunks for many questions at once,
+            which is used instead of retrieval_func if provided
+
+    Returns:
+        List of (retrieved chunks, average retrieval time in ms) for each question
+    """
+    if batch_retrieval_func:
+        return _batch_retrieve(questions, batch_retrieval_func, k)
+
+    retrievals = []
 
     # Process each question individually to avoid pgvector batch issues
     with measure_time() as timer:
@@ -139,9 +172,47 @@ def batch_process_results(
                 query = question["question"]
                 retrieved = retrieval_func(query, k)
 
-                # Process results
                 retrieval_time = timer.elapsed_ms() / len(questions)  # Average time per question
-                result = process_retrieved_chunks(question, retrieved, retrieval_time)
-                results.append(result)
+                retrievals.append((retrieved, retrieval_time))
 
-    return results
+    return retrievals
+
+
+def process_retrievals(
+    questions: List[Dict], retrievals: List[Tuple[Sequence[Any], float]], k: int
+) -> List[EvaluationResult]:
+    """Process chunks retrieved for multiple questions, keeping only the top k of each.
+
+    Since the top k chunks are a prefix of the top max(k) chunks, retrievals for a larger k
+    can be reused to evaluate smaller k values.
+
+    Args:
+        questions: List of questions that chunks were retrieved for
+        retrievals: List of (retrieved chunks, retrieval time in ms) for each question
+        k: Number of chunks to evaluate
+
+    Returns:
+        List of EvaluationResult objects
+    """
+    return [
+        process_retrieved_chunks(question, list(retrieved[:k]), retrieval_time)
+        for question, (retrieved, retrieval_time) in zip(questions, retrievals, strict=True)
+    ]
+
+
+def _batch_retrieve(
+    questions: List[Dict], batch_retrieval_func: Any, k: int
+) -> List[Tuple[Sequence[Any], float]]:
+    retrievals = []
+    with tqdm(total=len(questions), desc="Processing questions") as progress:
+        for start in range(0, len(questions), RETRIEVAL_BATCH_SIZE):
+            batch = questions[start : start + RETRIEVAL_BATCH_SIZE]
+            with measure_time() as timer:
+                retrieved_by_question = batch_retrieval_func([q["question"] for q in batch], k)
+            # Average time per question in the batch
+            retrieval_time = timer.elapsed_ms() / len(batch)
+
+            retrievals += [(retrieved, retrieval_time) for retrieved in retrieved_by_question]
+            progress.update(len(batch))
+
+    return retrievals
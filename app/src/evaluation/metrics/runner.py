@@ -2,24 +2,29 @@
 
 import csv
 import os
-from typing import Any, Callable, Dict, List, Optional, Sequence
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-from src.retrieve import retrieve_with_scores
+from src.retrieve import retrieve_many, retrieve_with_scores
 from src.util.sampling import get_stratified_sample
 
 from .batch import create_batch_config, filter_questions
 from .logging import EvaluationLogger
 from .metric_computation import compute_metrics_summary
-from .results import batch_process_results
+from .results import process_retrievals, retrieve_for_questions
 
 
 def create_retrieval_function(
     min_score: Optional[float] = None,
+    exact_search: bool = False,
+    datasets: Optional[List[str]] = None,
 ) -> Callable[[str, int], Sequence[Any]]:
     """Create a function to retrieve chunks for a question.
 
     Args:
         min_score: Optional minimum similarity score for retrieval
+        exact_search: Whether to bypass the approximate nearest neighbor index
+        datasets: Optional list of datasets to retrieve chunks from, like engines that filter
+            by dataset
 
     Returns:
         Function that takes a question and k value and returns retrieved chunks
@@ -29,24 +34,66 @@ def create_retrieval_function(
         # Default to -1.0 if no min_score provided
         score_threshold = min_score if min_score is not None else -1.0
         return retrieve_with_scores(
-            query=query, retrieval_k=k, retrieval_k_min_score=score_threshold
+            query=query,
+            retrieval_k=k,
+            retrieval_k_min_score=score_threshold,
+            exact_search=exact_search,
+            datasets=datasets,
         )
 
     return retrieval_func
 
 
+def create_batch_retrieval_function(
+    min_score: Optional[float] = None,
+    exact_search: bool = False,
+    datasets: Optional[List[str]] = None,
+) -> Callable[[Sequence[str], int], List[Sequence[Any]]]:
+    """Create a function to retrieve chunks for many questions at once.
+
+    Args:
+        min_score: Optional minimum similarity score for retrieval
+        exact_search: Whether to bypass the approximate nearest neighbor index
+        datasets: Optional list of datasets to retrieve chunks from, like engines that filter
+            by dataset
+
+    Returns:
+        Function that takes questions and a k value and returns retrieved chunks for each question
+    """
+
+    def batch_retrieval_func(queries: Sequence[str], k: int) -> List[Sequence[Any]]:
+        score_threshold = min_score if min_score is not None else -1.0
+        return retrieve_many(
+            queries=queries,
+            retrieval_k=k,
+            retrieval_k_min_score=score_threshold,
+            exact_search=exact_search,
+            datasets=datasets,
+        )
+
+    return batch_retrieval_func
+
+
 class EvaluationRunner:
     """Runs evaluation batches and logs results."""
 
-    def __init__(self, retrieval_func: Any, log_dir: str = "logs/evaluations"):
+    def __init__(
+        self,
+        retrieval_func: Any,
+        log_dir: str = "logs/evaluations",
+        batch_retrieval_func: Optional[Any] = None,
+    ):
         """Initialize the runner.
 
         Args:
             retrieval_func: Function to retrieve chunks for questions (uses model from app_config)
             log_dir: Directory for log files
+            batch_retrieval_func: Optional function to retrieve chunks for many questions at once,
+                which is used instead of retrieval_func if provided
         """
         self.retrieval_func = retrieval_func
         self.log_dir = log_dir
+        self.batch_retrieval_func = batch_retrieval_func
 
     def load_questions(self, file_path: str) -> List[Dict]:
         """Load questions from CSV file."""
@@ -106,10 +153,17 @@ class EvaluationRunner:
         if not questions:
             raise ValueError("No questions to evaluate after filtering/sampling")
 
+        # Retrieve once for the largest k; the top chunks for smaller k values are a prefix
+        max_k = max(k_values)
+        print(f"\nRetrieving chunks with k={max_k}")
+        retrievals = retrieve_for_questions(
+            questions, self.retrieval_func, max_k, self.batch_retrieval_func
+        )
+
         # Run evaluation for each k value
         for k in k_values:
             print(f"\nEvaluating k={k}")
-            self.run_evaluation_batch(questions, k, dataset_filter, commit)
+            self.run_evaluation_batch(questions, k, dataset_filter, commit, retrievals)
 
     def run_evaluation_batch(
         self,
@@ -117,8 +171,13 @@ class EvaluationRunner:
         k: int,
         dataset_filter: Optional[List[str]] = None,
         commit: Optional[str] = None,
+        retrievals: Optional[List[Tuple[Sequence[Any], float]]] = None,
     ) -> None:
-        """Run evaluation for a single k value."""
+        """Run evaluation for a single k value.
+
+        If retrievals (e.g., for a larger k) are provided, they are sliced to k
+        instead of retrieving chunks again.
+        """
         logger = None
         try:
             # Create batch config
@@ -134,7 +193,11 @@ class EvaluationRunner:
             logger.start_batch(config)
 
             # Process results
-            results = batch_process_results(questions, self.retrieval_func, k)
+            if retrievals is None:
+                retrievals = retrieve_for_questions(
+                    questions, self.retrieval_func, k, self.batch_retrieval_func
+                )
+            results = process_retrievals(questions, retrievals, k)
 
             # Log individual results
             for result in results:
@@ -167,6 +230,7 @@ def run_evaluation(
     random_seed: Optional[int] = None,
     log_dir: str = "logs/evaluations",
     commit: Optional[str] = None,
+    batch_retrieval_func: Optional[Any] = None,
 ) -> None:
     """Convenience function to run evaluation.
 
@@ -181,8 +245,11 @@ def run_evaluation(
         random_seed: Optional seed for reproducible sampling
         log_dir: Directory for log files
         commit: Optional git commit hash
+        batch_retrieval_func: Optional function to retrieve chunks for many questions at once
     """
-    runner = EvaluationRunner(retrieval_func=retrieval_func, log_dir=log_dir)
+    runner = EvaluationRunner(
+        retrieval_func=retrieval_func, log_dir=log_dir, batch_retrieval_func=batch_retrieval_func
+    )
     runner.run_evaluation(
         questions_file=questions_file,
         k_values=k_values,
@@ -8,7 +8,7 @@ from typing import Match, Sequence
 import markdown
 
 from src.citations import CITATION_PATTERN
-from src.db.models.document import Chunk, Document, Subsection
+from src.db.models.document import Chunk, ChunkData, Document, DocumentData, Subsection
 from src.generate import MessageAttributesT
 
 logger = logging.getLogger(__name__)
@@ -25,7 +25,7 @@ class FormattingConfig:
     def __init__(self) -> None:
         self.add_citation_link_per_subsection = False
 
-    def get_document_link(self, document: Document) -> str:
+    def get_document_link(self, document: Document | DocumentData) -> str:
         if document.source:
             return f"Source: <a href={document.source!r}>{document.source}</a>"
         return ""
@@ -33,7 +33,7 @@ class FormattingConfig:
     def get_citation_link(self, subsection: Subsection) -> str:
         return self.get_document_link(subsection.chunk.document)
 
-    def get_superscript_link(self, chunk: Chunk) -> str:
+    def get_superscript_link(self, chunk: Chunk | ChunkData) -> str:
         return chunk.document.source if chunk.document.source else "#"
 
     def format_accordion_body(self, citation_body: str) -> str:
@@ -123,20 +123,22 @@ def _create_accordion_html(
     return html, map_of_accordion_ids
 
 
-def _group_by_document(subsections: Sequence[Subsection]) -> dict[Document, list[Subsection]]:
+def _group_by_document(
+    subsections: Sequence[Subsection],
+) -> dict[Document | DocumentData, list[Subsection]]:
     # Group the citations by document to build an accordion for each document
-    citations_by_document: dict[Document, list[Subsection]] = defaultdict(list)
+    citations_by_document: dict[Document | DocumentData, list[Subsection]] = defaultdict(list)
     # Combine all citations for each document
     for document, subsection_itr in groupby(subsections, key=lambda t: t.chunk.document):
         citations_by_document[document] += list(subsection_itr)
     return citations_by_document
 
 
-ChunkWithCitation = tuple[Chunk, Sequence[Subsection]]
+ChunkWithCitation = tuple[Chunk | ChunkData, Sequence[Subsection]]
 
 
 def _build_citation_body(
-    config: FormattingConfig, document: Document, subsections: Sequence[Subsection]
+    config: FormattingConfig, document: Document | DocumentData, subsections: Sequence[Subsection]
 ) -> str:
     citation_body = []
     rendered_heading = ""
@@ -1,11 +1,12 @@
 import json
 import logging
 import os
-from typing import Any, AsyncGenerator, TypeVar
+import re
+from typing import Any, AsyncGenerator, Optional, TypeVar
 
 import boto3
 import botocore.exceptions
-from litellm import completion
+from litellm import acompletion, completion
 from pydantic import BaseModel
 
 from src.app_config import app_config
@@ -123,6 +124,26 @@ def generate(
     return response["choices"][0]["message"]["content"]
 
 
+async def generate_async(
+    llm: str,
+    system_prompt: str,
+    query: str,
+    context_text: str | None = None,
+    chat_history: ChatHistory | None = None,
+) -> str:
+    """
+    Async version of generate() that doesn't block the event loop while waiting for the LLM.
+    """
+    messages = _prepare_messages(system_prompt, query, context_text, chat_history)
+    logger.debug("Async calling %s for query: %s with context:\n%s", llm, query, context_text)
+
+    response = await acompletion(
+        model=llm, messages=messages, **completion_args(llm), temperature=app_config.temperature
+    )
+
+    return response["choices"][0]["message"]["content"]
+
+
 async def generate_streaming_async(
     llm: str,
     system_prompt: str,
@@ -138,7 +159,9 @@ async def generate_streaming_async(
         "Async streaming from %s for query: %s with context:\n%s", llm, query, context_text
     )
 
-    response_stream = completion(
+    # Use the async API so that waiting for chunks doesn't block the event loop,
+    # which would otherwise stall all other requests being handled by the same worker
+    response_stream = await acompletion(
         model=llm,
         messages=messages,
         stream=True,  # Enable streaming
@@ -146,7 +169,7 @@ async def generate_streaming_async(
         temperature=app_config.temperature,
     )
 
-    for chunk in response_stream:
+    async for chunk in response_stream:
         if content := chunk.choices[0].delta.content:
             yield content
 
@@ -169,31 +192,171 @@ class MessageAttributes(BaseModel):
 MessageAttributesT = TypeVar("MessageAttributesT", bound=MessageAttributes)
 
 
+def _analyze_message_args(
+    llm: str, system_prompt: str, message: str, response_format: type[MessageAttributesT]
+) -> dict[str, Any]:
+    return {
+        "model": llm,
+        "messages": [
+            {
+                "content": system_prompt,
+                "role": "system",
+            },
+            {
+                "content": message,
+                "role": "user",
+            },
+        ],
+        "response_format": response_format,
+        "temperature": app_config.temperature,
+        **completion_args(llm),
+    }
+
+
+def parse_message_attributes(
+    response: str, response_format: type[MessageAttributesT]
+) -> MessageAttributesT:
+    logger.info("Analyzed message: %s", response)
+
+    response_as_json = json.loads(response)
+    return response_format.model_validate(response_as_json)
+
+
 def analyze_message(
     llm: str, system_prompt: str, message: str, response_format: type[MessageAttributesT]
 ) -> MessageAttributesT:
     response = (
-        completion(
-            model=llm,
-            messages=[
-                {
-                    "content": system_prompt,
-                    "role": "system",
-                },
-                {
-                    "content": message,
-                    "role": "user",
-                },
-            ],
-            response_format=response_format,
-            temperature=app_config.temperature,
-            **completion_args(llm),
-        )
+        completion(**_analyze_message_args(llm, system_prompt, message, response_format))
         .choices[0]
         .message.content
     )
+    return parse_message_attributes(response, response_format)
 
-    logger.info("Analyzed message: %s", response)
 
-    response_as_json = json.loads(response)
-    return response_format.model_validate(response_as_json)
+async def analyze_message_async(
+    llm: str, system_prompt: str, message: str, response_format: type[MessageAttributesT]
+) -> MessageAttributesT:
+    """
+    Async version of analyze_message() that doesn't block the event loop while waiting for the LLM.
+    """
+    response = (
+        (await acompletion(**_analyze_message_args(llm, system_prompt, message, response_format)))
+        .choices[0]
+        .message.content
+    )
+    return parse_message_attributes(response, response_format)
+
+
+async def analyze_message_streaming_async(
+    llm: str, system_prompt: str, message: str, response_format: type[MessageAttributesT]
+) -> AsyncGenerator[str, None]:
+    """
+    Streaming version of analyze_message_async() that yields chunks of the LLM's JSON response
+    as they arrive. Feed them to a PartialJsonObject to act on fields as soon as they are
+    complete, then call parse_message_attributes() on the whole response.
+    """
+    response_stream = await acompletion(
+        stream=True, **_analyze_message_args(llm, system_prompt, message, response_format)
+    )
+
+    async for chunk in response_stream:
+        if content := chunk.choices[0].delta.content:
+            yield content
+
+
+# A field name followed by a colon
+_JSON_KEY = re.compile(r'("(?:[^"\\]|\\.)*")\s*:')
+# An escape sequence at the end of a string that was cut off before it was complete
+_INCOMPLETE_ESCAPE = re.compile(r"(?<!\\)((?:\\\\)*)\\(?:u[0-9a-fA-F]{0,3})?$")
+
+
+class PartialJsonObject:
+    """
+    Incrementally parses the top-level fields of a JSON object whose text arrives in pieces,
+    e.g., a structured response streamed from an LLM.
+
+    Field values are available in `fields` once they are complete. For a string field that is
+    still arriving, `partial_field` and `partial_value` hold its name and the text received so far.
+    Malformed JSON is not reported; parse `text` once it's complete to validate it.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.fields: dict[str, Any] = {}
+        self.partial_field: Optional[str] = None
+        self.partial_value = ""
+        self.done = False
+        self._decoder = json.JSONDecoder()
+        self._pos = 0
+        self._started = False
+        # Name of the field whose value is expected next
+        self._key: Optional[str] = None
+
+    def feed(self, text: str) -> None:
+        self.text += text
+        while not self.done and self._parse_next():
+            pass
+
+    def value_so_far(self, field: str) -> Any:
+        """
+        Returns the field's complete value, the text received so far for a string field that is
+        still arriving, or None if the field hasn't started arriving.
+        """
+        if field in self.fields:
+            return self.fields[field]
+        if field == self.partial_field:
+            return self.partial_value
+        return None
+
+    def _parse_next(self) -> bool:
+        "Parses the next token if it's complete, returning whether any progress was made"
+        while self._pos < len(self.text) and self.text[self._pos].isspace():
+            self._pos += 1
+        if self._pos == len(self.text):
+            return False
+
+        char = self.text[self._pos]
+        if not self._started:
+            self._started = char == "{"
+            self.done = not self._started
+            self._pos += 1
+            return self._started
+
+        if self._key is None:
+            if char in ",}":
+                self.done = char == "}"
+                self._pos += 1
+                return True
+            match = _JSON_KEY.match(self.text, self._pos)
+            if not match:
+                return False
+            self._key = json.loads(match.group(1))
+            self._pos = match.end()
+            return True
+
+        try:
+            value, end = self._decoder.raw_decode(self.text, self._pos)
+        except json.JSONDecodeError:
+            if char == '"':
+                self.partial_field = self._key
+                self.partial_value = _decode_partial_string(self.text[self._pos + 1 :])
+            return False
+        if end == len(self.text) and not isinstance(value, (str, dict, list)):
+            # More digits may follow a number, e.g., "12" may become "123"
+            return False
+
+        self.fields[self._key] = value
+        self._key = None
+        self.partial_field = None
+        self.partial_value = ""
+        self._pos = end
+        return True
+
+
+def _decode_partial_string(raw: str) -> str:
+    "Decodes the content of a JSON string that is missing its closing quote"
+    raw = _INCOMPLETE_ESCAPE.sub(r"\1", raw)
+    try:
+        return json.loads('"' + raw + '"', strict=False)
+    except json.JSONDecodeError:
+        return ""
@@ -161,6 +161,11 @@ def main() -> None:
         action="store_true",
         help="Resume ingestion from previous run, skipping existing docs",
     )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only update documents that changed since the previous ingestion, reusing embeddings",
+    )
     parser.add_argument("--skip_db", action="store_true", help="Skip reading from or writing to DB")
     parser.add_argument(
         "--drop-only", action="store_true", help="Only drop existing dataset; don't ingest"
@@ -188,4 +193,5 @@ def main() -> None:
         config,
         skip_db=args.skip_db,
         resume=args.resume,
+        incremental=args.incremental,
     )
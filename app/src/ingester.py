@@ -1,13 +1,19 @@
 import json
 import logging
+import multiprocessing
 import os
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import Collection, Iterator, Optional, Sequence
 
 from smart_open import open as smart_open
+from sqlalchemy import select
+from sqlalchemy.orm import defer, selectinload
 
 from src.adapters import db
 from src.app_config import app_config
+from src.citations import compute_subsections
 from src.db.models.document import Chunk, Document
 from src.ingestion.markdown_chunking import chunk_tree
 from src.ingestion.markdown_tree import create_markdown_tree
@@ -16,6 +22,8 @@ from src.util.ingest_utils import (
     DefaultChunkingConfig,
     IngestConfig,
     add_embeddings,
+    bulk_save_documents,
+    content_hash,
     create_file_path,
     document_exists,
     load_or_save_doc_markdown,
@@ -41,7 +49,7 @@ class Split:
         else:
             self.text_to_encode = f"{context_str.strip()}\n\n" + remove_links(text)
 
-        self.token_count = app_config.embedding_model.token_length(self.text_to_encode)
+        self.token_count = app_config.embedding_model.token_counter.count(self.text_to_encode)
 
         # For debugging tree-based chunking
         self.chunk_id = ""
@@ -67,8 +75,18 @@ def ingest_json(
     *,
     skip_db: bool = False,
     resume: bool = False,
+    incremental: bool = False,
     md_base_dir: Optional[str] = None,
 ) -> None:
+    """
+    Ingests the documents in a JSON file of scraped items.
+
+    If resume is True, documents that already exist in the DB are skipped.
+    If incremental is True, the existing documents of the dataset are updated to match
+    the JSON file -- see save_incrementally().
+    """
+    if resume and incremental:
+        raise ValueError("Cannot use both resume and incremental")
     json_items = load_json_items(db_session, json_filepath, config.doc_attribs, skip_db, resume)
 
     if config.prep_json_item:
@@ -77,7 +95,7 @@ def ingest_json(
 
     chunking_config = config.chunking_config or DefaultChunkingConfig()
     # First, chunk all json_items into splits (fast) to debug any issues quickly
-    all_splits = _chunk_into_splits_from_json(
+    all_splits, failed_sources = _chunk_into_splits_from_json(
         json_filepath,
         md_base_dir or config.md_base_dir,
         json_items,
@@ -88,9 +106,11 @@ def ingest_json(
 
     if skip_db:
         logger.info("Skip saving to DB")
+    elif incremental:
+        save_incrementally(db_session, all_splits, config.doc_attribs, failed_sources)
     else:
         # Then save to DB, which is slow since embeddings are computed
-        save_to_db(db_session, resume, all_splits)
+        save_to_db(db_session, all_splits)
 
 
 def load_json_items(
@@ -120,35 +140,227 @@ def load_json_items(
 
 def save_to_db(
     db_session: db.Session,
-    resume: bool,
     all_splits: Sequence[tuple[Document, Sequence[Split]]],
 ) -> None:
+    """
+    Embeds the splits of all documents and saves them to the DB.
+
+    Splits from multiple documents are embedded together in batches in a background thread,
+    while previously embedded documents are written to the DB. The DB is committed after each
+    batch so that an interrupted ingestion can be continued with `--resume`, which skips
+    documents that already exist in the DB.
+    """
+    documents_with_chunks = []
     for document, splits in all_splits:
         if not splits:
             logger.warning("No chunks for %r", document.source)
             continue
 
-        logger.info("Adding embeddings for %r", document.source)
         chunks = [
-            Chunk(
-                document=document,
-                content=split.text,
-                headings=split.headings,
-                num_splits=len(splits),
-                split_index=index,
-                tokens=split.token_count,
-            )
-            for index, split in enumerate(splits)
+            _create_chunk(document, split, index, len(splits)) for index, split in enumerate(splits)
         ]
-        # Add embedding of text_to_encode to each chunk (slow)
-        add_embeddings(chunks, [s.text_to_encode for s in splits])
-        logger.info("  Embedded webpage across %d chunks: %r", len(chunks), document.name)
+        documents_with_chunks.append((document, chunks, [s.text_to_encode for s in splits]))
 
+    batches = _batch_by_chunk_count(documents_with_chunks, app_config.embedding_model.batch_size)
+    for batch in _embed_batches_in_background(batches):
         # Then, add to the database
-        db_session.add(document)
+        bulk_save_documents(db_session, [(document, chunks) for document, chunks, _ in batch])
+        db_session.commit()
+        logger.info("  Saved %d documents to the DB", len(batch))
+
+
+def save_incrementally(
+    db_session: db.Session,
+    all_splits: Sequence[tuple[Document, Sequence[Split]]],
+    doc_attribs: dict[str, str],
+    failed_sources: Collection[str] = (),
+) -> None:
+    """
+    Updates the dataset's existing documents in the DB to match all_splits without recomputing
+    unchanged embeddings. Documents and chunks are compared using their content_hash:
+    - unchanged documents are skipped
+    - chunks of changed documents are re-embedded only if their text_to_encode changed
+    - chunks and documents that no longer exist are deleted
+
+    Existing documents in failed_sources (e.g., pages that couldn't be chunked) and documents
+    without splits are left unchanged rather than deleted, so that a parse error doesn't
+    remove a page from the corpus.
+
+    The DB is committed after every batch of embeddings, so rerunning after a failure
+    skips the documents that were already updated.
+    """
+    existing_documents = {
+        document.source: document
+        for document in db_session.scalars(
+            select(Document)
+            .where(
+                Document.dataset == doc_attribs["dataset"],
+                Document.program == doc_attribs["program"],
+                Document.region == doc_attribs["region"],
+            )
+            .options(
+                defer(Document.content),
+                selectinload(Document.chunks).defer(Chunk.mpnet_embedding),
+            )
+        )
+    }
+    # Compute these before any commit expires the loaded documents
+    existing_hashes = {
+        source: (
+            document.content_hash,
+            [chunk.content_hash for chunk in sorted(document.chunks, key=lambda c: c.split_index)],
+        )
+        for source, document in existing_documents.items()
+    }
+
+    # New chunks don't have embeddings until their batch is embedded, so don't let loading
+    # an expired document's chunks flush them
+    with db_session.no_autoflush:
+        chunks_to_embed: list[Chunk] = []
+        texts_to_embed: list[str] = []
+        unchanged_count = 0
+        for document, splits in all_splits:
+            existing_document = existing_documents.pop(document.source, None)
+            if not splits:
+                logger.warning("No chunks for %r", document.source)
+                continue
+
+            split_hashes = [content_hash(split.text_to_encode) for split in splits]
+            if existing_hashes.get(document.source) == (document.content_hash, split_hashes):
+                unchanged_count += 1
+                continue
+
+            if existing_document:
+                logger.info("Updating changed document %r", document.source)
+                existing_document.name = document.name
+                existing_document.content = document.content
+                existing_document.content_hash = document.content_hash
+                document = existing_document
+            else:
+                logger.info("Adding new document %r", document.source)
+                db_session.add(document)
+
+            # Reuse existing chunks (and their embeddings) that have the same text_to_encode
+            reusable_chunks: dict[str | None, list[Chunk]] = defaultdict(list)
+            for chunk in document.chunks:
+                reusable_chunks[chunk.content_hash].append(chunk)
+
+            for index, (split, split_hash) in enumerate(zip(splits, split_hashes, strict=True)):
+                if reusable_chunks[split_hash]:
+                    chunk = reusable_chunks[split_hash].pop(0)
+                    chunk.content = split.text
+                    chunk.headings = list(split.headings)
+                    chunk.subsections = compute_subsections(chunk)
+                    chunk.num_splits = len(splits)
+                    chunk.split_index = index
+                    chunk.tokens = split.token_count
+                else:
+                    chunks_to_embed.append(_create_chunk(document, split, index, len(splits)))
+                    texts_to_embed.append(split.text_to_encode)
+
+            for chunks in reusable_chunks.values():
+                for chunk in chunks:
+                    db_session.delete(chunk)
+
+            if len(chunks_to_embed) >= app_config.embedding_model.batch_size:
+                _embed_and_commit(db_session, chunks_to_embed, texts_to_embed)
+                chunks_to_embed, texts_to_embed = [], []
+
+        for source in failed_sources:
+            if existing_documents.pop(source, None):
+                logger.warning("Keeping existing document that failed to chunk: %r", source)
+
+        for document in existing_documents.values():
+            logger.info("Deleting document that no longer exists: %r", document.source)
+            db_session.delete(document)
+
+    _embed_and_commit(db_session, chunks_to_embed, texts_to_embed)
+    logger.info(
+        "Skipped %d unchanged documents; deleted %d documents",
+        unchanged_count,
+        len(existing_documents),
+    )
+
+
+def _embed_and_commit(db_session: db.Session, chunks: list[Chunk], texts: list[str]) -> None:
+    if chunks:
+        logger.info("Embedding %d new or changed chunks", len(chunks))
+        add_embeddings(chunks, texts)
         db_session.add_all(chunks)
-        if resume:
-            db_session.commit()
+    db_session.commit()
+
+
+def _create_chunk(document: Document, split: Split, index: int, num_splits: int) -> Chunk:
+    chunk = Chunk(
+        document=document,
+        content=split.text,
+        headings=split.headings,
+        num_splits=num_splits,
+        split_index=index,
+        tokens=split.token_count,
+        content_hash=content_hash(split.text_to_encode),
+    )
+    chunk.subsections = compute_subsections(chunk)
+    return chunk
+
+
+_DocumentWithChunks = tuple[Document, list[Chunk], list[str]]
+
+# Number of embedded batches that can wait to be saved to the DB
+# before the background thread stops embedding more batches
+EMBEDDING_PREFETCH_BATCHES = 2
+
+
+def _batch_by_chunk_count(
+    documents_with_chunks: Sequence[_DocumentWithChunks], batch_size: int
+) -> list[list[_DocumentWithChunks]]:
+    # Group whole documents so that each batch has about batch_size chunks;
+    # a document with more chunks than batch_size is in a batch by itself
+    batches: list[list[_DocumentWithChunks]] = []
+    batch: list[_DocumentWithChunks] = []
+    chunk_count = 0
+    for document_with_chunks in documents_with_chunks:
+        num_chunks = len(document_with_chunks[1])
+        if batch and chunk_count + num_chunks > batch_size:
+            batches.append(batch)
+            batch, chunk_count = [], 0
+        batch.append(document_with_chunks)
+        chunk_count += num_chunks
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _embed_batch(batch: list[_DocumentWithChunks]) -> list[_DocumentWithChunks]:
+    logger.info("Adding embeddings for %d documents", len(batch))
+    # Add embedding of text_to_encode to each chunk (slow)
+    add_embeddings(
+        [chunk for _, chunks, _ in batch for chunk in chunks],
+        [text for _, _, texts in batch for text in texts],
+    )
+    for document, chunks, _ in batch:
+        logger.info("  Embedded webpage across %d chunks: %r", len(chunks), document.name)
+    return batch
+
+
+def _embed_batches_in_background(
+    batches: Sequence[list[_DocumentWithChunks]],
+) -> Iterator[list[_DocumentWithChunks]]:
+    # Embed in a single background thread since the DB session must stay in the calling thread
+    # and the embedding model already parallelizes each batch
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending: deque[Future[list[_DocumentWithChunks]]] = deque()
+        try:
+            for batch in batches:
+                pending.append(executor.submit(_embed_batch, batch))
+                if len(pending) > EMBEDDING_PREFETCH_BATCHES:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Don't embed batches that won't be saved, e.g., if saving to the DB failed
+            for future in pending:
+                future.cancel()
 
 
 def _chunk_into_splits_from_json(
@@ -158,9 +370,14 @@ def _chunk_into_splits_from_json(
     doc_attribs: dict[str, str],
     common_base_url: str,
     chunking_config: ChunkingConfig,
-) -> Sequence[tuple[Document, Sequence[Split]]]:
+) -> tuple[Sequence[tuple[Document, Sequence[Split]]], list[str]]:
+    """
+    Returns the splits of each document that was chunked, and the sources of the documents
+    that failed to chunk.
+    """
     urls_processed: set[str] = set()
-    result = []
+    # Each document's splits, or its splits file path if it needs to be chunked
+    loaded_or_to_chunk: list[tuple[Document, Sequence[Split] | str]] = []
     for item in json_items:
         assert "url" in item, f"Item {item['url']} has no url"
         url = item["url"]
@@ -189,7 +406,13 @@ def _chunk_into_splits_from_json(
             # or save item["markdown"] content to a file
             content = load_or_save_doc_markdown(file_path, item["markdown"])
 
-        document = Document(name=item["title"], content=content, source=url, **doc_attribs)
+        document = Document(
+            name=item["title"],
+            content=content,
+            source=url,
+            content_hash=content_hash(item["title"], content),
+            **doc_attribs,
+        )
 
         chunks_file_path = f"{file_path}.splits.json"
         if os.path.exists(chunks_file_path):
@@ -197,18 +420,136 @@ def _chunk_into_splits_from_json(
             splits_dicts = json.loads(Path(chunks_file_path).read_text(encoding="utf-8"))
             splits: Sequence[Split] = [Split.from_dict(split_dict) for split_dict in splits_dicts]
             logger.info("  Loaded %d splits from file: %r", len(splits), chunks_file_path)
+            loaded_or_to_chunk.append((document, splits))
         else:
-            splits = _chunk_page(document, chunking_config)
-            logger.info("  Chunked into %d splits: %r", len(splits), document.name)
-            _save_splits_to_files(chunks_file_path, url, splits)
+            loaded_or_to_chunk.append((document, chunks_file_path))
+
+    # Then chunk the remaining documents in parallel
+    to_chunk = [
+        (document, chunks_file_path)
+        for document, chunks_file_path in loaded_or_to_chunk
+        if isinstance(chunks_file_path, str)
+    ]
+    chunked_splits = iter(chunk_documents([document for document, _ in to_chunk], chunking_config))
+
+    result = []
+    failed_sources = []
+    for document, splits_or_path in loaded_or_to_chunk:
+        assert document.source
+        if isinstance(splits_or_path, str):
+            chunked = next(chunked_splits)
+            if chunked is None:
+                # Keep going so that one bad document doesn't stop the whole ingestion
+                failed_sources.append(document.source)
+                continue
+            _save_splits_to_files(splits_or_path, document.source, chunked)
+            splits_or_path = chunked
+        result.append((document, splits_or_path))
 
-        result.append((document, splits))
     logger.info(
         "=== DONE splitting all %d webpages into a total of %d chunks",
         len(json_items),
         sum(len(splits) for _, splits in result),
     )
-    return result
+    if failed_sources:
+        logger.error("Failed to chunk %d webpages; see errors above", len(failed_sources))
+    return result, failed_sources
+
+
+def chunk_documents(
+    documents: Sequence[Document],
+    chunking_config: ChunkingConfig,
+    max_workers: Optional[int] = None,
+) -> list[Optional[Sequence[Split]]]:
+    """
+    Chunks each document's content into splits. Parsing and chunking markdown is CPU-bound,
+    so documents are chunked in a pool of processes.
+
+    Returns the splits of each document in the same order as documents. If a document cannot
+    be chunked, the error is logged and None is returned for it so that the other documents
+    can still be ingested.
+
+    Args:
+        documents: Documents with content to chunk
+        chunking_config: Config used to chunk every document
+        max_workers: Number of processes to use; defaults to app_config.chunking_workers
+    """
+    max_workers = min(
+        max_workers or app_config.chunking_workers or os.cpu_count() or 1, len(documents)
+    )
+    if max_workers <= 1:
+        return [_try_chunk_page(document, chunking_config) for document in documents]
+
+    logger.info("Chunking %d documents using %d processes", len(documents), max_workers)
+    results: list[Optional[Sequence[Split]]] = []
+    with ProcessPoolExecutor(
+        max_workers,
+        mp_context=_chunking_mp_context(),
+        initializer=_init_chunking_worker,
+        initargs=(chunking_config,),
+    ) as executor:
+        futures = [
+            executor.submit(
+                _chunk_document_content, document.name, document.source, document.content
+            )
+            for document in documents
+        ]
+        for document, future in zip(documents, futures, strict=True):
+            try:
+                splits = future.result()
+            except Exception:
+                logger.exception("Error chunking %s (%s)", document.name, document.source)
+                results.append(None)
+                continue
+
+            logger.info("  Chunked into %d splits: %r", len(splits), document.name)
+            # The counts were computed in the worker process, so cache them for add_embeddings()
+            app_config.embedding_model.token_counter.prime(
+                [split.text_to_encode for split in splits],
+                [split.token_count for split in splits],
+            )
+            results.append(splits)
+    return results
+
+
+def _chunking_mp_context() -> multiprocessing.context.BaseContext:
+    # Forked processes reuse the already loaded embedding model (and its tokenizer)
+    # instead of loading it again in each process
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()  # pragma: no cover
+
+
+# Set in each worker process by _init_chunking_worker()
+_worker_chunking_config: Optional[ChunkingConfig] = None
+
+
+def _init_chunking_worker(chunking_config: ChunkingConfig) -> None:
+    # Forked processes inherit chunking_config rather than unpickling it for each document;
+    # it may not be picklable, e.g., if it holds the chunks of a previously chunked tree
+    global _worker_chunking_config
+    _worker_chunking_config = chunking_config
+
+
+def _chunk_document_content(
+    name: Optional[str], source: Optional[str], content: Optional[str]
+) -> Sequence[Split]:
+    # Runs in a worker process, so only pass the fields needed for chunking
+    # rather than the Document, which belongs to the parent process's DB session
+    assert _worker_chunking_config
+    return _chunk_page(Document(name=name, source=source, content=content), _worker_chunking_config)
+
+
+def _try_chunk_page(
+    document: Document, chunking_config: ChunkingConfig
+) -> Optional[Sequence[Split]]:
+    try:
+        splits = _chunk_page(document, chunking_config)
+    except Exception:
+        logger.exception("Error chunking %s (%s)", document.name, document.source)
+        return None
+    logger.info("  Chunked into %d splits: %r", len(splits), document.name)
+    return splits
 
 
 def _chunk_page(document: Document, chunking_config: ChunkingConfig) -> Sequence[Split]:
@@ -218,12 +559,12 @@ def _chunk_page(document: Document, chunking_config: ChunkingConfig) -> Sequence
 def _create_splits_using_markdown_tree(
     document: Document, chunking_config: ChunkingConfig
 ) -> list[Split]:
+    assert document.content, f"{document.source} has no content"
+    tree = create_markdown_tree(
+        document.content, doc_name=document.name, doc_source=document.source
+    )
     splits: list[Split] = []
     try:
-        assert document.content
-        tree = create_markdown_tree(
-            document.content, doc_name=document.name, doc_source=document.source
-        )
         tree_chunks = chunk_tree(tree, chunking_config)
 
         # For debugging, save the tree to a file
@@ -240,10 +581,10 @@ def _create_splits_using_markdown_tree(
             # Add extra info for debugging
             split.chunk_id = chunk.id
             split.data_ids = ", ".join(chunk.data_ids)
-    except (Exception, KeyboardInterrupt) as e:  # pragma: no cover
-        logger.error("Error chunking %s (%s): %s", document.name, document.source, e)
-        logger.error(tree.format())
-        raise e
+    except (Exception, KeyboardInterrupt):  # pragma: no cover
+        # The error itself is logged by the caller
+        logger.error("Tree of %s:\n%s", document.source, tree.format())
+        raise
     return splits
 
 
@@ -9,13 +9,15 @@ from smart_open import open
 
 from src.adapters import db
 from src.app_config import app_config
+from src.citations import compute_subsections
 from src.db.models.document import Chunk, Document
-from src.ingestion.markdown_chunking import ChunkingConfig, chunk_tree
-from src.ingestion.markdown_tree import create_markdown_tree
+from src.ingester import Split, chunk_documents
+from src.ingestion.markdown_chunking import ChunkingConfig
 from src.util.file_util import get_files
 from src.util.ingest_utils import (
     IngestConfig,
     add_embeddings,
+    bulk_save_documents,
     create_file_path,
     load_or_save_doc_markdown,
     process_and_ingest_sys_args,
@@ -30,12 +32,12 @@ class ImagineLaChunkingConfig(ChunkingConfig):
         super().__init__(app_config.embedding_model.max_seq_length)
 
     def text_length(self, text: str) -> int:
-        return app_config.embedding_model.token_length(text)
+        return app_config.embedding_model.token_counter.count(text)
 
 
 def _parse_html(
     md_base_dir: str, common_base_url: str, file_path: str, doc_attribs: dict[str, str]
-) -> tuple[Document, Sequence[Chunk], Sequence[str]]:
+) -> Document:
 
     logger.info("Reading %r", file_path)
     with open(file_path, "r") as file:
@@ -57,23 +59,29 @@ def _parse_html(
     assert document.source
     file_path = create_file_path(md_base_dir, common_base_url, document.source)
     document.content = load_or_save_doc_markdown(file_path, content)
+    return document
 
-    # Convert markdown to chunks
-    tree = create_markdown_tree(content, doc_name=document.name, doc_source=document.source)
-    tree_chunks = chunk_tree(tree, ImagineLaChunkingConfig())
+
+def _create_chunks(
+    md_base_dir: str, common_base_url: str, document: Document, splits: Sequence[Split]
+) -> tuple[Sequence[Chunk], Sequence[str]]:
     chunks = [
         Chunk(
-            content=chunk.markdown, document=document, headings=chunk.headings, tokens=chunk.length
+            content=split.text, document=document, headings=split.headings, tokens=split.token_count
         )
-        for chunk in tree_chunks
+        for split in splits
     ]
-    chunk_texts_to_encode = [t_chunk.embedding_str for t_chunk in tree_chunks]
+    for chunk in chunks:
+        chunk.subsections = compute_subsections(chunk)
+    chunk_texts_to_encode = [split.text_to_encode for split in splits]
 
+    assert document.source
+    file_path = create_file_path(md_base_dir, common_base_url, document.source)
     chunks_file_path = f"{file_path}.chunks.json"
     logger.info("  Saving chunks to %r", chunks_file_path)
     save_json(chunks_file_path, chunks)
 
-    return document, chunks, chunk_texts_to_encode
+    return chunks, chunk_texts_to_encode
 
 
 def _ingest_content_hub(
@@ -85,6 +93,7 @@ def _ingest_content_hub(
     md_base_dir: Optional[str] = None,
 ) -> None:
     file_list = sorted(get_files(html_file_dir))
+    md_base_dir = md_base_dir or config.md_base_dir
 
     logger.info(
         "Processing HTML files in %s using %s with %s",
@@ -93,16 +102,28 @@ def _ingest_content_hub(
         config.doc_attribs,
     )
 
-    all_chunks: list[tuple[Document, Sequence[Chunk], Sequence[str]]] = []
+    documents: list[Document] = []
     for file_path in file_list:
         if not file_path.endswith(".html"):
             continue
 
         logger.info("Processing file: %s", file_path)
-        result = _parse_html(
-            md_base_dir or config.md_base_dir, config.common_base_url, file_path, config.doc_attribs
+        documents.append(
+            _parse_html(md_base_dir, config.common_base_url, file_path, config.doc_attribs)
+        )
+
+    # Convert markdown to chunks, using multiple processes
+    all_chunks: list[tuple[Document, Sequence[Chunk], Sequence[str]]] = []
+    for document, splits in zip(
+        documents, chunk_documents(documents, ImagineLaChunkingConfig()), strict=True
+    ):
+        if splits is None:
+            # The error was logged; ingest the other documents
+            continue
+        chunks, chunk_texts_to_encode = _create_chunks(
+            md_base_dir, config.common_base_url, document, splits
         )
-        all_chunks.append(result)
+        all_chunks.append((document, chunks, chunk_texts_to_encode))
 
     logger.info(
         "=== DONE splitting all %d webpages into a total of %d chunks",
@@ -116,8 +137,7 @@ def _ingest_content_hub(
         for document, chunks, chunk_texts_to_encode in all_chunks:
             logger.info("Adding embeddings for %r", document.source)
             add_embeddings(chunks, chunk_texts_to_encode)
-            db_session.add(document)
-            db_session.add_all(chunks)
+        bulk_save_documents(db_session, [(document, chunks) for document, chunks, _ in all_chunks])
 
 
 def main() -> None:
@@ -10,6 +10,7 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from mistletoe import block_token
 from nutree import Node, Tree
 
+from src.embeddings.token_counter import tiktoken_counter
 from src.ingestion.markdown_tree import (
     HeadingSectionNodeData,
     TokenNodeData,
@@ -84,18 +85,18 @@ class NodeWithIntro:
 class TreeTransaction:
     """
     This represents the state of the trees during chunking.
-    There are 3 trees created during chunking:
+    There are 2 trees and a view created during chunking:
     1. COMMITTED tree reflects chunked text; summaries replace chunked text; only updated when config.add_chunk() is called
-    2. Transaction "TXN" tree: initially a copy of COMMITTED tree; summaries replace (uncommitted) content in the BUFFER tree
+    2. Transaction "TXN" view: the COMMITTED tree without the (uncommitted) content moved to the BUFFER tree.
+       It is not materialized since nodes are examined in order and nodes moved to the BUFFER are never revisited.
     3. BUFFER tree contains (uncommitted) possible content for the next chunk
 
-    The TXN and BUFFER tree act as a scratchpad for creating chunks -- similar to a DB transaction.
+    The TXN view and BUFFER tree act as a scratchpad for creating chunks -- similar to a DB transaction.
     When the scratchpad/transaction is committed (or flushed), the BUFFER tree is used to create a chunk.
     Only when config.add_chunk() is called does the COMMITTED tree get updated.
     """
 
     committed_tree: Tree
-    txn_tree: Tree
     buffer_tree: Tree
     buffer: list[NodeWithIntro]
     breadcrumb_node: Node
@@ -113,13 +114,15 @@ class ChunkingConfig:
         self.chunks: list[ProtoChunk] = []
 
     def text_length(self, markdown: str) -> int:
-        return self.text_splitter()._length_function(markdown)
+        return tiktoken_counter("gpt-4").count(markdown)
 
     def text_splitter(
         self, chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = 15
     ) -> RecursiveCharacterTextSplitter:
-        return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name="gpt-4",
+        # Equivalent to RecursiveCharacterTextSplitter.from_tiktoken_encoder(model_name="gpt-4")
+        # but reuses the shared tokenizer and its memoized counts
+        return RecursiveCharacterTextSplitter(
+            length_function=tiktoken_counter("gpt-4").count,
             # Offer some buffer to ensure we stay below the max_length
             chunk_size=chunk_size if chunk_size else self.max_length - 30,
             chunk_overlap=chunk_overlap,
@@ -128,6 +131,9 @@ class ChunkingConfig:
     def nodes_fit_in_chunk(self, nodes: list[Node], breadcrumb_node: Node) -> bool:
         chunk = self.create_protochunk(nodes, breadcrumb_node=breadcrumb_node)
         logger.debug("Checking fit %s: %s", chunk.length, data_ids_for(nodes))
+        return self.protochunk_fits(chunk)
+
+    def protochunk_fits(self, chunk: ProtoChunk) -> bool:
         return chunk.length < self.max_length
 
     def add_chunk(self, chunk: ProtoChunk) -> None:
@@ -244,6 +250,9 @@ class ChunkingConfig:
 
     def full_enough_to_commit(self, chunk_buffer: list[Node], breadcrumb_node: Node) -> bool:
         chunk = self.create_protochunk(chunk_buffer, breadcrumb_node=breadcrumb_node)
+        return self.protochunk_full_enough_to_commit(chunk)
+
+    def protochunk_full_enough_to_commit(self, chunk: ProtoChunk) -> bool:
         next_nodes_portion = chunk.length / self.max_length
         # Example on https://edd.ca.gov/en/jobs_and_training/FAQs_WARN/
         # Only the 1 larger accordion is chunked by itself and summarized.
@@ -285,10 +294,7 @@ def chunk_tree(input_tree: Tree, config: ChunkingConfig) -> list[ProtoChunk]:
         while not config.nodes_fit_in_chunk([doc_node], doc_node):
             with assert_no_mismatches(tree):
                 logger.debug("=== Document node %s is too large for one chunk", doc_node.data_id)
-                logger.debug(
-                    "COMMITTED tree:\n%s\n%r (length %i)\n%s",
-                    *_format_tree_and_markdown(tree, config),
-                )
+                logger.debug("COMMITTED tree:\n%s", _TreeAndMarkdown(tree, config))
                 _gradually_chunk_tree_nodes(tree, config)
 
                 # Remove these chunked nodes from the tree as it provides no value at this time
@@ -304,9 +310,7 @@ def chunk_tree(input_tree: Tree, config: ChunkingConfig) -> list[ProtoChunk]:
         logger.debug("No more nodes to chunk")
 
     # Create the last chunk from the remaining content
-    logger.debug(
-        "COMMITTED tree:\n%s\n%r (length %i)\n%s", *_format_tree_and_markdown(tree, config)
-    )
+    logger.debug("COMMITTED tree:\n%s", _TreeAndMarkdown(tree, config))
     next_node = NodeWithIntro(doc_node)
     _add_chunks_and_summarize_node(next_node, config)
 
@@ -317,48 +321,60 @@ def chunk_tree(input_tree: Tree, config: ChunkingConfig) -> list[ProtoChunk]:
     assert not unchunked_ids, f"Expected {unchunked_ids} to be chunked"
 
     # Identify which chunk each node is in, ignoring the Document root node
-    data_id_to_chunk_id = {id: pc.id for pc in config.chunks for id in pc.data_ids}
-    logger.debug(
-        "Node-to-chunk mapping: %s",
-        {
-            n.data_id: data_id_to_chunk_id[n.data_id]
-            for n in input_tree.iterator()
-            if n.data_id != doc_node.data_id
-        },
-    )
+    if logger.isEnabledFor(logging.DEBUG):
+        data_id_to_chunk_id = {id: pc.id for pc in config.chunks for id in pc.data_ids}
+        logger.debug(
+            "Node-to-chunk mapping: %s",
+            {
+                n.data_id: data_id_to_chunk_id[n.data_id]
+                for n in input_tree.iterator()
+                if n.data_id != doc_node.data_id
+            },
+        )
     return config.chunks
 
 
-def _format_tree_and_markdown(tree: Tree, config: ChunkingConfig) -> tuple[str, str, int, str]:
-    pc = config.create_protochunk([tree.first_child()])
-    return (tree.format(), pc.id, pc.length, pc.markdown)
+class _TreeAndMarkdown:
+    """
+    Formats a tree and its rendered markdown for debug logging.
+    Formatting is deferred until the log message is emitted since rendering and measuring
+    the whole tree is expensive and this is logged for every node examined.
+    """
+
+    def __init__(self, tree: Tree, config: ChunkingConfig) -> None:
+        self.tree = tree
+        self.config = config
+
+    def __str__(self) -> str:
+        pc = self.config.create_protochunk([self.tree.first_child()])
+        return f"{self.tree.format()}\n{pc.id!r} (length {pc.length})\n{pc.markdown}"
 
 
 def _gradually_chunk_tree_nodes(committed_tree: Tree, config: ChunkingConfig) -> None:
     """
     The _general_ algorithm is:
-    - Consider the next node in the TXN tree
+    - Consider the next node in the TXN view of the COMMITTED tree
     - If it fits in the BUFFER, add it to the BUFFER
     - If it doesn't fit, summarize the node in a new chunk and replace the original node content with a summary
     - Repeat with the next node and once the BUFFER is full enough,
       create a chunk from the BUFFER and replace the original node content with a summary
     - Whenever a chunk is created (for any reason), reset and restart the process from the root
       because creating a chunk reduces the content and may allow more summary nodes to fit where it didn't before
-      - The new chunk is reflected in the COMMITTED tree, which is copied to the TXN tree
+      - The new chunk is reflected in the COMMITTED tree, which the TXN view reflects
 
     Notes:
       - Content in the BUFFER as a whole _always_ fits in a chunk
       - Content in the BUFFER may not necessarily become a chunk if a chunk is created for another reason.
     """
 
-    # Create Transaction tree from COMMITTED tree
-    txn_tree = copy_subtree("TXN", committed_tree.first_child()).tree
-    assert committed_tree.count == txn_tree.count
-    doc_node = txn_tree.first_child()
+    # Rather than copying the COMMITTED tree to a TXN tree and replacing each node moved to the BUFFER
+    # with a summary, traverse the COMMITTED tree without modifying it until a chunk is created.
+    # Nodes moved to the BUFFER precede the current node, so they are never revisited.
+    doc_node = committed_tree.first_child()
     assert doc_node.data_type == "Document"
 
     # Initialize empty BUFFER data structures
-    buffer_tree = copy_subtree("BUFFER", txn_tree.first_child(), include_descendants=False).tree
+    buffer_tree = copy_subtree("BUFFER", doc_node, include_descendants=False).tree
     assert buffer_tree.count == 1
     # This buffer will be used to update the COMMITTED tree once the buffer is committed to a chunk
     buffer: list[NodeWithIntro] = []
@@ -368,13 +384,9 @@ def _gradually_chunk_tree_nodes(committed_tree: Tree, config: ChunkingConfig) ->
     intro_node: Node | None = None
     while node:
         if node.data["chunked"]:
+            # Chunked Paragraph and ListItem nodes are removed from the COMMITTED tree by chunk_tree()
             logger.debug("Skipping chunked node %s", node.data_id)
-            chunked_node = node
-            # Determine the next node BEFORE removing chunked_node
             node = next_renderable_node(node)
-            if chunked_node.data_type in ["Paragraph", "ListItem"]:
-                # Remove these chunked nodes from the tree as it provides no value at this time
-                chunked_node.remove()
             continue
 
         # keep-with-next for intro nodes
@@ -389,14 +401,7 @@ def _gradually_chunk_tree_nodes(committed_tree: Tree, config: ChunkingConfig) ->
 
         next_node = NodeWithIntro(node, intro_node)
         logger.debug("Next: %s", next_node)
-        logger.debug(
-            "BUFFER tree:\n%s\n%r (length %i)\n%s",
-            *_format_tree_and_markdown(buffer_tree, config),
-        )
-        logger.debug(
-            "TXN tree:\n%s\n%r (length %i)\n%s",
-            *_format_tree_and_markdown(txn_tree, config),
-        )
+        logger.debug("BUFFER tree:\n%s", _TreeAndMarkdown(buffer_tree, config))
 
         # Set the breadcrumb node from which the headings for the chunk will be extracted
         breadcrumb_node = buffer[0].node if buffer else node
@@ -405,9 +410,8 @@ def _gradually_chunk_tree_nodes(committed_tree: Tree, config: ChunkingConfig) ->
         candidate_buffer = [buffer_tree.first_child()] + next_node.as_list
         if config.nodes_fit_in_chunk(candidate_buffer, breadcrumb_node):
             logger.debug("Fits! Adding %s", next_node)
-            # Update TXN tree but not the COMMITTED tree since the buffer is not yet ready to be chunked.
-            # Move next_node to the BUFFER tree by copying it to the buffer_tree,
-            # then in the TXN tree, replacing the original node with a summary.
+            # Don't update the COMMITTED tree since the buffer is not yet ready to be chunked.
+            # Move next_node to the BUFFER tree by copying it to the buffer_tree.
             copied_next_node = _copy_next_node_to(buffer_tree, next_node)
             # Add copied_next_node in the buffer_tree to the buffer
             buffer.append(copied_next_node)
@@ -415,16 +419,13 @@ def _gradually_chunk_tree_nodes(committed_tree: Tree, config: ChunkingConfig) ->
             # so that it's not included in the subsequent next_node
             intro_node = None
 
-            # Determine the next node BEFORE modifying/summarizing next_node.node
             node = next_renderable_node(node)
-            # Replace next_node in TXN tree with a summary
-            _summarize_node(next_node, config)
             continue
 
         # candidate_buffer does not fit so determine an action.
         logger.debug("Does not fit: %s + %s", data_ids_for(buffer_tree.iterator()), next_node)
         # If the action results in a new chunk, then the COMMITTED tree is modified, so restart. This is usually the case.
-        txn = TreeTransaction(committed_tree, txn_tree, buffer_tree, buffer, breadcrumb_node)
+        txn = TreeTransaction(committed_tree, buffer_tree, buffer, breadcrumb_node)
         chunk_created = _handle_does_not_fit(config, txn, next_node)
         if chunk_created:
             # Reset and restart from the root, since creating a chunk reduces the content,
@@ -462,18 +463,12 @@ class NextNodeCache:
     @cached_property
     def next_node_alone_fits(self) -> bool:
         "Returns True if next_node fits in a chunk by itself, i.e., ignoring what's in the buffer?"
-        # TODO: pass next_node_alone_protochunk to nodes_fit_in_chunk() to avoid recomputing it
-        return self.config.nodes_fit_in_chunk(
-            self.committed_nodes.as_list, breadcrumb_node=self.committed_nodes.node
-        )
+        return self.config.protochunk_fits(self.next_node_alone_protochunk)
 
     @cached_property
     def next_node_alone_large_enough_to_commit(self) -> bool:
         "Returns True if next_node is large enough to commit by itself, i.e., ignoring what's in the buffer?"
-        # TODO: pass next_node_alone_protochunk to full_enough_to_commit() to avoid recomputing it
-        return self.config.full_enough_to_commit(
-            self.committed_nodes.as_list, breadcrumb_node=self.committed_nodes.node
-        )
+        return self.config.protochunk_full_enough_to_commit(self.next_node_alone_protochunk)
 
 
 def _nodes_in_committed_tree(next_node: NodeWithIntro, committed_tree: Tree) -> NodeWithIntro:
@@ -45,6 +45,8 @@ class TokenAwareNode(Node):
     """
 
     def __init__(self, data: Any, **kwargs: dict[str, Any]) -> None:
+        # Cached markdown rendering of this node's subtree -- see render_subtree_as_md()
+        self.rendered_md: str | None = None
         super().__init__(data, **kwargs)
         if self._copy_data_flag():
             logger.debug("Copying data for new node %s in %s", self.data_id, self.tree.name)
@@ -92,6 +94,7 @@ class TokenAwareNode(Node):
                     self._add_child_token(child_node, before)
                 else:
                     self.data.token.children += [child_node.data.token]
+        self.invalidate_rendered_md()
         return child_node
 
     def _add_child_token(self, child_node: Node, before: Node) -> None:
@@ -118,6 +121,13 @@ class TokenAwareNode(Node):
     def has_token(self) -> bool:
         return isinstance(self.data, TokenNodeData)
 
+    def invalidate_rendered_md(self) -> None:
+        "Clear the cached rendering of this node and its ancestors, whose renderings include this node"
+        node = self
+        while isinstance(node, TokenAwareNode):
+            node.rendered_md = None
+            node = node.parent
+
     def assert_unfrozen_token(self) -> None:
         assert (
             self.has_token() and not self._is_token_frozen()
@@ -134,6 +144,7 @@ class TokenAwareNode(Node):
 
     def remove(self, *, keep_children: bool = False, with_clones: bool = False) -> None:
         logger.debug("Removing %s from %s", self.data_id, self.tree.name)
+        self.invalidate_rendered_md()
         if self._sync_token_applicable() and self.parent and self.parent.has_token():
             parent_token = self.parent.data.token
             if self.data.token in parent_token.children:
@@ -153,7 +164,13 @@ class TokenAwareNode(Node):
 
         super().remove(keep_children=keep_children, with_clones=with_clones)
 
+    def move_to(self, new_parent: Node | Tree, *, before: Node | bool | int | None = None) -> None:
+        self.invalidate_rendered_md()
+        super().move_to(new_parent, before=before)
+        self.invalidate_rendered_md()
+
     def remove_children(self) -> None:
+        self.invalidate_rendered_md()
         if self._sync_token_applicable() and not self._is_token_frozen():
             self.assert_unfrozen_token()
             logger.debug("Removing all children tokens of %s in %s", self.data_id, self.tree.name)
@@ -289,6 +306,8 @@ def new_tree(name: str, copying_tree: bool = False) -> Iterator[Tree]:
     if copying_tree:
         tree.system_root.set_meta("data_and_token_copying", True)
         tree.system_root.set_meta("sync_token", True)
+        # Copied trees are only modified via TokenAwareNode methods, which invalidate cached renderings
+        tree.system_root.set_meta("cache_rendering", True)
 
     with assert_no_mismatches(tree, tree_prepped=False):
         yield tree
@@ -512,24 +531,42 @@ def render_subtree_as_md(node: Node) -> str:
     Since the structure of the tree (i.e., each node's parent and children) is independent of each Token's parent and children,
     we cannot rely on mistletoe's renderer (which is based on Tokens) to render the tree correctly. Hence, we have this function.
     Whenever this method is called in a loop, join the result with no delimiter: `"".join(result)`
+
+    For copied trees (i.e., trees used for chunking), the rendering is cached on each node and
+    invalidated when the node's subtree is modified, so only modified subtrees are re-rendered.
     """
-    if node.data_type in [
-        "HeadingSection",  # Doesn't have mistletoe's token for rendering
-        "Document",  # Its token.children reference all headings and many paragraphs, which are now under HeadingSection nodes
-        "ListItem",  # TODO: Try removing "ListItem" after rewriting unit tests that ensure their token.childen are consistent with the tree
-    ]:
+    rendered_from_children = node.data_type in _RENDERED_FROM_CHILDREN
+    intro = _intro_if_needed(node) if node.has_token() and not rendered_from_children else None
+    use_cache = isinstance(node, TokenAwareNode) and node.tree.system_root.get_meta(
+        "cache_rendering"
+    )
+    if use_cache and node.rendered_md is not None:
+        md_str = node.rendered_md
+    else:
+        md_str = _render_subtree_without_intro(node, rendered_from_children)
+        if use_cache:
+            node.rendered_md = md_str
+    # The intro is not cached since it depends on node.data["show_intro"], which can change
+    return f"{intro}\n{md_str}" if intro else md_str
+
+
+_RENDERED_FROM_CHILDREN = [
+    "HeadingSection",  # Doesn't have mistletoe's token for rendering
+    "Document",  # Its token.children reference all headings and many paragraphs, which are now under HeadingSection nodes
+    "ListItem",  # TODO: Try removing "ListItem" after rewriting unit tests that ensure their token.childen are consistent with the tree
+]
+
+
+def _render_subtree_without_intro(node: Node, rendered_from_children: bool) -> str:
+    if rendered_from_children:
         # For these data_types, use node.children for rendering instead of relying on node.data.token.children
         # A result from render_subtree_as_md() ends with exactly 2 newlines, so join without a separator
         md_str = "".join([render_subtree_as_md(node) for node in node.children])
     elif node.has_token():
-        out_str = []
-        if intro := _intro_if_needed(node):
-            out_str.append(intro)
-        out_str.append(TokenNodeData.render_token(node.token))
-        # Since each element ends exactly 1 newline "\n",
-        # this join() will result in each element ending with "\n\n",
+        # Since the rendered token (and intro, if any) ends with exactly 1 newline "\n",
+        # adding "\n" will result in each element ending with "\n\n",
         # which is consistent with how markdown block elements are separated.
-        md_str = "\n".join(out_str) + "\n"
+        md_str = TokenNodeData.render_token(node.token) + "\n"
     else:
         raise ValueError(f"Unexpected node type: {node.id_string}")
     return md_str
@@ -0,0 +1,208 @@
+import logging
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import NamedTuple, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from src.app_config import app_config
+from src.embeddings.cache import normalize_query
+from src.embeddings.model import EmbeddingModel
+
+logger = logging.getLogger(__name__)
+
+# Number of messages between logging stats()
+_LOG_STATS_EVERY = 100
+
+# Target of a markdown link, e.g., "https://example.com" in "[Example](https://example.com)"
+_LINK_TARGET = re.compile(r"\]\(([^)\s]+)\)")
+
+
+@dataclass
+class Intent:
+    "A kind of message that always gets the same canned_response or alert_message"
+
+    name: str
+    # Messages with this intent, which are compared to new messages to recognize it
+    examples: list[str]
+    canned_response: str = ""
+    alert_message: str = ""
+    _links: list[str] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._links = _LINK_TARGET.findall(self.canned_response + self.alert_message)
+
+    def is_in(self, text: str) -> bool:
+        """
+        Returns whether text (e.g., an LLM's canned_response) has this intent's response.
+        Responses are compared by their links, which are kept when the LLM translates them.
+        """
+        if self._links:
+            return all(link in text for link in self._links)
+        response = normalize_query(self.canned_response + self.alert_message)
+        return bool(response) and response == normalize_query(text)
+
+
+class IntentMatch(NamedTuple):
+    intent: Intent
+    # Cosine similarity between the message and the example
+    score: float
+    # Example that is most similar to the message
+    example: str
+
+
+class _Observation(NamedTuple):
+    # Similarity of the message to its closest intent
+    score: float
+    # Whether the LLM gave the closest intent's response; None if the LLM wasn't called
+    agreed: Optional[bool]
+    # Whether the LLM gave any intent's response
+    llm_chose_intent: bool
+
+
+class IntentRouter:
+    """
+    Recognizes messages that have a fixed response without calling an LLM, by finding the
+    labelled example message whose embedding is most similar to the message's.
+
+    Messages are routed if the similarity is at least min_score. Because a wrongly routed message
+    gets a wrong answer, compare the router to the LLM before lowering min_score or disabling
+    shadow mode: in shadow mode, no message is routed and record_llm_result() tracks how often
+    the LLM agrees with the router; see stats().
+
+    The examples and responses are in English, so non-English messages should fall below
+    min_score and be left to the LLM, which translates the responses.
+    """
+
+    def __init__(
+        self,
+        intents: list[Intent],
+        min_score: float,
+        shadow: bool = True,
+        embedding_model: Optional[EmbeddingModel] = None,
+        max_observations: int = 10_000,
+    ):
+        """
+        Args:
+            intents: Intents to recognize
+            min_score: Minimum cosine similarity to an example for a message to be routed
+            shadow: If True, messages are never routed and are only used to measure agreement
+            embedding_model: Model used to embed messages; defaults to app_config.embedding_model
+            max_observations: Number of recent messages kept to compute stats()
+        """
+        self.intents = intents
+        self.min_score = min_score
+        self.shadow = shadow
+        self._embedding_model = embedding_model
+        # Each example's intent, in the same order as the rows of _example_embeddings
+        self._example_intents = [
+            (intent, example) for intent in intents for example in intent.examples
+        ]
+        self._example_embeddings: Optional[npt.NDArray[np.float32]] = None
+        self._observations: deque[_Observation] = deque(maxlen=max_observations)
+        self._recorded = 0
+        self._lock = threading.Lock()
+
+    @property
+    def embedding_model(self) -> EmbeddingModel:
+        return self._embedding_model or app_config.embedding_model
+
+    def classify(self, message: str) -> IntentMatch:
+        "Returns the intent of the example that is most similar to message"
+        examples = self._embed_examples()
+        embedding = _normalized(np.asarray(self.embedding_model.encode(message), dtype=np.float32))
+        scores = examples @ embedding
+        best = int(np.argmax(scores))
+        intent, example = self._example_intents[best]
+        match = IntentMatch(intent, float(scores[best]), example)
+        logger.info("Closest intent %r (score %.3f, example %r)", intent.name, match.score, example)
+        return match
+
+    def should_route(self, match: IntentMatch) -> bool:
+        """
+        Returns whether the message should get the intent's response without calling the LLM.
+        Otherwise, pass the LLM's analysis of the message to record_llm_result().
+        """
+        if self.shadow or match.score < self.min_score:
+            return False
+
+        with self._lock:
+            log_stats = self._record(_Observation(match.score, None, True))
+        if log_stats:
+            self._log_stats()
+        return True
+
+    def record_llm_result(self, match: IntentMatch, llm_response: str) -> None:
+        """
+        Records whether the LLM's analysis of a message agrees with its closest intent.
+
+        Args:
+            match: Result of classify() for the message
+            llm_response: canned_response and alert_message set by the LLM; must be empty
+                          if the message isn't in English since routed responses aren't translated
+        """
+        agreed = match.intent.is_in(llm_response)
+        llm_intent = next((intent for intent in self.intents if intent.is_in(llm_response)), None)
+        with self._lock:
+            log_stats = self._record(_Observation(match.score, agreed, llm_intent is not None))
+        if log_stats:
+            self._log_stats()
+
+        if match.score >= self.min_score and not agreed:
+            logger.warning(
+                "Intent router disagrees with the LLM: chose %r (score %.3f) but LLM chose %r",
+                match.intent.name,
+                match.score,
+                llm_intent.name if llm_intent else None,
+            )
+
+    def stats(self, min_score: Optional[float] = None) -> dict[str, float]:
+        """
+        Returns statistics about recent messages if they were routed using min_score (defaults to
+        the router's min_score), to choose a min_score from shadow mode observations:
+        - hit_rate: fraction of messages that are routed
+        - agreement: fraction of routed messages analyzed by the LLM that it gave the same response
+        - missed: number of messages that aren't routed but the LLM gave an intent's response
+        """
+        min_score = self.min_score if min_score is None else min_score
+        with self._lock:
+            observations = list(self._observations)
+        routed = [observation for observation in observations if observation.score >= min_score]
+        compared = [observation.agreed for observation in routed if observation.agreed is not None]
+        return {
+            "messages": len(observations),
+            "hit_rate": len(routed) / len(observations) if observations else 0.0,
+            "agreement": sum(compared) / len(compared) if compared else 0.0,
+            "compared": len(compared),
+            "missed": sum(
+                observation.llm_chose_intent
+                for observation in observations
+                if observation.score < min_score
+            ),
+        }
+
+    def _record(self, observation: _Observation) -> bool:
+        "Returns whether it's time to log stats; must be called while holding the lock"
+        self._observations.append(observation)
+        self._recorded += 1
+        return self._recorded % _LOG_STATS_EVERY == 0
+
+    def _log_stats(self) -> None:
+        logger.info("Intent router stats (min_score %.3f): %s", self.min_score, self.stats())
+
+    def _embed_examples(self) -> npt.NDArray[np.float32]:
+        with self._lock:
+            if self._example_embeddings is None:
+                examples = [example for _, example in self._example_intents]
+                embeddings = np.asarray(self.embedding_model.encode(examples), dtype=np.float32)
+                self._example_embeddings = embeddings / np.maximum(
+                    np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+                )
+            return self._example_embeddings
+
+
+def _normalized(vector: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
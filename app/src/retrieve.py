@@ -1,18 +1,294 @@
+import asyncio
 import logging
-from typing import Sequence
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional, Sequence
 
-from sqlalchemy import select
+import numpy as np
+from sqlalchemy import (
+    Integer,
+    Row,
+    Select,
+    SQLColumnExpression,
+    cast,
+    column,
+    event,
+    func,
+    select,
+    true,
+    values,
+)
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.types import UserDefinedType
 
+from src.adapters import db
 from src.app_config import app_config
-from src.db.models.document import Chunk, ChunkWithScore, Document
+from src.db.models.document import (
+    EMBEDDING_DIMENSION,
+    Chunk,
+    ChunkData,
+    ChunkWithScore,
+    Document,
+    DocumentData,
+)
+from src.vector_index import NumpyVectorIndex
 
 logger = logging.getLogger(__name__)
 
+# Columns loaded for each retrieved chunk. The chunk's embedding and its document's content
+# are large and not needed after retrieval, so they aren't loaded.
+_DOCUMENT_COLUMNS: list[SQLColumnExpression] = [
+    Document.name.label("document_name"),
+    Document.source.label("document_source"),
+    Document.dataset.label("document_dataset"),
+    Document.program.label("document_program"),
+    Document.region.label("document_region"),
+]
+_CHUNK_COLUMNS: list[SQLColumnExpression] = [
+    Chunk.id,
+    Chunk.document_id,
+    Chunk.content,
+    Chunk.tokens,
+    Chunk.page_number,
+    Chunk.headings,
+    Chunk.num_splits,
+    Chunk.split_index,
+    Chunk.content_hash,
+    Chunk.subsections,
+    *_DOCUMENT_COLUMNS,
+]
+
+
+class _CorpusVersion(NamedTuple):
+    version: str
+    # time.monotonic() when the version was read from the DB
+    checked_at: float
+
+
+_corpus_version: Optional[_CorpusVersion] = None
+
+# Incremented when a transaction in this process that changed the corpus commits;
+# see mark_corpus_changed()
+_corpus_generation = 0
+_CORPUS_CHANGED = "corpus_changed"
+
+
+def mark_corpus_changed(db_session: db.Session) -> None:
+    """
+    Marks db_session as adding, updating, or deleting documents so that results derived from the
+    corpus (e.g., cached retrievals) are invalidated in this process once db_session commits.
+    """
+    db_session.info[_CORPUS_CHANGED] = True
+
+
+@event.listens_for(db.Session, "after_commit")
+def _bump_corpus_generation(session: db.Session) -> None:
+    global _corpus_generation, _corpus_version
+    if session.info.pop(_CORPUS_CHANGED, False):
+        _corpus_generation += 1
+        _corpus_version = None
+
+
+@event.listens_for(db.Session, "after_rollback")
+def _forget_corpus_changes(session: db.Session) -> None:
+    session.info.pop(_CORPUS_CHANGED, None)
+
+
+def corpus_version() -> str:
+    """
+    Returns a string that changes when documents are added, updated, or deleted, e.g., when the
+    corpus is re-ingested, so that results derived from the corpus can be cached until then.
+    Changes committed in this process change the version immediately; changes by other processes
+    (e.g., an ingestion script) are noticed on the next call, or within
+    app_config.corpus_version_ttl seconds if it's set.
+    """
+    if (cached := _cached_corpus_version()) is not None:
+        return cached
+
+    with app_config.db_session() as db_session:
+        row = db_session.execute(_corpus_version_statement()).one()
+    return _set_corpus_version(row)
+
+
+async def corpus_version_async() -> str:
+    "Async version of corpus_version()"
+    if (cached := _cached_corpus_version()) is not None:
+        return cached
+
+    async with app_config.async_db_session() as db_session:
+        row = (await db_session.execute(_corpus_version_statement())).one()
+    return _set_corpus_version(row)
+
+
+def _cached_corpus_version() -> Optional[str]:
+    if _corpus_version and time.monotonic() - _corpus_version.checked_at < (
+        app_config.corpus_version_ttl
+    ):
+        return _corpus_version.version
+    return None
+
+
+def _corpus_version_statement() -> Select:
+    # Ingestion inserts or updates documents, which sets updated_at, and deleting documents
+    # changes the count
+    return select(func.count(Document.id), func.max(Document.updated_at))
+
+
+def _set_corpus_version(row: Row) -> str:
+    global _corpus_version
+    count, last_updated_at = row
+    updated = last_updated_at.isoformat() if last_updated_at else ""
+    version = f"{_corpus_generation}:{count}:{updated}"
+    if _corpus_version and _corpus_version.version != version:
+        logger.info("Corpus version changed from %s to %s", _corpus_version.version, version)
+    _corpus_version = _CorpusVersion(version, time.monotonic())
+    return version
+
+
+class _CachedRetrieval(NamedTuple):
+    chunks_with_scores: Sequence[ChunkWithScore]
+    # How long the retrieval took, i.e., the time saved by each cache hit
+    duration_ms: float
+
+
+class RetrievalCache:
+    """
+    Bounded LRU cache of retrieval results so that a repeated query (e.g., the same question
+    sent to /query and then /query_stream) doesn't search the chunk embeddings again.
+    Results are keyed by the query embedding, the retrieval parameters, and corpus_version(),
+    so results from before the corpus changed aren't used, unless app_config.corpus_version_ttl
+    is set to allow them for that long.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        Args:
+            max_size: Maximum number of results to keep; least recently used ones are evicted
+        """
+        self.max_size = max_size
+        self._cache: OrderedDict[Hashable, _CachedRetrieval] = OrderedDict()
+        # Retrievals run in multiple threads, e.g., in the chat API's thread pool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def get(self, key: Hashable) -> Optional[Sequence[ChunkWithScore]]:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += cached.duration_ms
+        logger.info("Using cached retrieval results; saved %.1f ms", cached.duration_ms)
+        # Copy the list so that callers can't change the cached results
+        return list(cached.chunks_with_scores)
+
+    def put(
+        self, key: Hashable, chunks_with_scores: Sequence[ChunkWithScore], duration_ms: float
+    ) -> None:
+        with self._lock:
+            self._cache[key] = _CachedRetrieval(list(chunks_with_scores), duration_ms)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def cache_info(self) -> dict[str, float]:
+        """
+        Returns the cache's hit and miss counts, hit rate, total retrieval time saved by hits,
+        and current size.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_ms": self.saved_ms,
+                "size": len(self._cache),
+                "max_size": self.max_size,
+            }
+
+    def clear(self) -> None:
+        """
+        Removes all cached results and resets the counters.
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+            self.saved_ms = 0.0
+
+
+# Shared by all chat engines; set app_config.retrieval_cache_size to 0 to disable it
+retrieval_cache = RetrievalCache(app_config.retrieval_cache_size)
+
+
+def _retrieval_cache_key(
+    query_embedding: Any,
+    retrieval_k: int,
+    retrieval_k_min_score: float,
+    exact_search: bool,
+    filters: dict[str, Sequence[str] | None],
+    corpus_version: str,
+) -> Hashable:
+    return (
+        np.asarray(query_embedding, dtype=np.float32).tobytes(),
+        retrieval_k,
+        retrieval_k_min_score,
+        exact_search,
+        # Empty filters aren't applied, just like missing ones
+        tuple(sorted((name, tuple(value or ())) for name, value in filters.items())),
+        corpus_version,
+    )
+
+
+_vector_index: Optional[NumpyVectorIndex] = None
+_vector_index_lock = threading.Lock()
+
+
+def _uses_corpus_version() -> bool:
+    return retrieval_cache.max_size > 0 or app_config.retrieval_backend == "numpy"
+
+
+def _search_vector_index(
+    version: str,
+    query_embedding: Any,
+    retrieval_k: int,
+    filters: dict[str, Sequence[str] | None],
+) -> list[tuple[ChunkData, float]]:
+    global _vector_index
+    with _vector_index_lock:
+        # Other threads wait for the index to be (re)loaded rather than loading it too
+        if _vector_index is None or _vector_index.corpus_version != version:
+            _vector_index = _load_vector_index(version)
+        vector_index = _vector_index
+    return vector_index.search(query_embedding, retrieval_k, **filters)
+
+
+def _load_vector_index(version: str) -> NumpyVectorIndex:
+    # Ordered so that the index is built the same way each time
+    statement = (
+        select(*_CHUNK_COLUMNS, Chunk.mpnet_embedding).join(Chunk.document).order_by(Chunk.id)
+    )
+    with app_config.db_session() as db_session:
+        rows = db_session.execute(statement).all()
+
+    documents: dict[Any, DocumentData] = {}
+    chunks = [_to_chunk_data(row, documents) for row in rows]
+    embeddings = [row.mpnet_embedding for row in rows]
+    return NumpyVectorIndex(chunks, embeddings, version, directory=app_config.vector_index_dir)
+
 
 def retrieve_with_scores(
     query: str,
     retrieval_k: int,
     retrieval_k_min_score: float,
+    *,
+    exact_search: bool = False,
     **filters: Sequence[str] | None,
 ) -> Sequence[ChunkWithScore]:
     logger.info("Retrieving context for %r", query)
@@ -20,9 +296,355 @@ def retrieve_with_scores(
     embedding_model = app_config.embedding_model
     query_embedding = embedding_model.encode(query, show_progress_bar=False)
 
-    statement = select(Chunk, Chunk.mpnet_embedding.max_inner_product(query_embedding)).join(
-        Chunk.document
+    # Cached results and the vector index are only used for the current corpus
+    version = corpus_version() if _uses_corpus_version() else ""
+    cache_key = None
+    if retrieval_cache.max_size > 0:
+        cache_key = _retrieval_cache_key(
+            query_embedding, retrieval_k, retrieval_k_min_score, exact_search, filters, version
+        )
+        if (cached := retrieval_cache.get(cache_key)) is not None:
+            return cached
+
+    start_time = time.perf_counter()
+    if app_config.retrieval_backend == "numpy":
+        results = _search_vector_index(version, query_embedding, retrieval_k, filters)
+    else:
+        with app_config.db_session() as db_session:
+            rows = _search_db(db_session, query_embedding, retrieval_k, exact_search, filters)
+            if _is_missing_filtered_chunks(len(rows), retrieval_k, exact_search, filters):
+                rows = _search_db(db_session, query_embedding, retrieval_k, True, filters)
+        results = _to_chunks_with_scores(rows)
+    chunks_with_scores = _filter_by_min_score(results, retrieval_k_min_score)
+
+    if cache_key is not None:
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        retrieval_cache.put(cache_key, chunks_with_scores, duration_ms)
+    return chunks_with_scores
+
+
+async def retrieve_with_scores_async(
+    query: str,
+    retrieval_k: int,
+    retrieval_k_min_score: float,
+    *,
+    exact_search: bool = False,
+    **filters: Sequence[str] | None,
+) -> Sequence[ChunkWithScore]:
+    """
+    Async version of retrieve_with_scores() for use in the chat engines.
+    The CPU-bound query embedding runs in an executor and the DB query uses an async session
+    so that neither blocks the event loop.
+    """
+    logger.info("Retrieving context for %r", query)
+
+    embedding_model = app_config.embedding_model
+    query_embedding = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: embedding_model.encode(query, show_progress_bar=False)
+    )
+
+    # Cached results and the vector index are only used for the current corpus
+    version = await corpus_version_async() if _uses_corpus_version() else ""
+    cache_key = None
+    if retrieval_cache.max_size > 0:
+        cache_key = _retrieval_cache_key(
+            query_embedding, retrieval_k, retrieval_k_min_score, exact_search, filters, version
+        )
+        if (cached := retrieval_cache.get(cache_key)) is not None:
+            return cached
+
+    start_time = time.perf_counter()
+    if app_config.retrieval_backend == "numpy":
+        # The index may need to be loaded, which uses a sync session
+        results = await asyncio.to_thread(
+            _search_vector_index, version, query_embedding, retrieval_k, filters
+        )
+    else:
+        async with app_config.async_db_session() as db_session:
+            rows = await _search_db_async(
+                db_session, query_embedding, retrieval_k, exact_search, filters
+            )
+            if _is_missing_filtered_chunks(len(rows), retrieval_k, exact_search, filters):
+                rows = await _search_db_async(
+                    db_session, query_embedding, retrieval_k, True, filters
+                )
+        results = _to_chunks_with_scores(rows)
+    chunks_with_scores = _filter_by_min_score(results, retrieval_k_min_score)
+
+    if cache_key is not None:
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        retrieval_cache.put(cache_key, chunks_with_scores, duration_ms)
+    return chunks_with_scores
+
+
+def retrieve_many(
+    queries: Sequence[str],
+    retrieval_k: int,
+    retrieval_k_min_score: float,
+    *,
+    exact_search: bool = False,
+    **filters: Sequence[str] | None,
+) -> list[Sequence[ChunkWithScore]]:
+    """
+    Batched version of retrieve_with_scores() for retrieving context for many queries,
+    e.g., during evaluation. All queries are encoded in one call and searched using a single
+    SQL statement. Returns the results for each query in the same order as queries.
+    """
+    if not queries:
+        return []
+    logger.info("Retrieving context for %d queries", len(queries))
+
+    embedding_model = app_config.embedding_model
+    query_embeddings = embedding_model.encode(list(queries), show_progress_bar=False)
+
+    rows_by_query: list[list[Row]] = [[] for _ in queries]
+    with app_config.db_session() as db_session:
+        for row in _search_db_many(
+            db_session, list(enumerate(query_embeddings)), retrieval_k, exact_search, filters
+        ):
+            rows_by_query[row.query_index].append(row)
+
+        missing_chunks = [
+            (index, query_embeddings[index])
+            for index, rows in enumerate(rows_by_query)
+            if _is_missing_filtered_chunks(len(rows), retrieval_k, exact_search, filters)
+        ]
+        if missing_chunks:
+            for index, _ in missing_chunks:
+                rows_by_query[index] = []
+            for row in _search_db_many(db_session, missing_chunks, retrieval_k, True, filters):
+                rows_by_query[row.query_index].append(row)
+
+    documents: dict[Any, DocumentData] = {}
+    return [
+        _filter_by_min_score(
+            [(_to_chunk_data(row, documents), row.score) for row in rows], retrieval_k_min_score
+        )
+        for rows in rows_by_query
+    ]
+
+
+def _search_db(
+    db_session: db.Session,
+    query_embedding: Any,
+    retrieval_k: int,
+    exact_search: bool,
+    filters: dict[str, Sequence[str] | None],
+) -> Sequence[Row]:
+    statement = _retrieval_statement(
+        query_embedding, retrieval_k, exact_search=exact_search, **filters
+    )
+    db_session.execute(_search_settings_statement(retrieval_k, exact_search))
+    # Confirmed that the `max_inner_product` method returns the same score as using sentence_transformers.util.dot_score
+    # used in code at https://huggingface.co/sentence-transformers/multi-qa-mpnet-base-cos-v1
+    return db_session.execute(statement).all()
+
+
+async def _search_db_async(
+    db_session: db.AsyncSession,
+    query_embedding: Any,
+    retrieval_k: int,
+    exact_search: bool,
+    filters: dict[str, Sequence[str] | None],
+) -> Sequence[Row]:
+    statement = _retrieval_statement(
+        query_embedding, retrieval_k, exact_search=exact_search, **filters
+    )
+    await db_session.execute(_search_settings_statement(retrieval_k, exact_search))
+    return (await db_session.execute(statement)).all()
+
+
+def _search_db_many(
+    db_session: db.Session,
+    query_embeddings: Sequence[tuple[int, Any]],
+    retrieval_k: int,
+    exact_search: bool,
+    filters: dict[str, Sequence[str] | None],
+) -> Sequence[Row]:
+    "Returns the top chunks for each (query_index, query_embedding), ordered by query_index"
+    # Search for each query's top chunks in a LATERAL subquery,
+    # which can use the index just like the single-query statement
+    query_table = values(
+        column("query_index", Integer),
+        column("embedding", Chunk.mpnet_embedding.type),
+        name="queries",
+    ).data(list(query_embeddings))
+    # VALUES parameters are sent as text, so cast them for the vector operator
+    embedding = cast(query_table.c.embedding, Chunk.mpnet_embedding.type)
+    if _uses_quantization(exact_search):
+        top_chunks_statement = _quantized_top_chunks(embedding, retrieval_k, **filters)
+    else:
+        score = Chunk.mpnet_embedding.max_inner_product(embedding)
+        top_chunks_statement = (
+            _apply_filters(select(Chunk.id, score.label("score")).join(Chunk.document), **filters)
+            .order_by(score)
+            .limit(retrieval_k)
+        )
+    top_chunks = top_chunks_statement.lateral("top_chunks")
+    statement = (
+        select(query_table.c.query_index, *_CHUNK_COLUMNS, top_chunks.c.score)
+        .select_from(query_table)
+        .join(top_chunks, true())
+        .join(Chunk, Chunk.id == top_chunks.c.id)
+        .join(Chunk.document)
+        .order_by(query_table.c.query_index, top_chunks.c.score)
+    )
+    db_session.execute(_search_settings_statement(retrieval_k, exact_search))
+    return db_session.execute(statement).all()
+
+
+def _is_missing_filtered_chunks(
+    num_chunks: int,
+    retrieval_k: int,
+    exact_search: bool,
+    filters: dict[str, Sequence[str] | None],
+) -> bool:
+    """
+    Returns whether an index search returned fewer than retrieval_k chunks because of filters.
+    The HNSW index finds the nearest ef_search chunks before filters are applied, so when the
+    filtered datasets, programs or regions are a small part of the corpus, few or none of those
+    chunks may match. An exact search, which applies the filters first, is used instead.
+    """
+    if exact_search or num_chunks >= retrieval_k or not any(filters.values()):
+        return False
+    logger.info(
+        "Index search found %d of %d chunks matching the filters; using exact search",
+        num_chunks,
+        retrieval_k,
+    )
+    return True
+
+
+def _search_settings_statement(retrieval_k: int, exact_search: bool) -> Select:
+    # Settings only apply to the current transaction, i.e., the retrieval query that follows
+    if exact_search:
+        # Don't use the approximate nearest neighbor index so that results are exact,
+        # e.g., to measure the recall of the index
+        return select(func.set_config("enable_indexscan", "off", True))
+
+    # The HNSW index returns at most ef_search results (before filters are applied)
+    ef_search = max(app_config.hnsw_ef_search, _num_candidates(retrieval_k))
+    return select(func.set_config("hnsw.ef_search", str(ef_search), True))
+
+
+def _retrieval_statement(
+    query_embedding: Any,
+    retrieval_k: int,
+    *,
+    exact_search: bool = False,
+    **filters: Sequence[str] | None,
+) -> Select:
+    if _uses_quantization(exact_search):
+        top_chunks = _quantized_top_chunks(query_embedding, retrieval_k, **filters).subquery(
+            "top_chunks"
+        )
+        return (
+            select(*_CHUNK_COLUMNS, top_chunks.c.score)
+            .select_from(top_chunks)
+            .join(Chunk, Chunk.id == top_chunks.c.id)
+            .join(Chunk.document)
+            .order_by(top_chunks.c.score)
+        )
+
+    # Load each chunk's document in the same query since it is used for logging and citations
+    score = Chunk.mpnet_embedding.max_inner_product(query_embedding)
+    statement = select(*_CHUNK_COLUMNS, score.label("score")).join(Chunk.document)
+    return _apply_filters(statement, **filters).order_by(score).limit(retrieval_k)
+
+
+class _HalfVector(UserDefinedType):
+    "pgvector's halfvec type, which stores each dimension as a 16-bit float"
+
+    cache_ok = True
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def get_col_spec(self, **_kwargs: Any) -> str:
+        return f"halfvec({self.dim})"
+
+
+def _uses_quantization(exact_search: bool) -> bool:
+    # Exact search compares the full embeddings, e.g., to measure the recall of quantization
+    return app_config.retrieval_quantization != "none" and not exact_search
+
+
+def _num_candidates(retrieval_k: int) -> int:
+    "Returns the number of chunks found using the quantized embeddings, if they're used"
+    if app_config.retrieval_quantization == "none":
+        return retrieval_k
+    return retrieval_k * app_config.quantized_rerank_factor
+
+
+def _quantized_top_chunks(
+    query_embedding: Any, retrieval_k: int, **filters: Sequence[str] | None
+) -> Select:
+    """
+    Selects the ids and scores of the top chunks by searching the quantized embeddings (using
+    their smaller index) for candidates, which are then re-scored using the full embeddings.
+    """
+    # Cast the query since binary_quantize() is overloaded for vector and halfvec
+    query = cast(query_embedding, Chunk.mpnet_embedding.type)
+    # These expressions must match QUANTIZED_EMBEDDING_INDEXES, including their dimension
+    dim = EMBEDDING_DIMENSION
+    if app_config.retrieval_quantization == "halfvec":
+        distance = cast(Chunk.mpnet_embedding, _HalfVector(dim)).op("<#>")(
+            cast(query, _HalfVector(dim))
+        )
+    else:
+        # Hamming distance between the signs of each dimension
+        distance = cast(func.binary_quantize(Chunk.mpnet_embedding), BIT(dim)).op("<~>")(
+            func.binary_quantize(query)
+        )
+    candidates = (
+        _apply_filters(select(Chunk.id).join(Chunk.document), **filters)
+        .order_by(distance)
+        .limit(_num_candidates(retrieval_k))
+        .subquery("candidates")
+    )
+
+    score = Chunk.mpnet_embedding.max_inner_product(query)
+    return (
+        select(Chunk.id, score.label("score"))
+        .join(candidates, Chunk.id == candidates.c.id)
+        .order_by(score)
+        .limit(retrieval_k)
+    )
+
+
+def _to_chunks_with_scores(rows: Sequence[Row]) -> list[tuple[ChunkData, float]]:
+    documents: dict[Any, DocumentData] = {}
+    return [(_to_chunk_data(row, documents), row.score) for row in rows]
+
+
+def _to_chunk_data(row: Row, documents: dict[Any, DocumentData]) -> ChunkData:
+    # Chunks of the same document share a DocumentData, like they would share a Document
+    document = documents.get(row.document_id)
+    if document is None:
+        document = documents[row.document_id] = DocumentData(
+            id=row.document_id,
+            name=row.document_name,
+            source=row.document_source,
+            dataset=row.document_dataset,
+            program=row.document_program,
+            region=row.document_region,
+        )
+    return ChunkData(
+        id=row.id,
+        document=document,
+        content=row.content,
+        tokens=row.tokens,
+        page_number=row.page_number,
+        headings=row.headings,
+        num_splits=row.num_splits,
+        split_index=row.split_index,
+        content_hash=row.content_hash,
+        subsections=row.subsections,
     )
+
+
+def _apply_filters(statement: Select, **filters: Sequence[str] | None) -> Select:
+    # The statement must join Chunk.document
     if benefit_dataset := filters.pop("datasets", None):
         statement = statement.where(Document.dataset.in_(benefit_dataset))
     if benefit_programs := filters.pop("programs", None):
@@ -32,33 +654,29 @@ def retrieve_with_scores(
 
     if filters:
         raise ValueError(f"Unknown filters: {filters.keys()}")
+    return statement
 
-    with app_config.db_session() as db_session:
-        # Confirmed that the `max_inner_product` method returns the same score as using sentence_transformers.util.dot_score
-        # used in code at https://huggingface.co/sentence-transformers/multi-qa-mpnet-base-cos-v1
-        chunks_with_scores = db_session.execute(
-            statement.order_by(Chunk.mpnet_embedding.max_inner_product(query_embedding)).limit(
-                retrieval_k
-            )
-        ).all()
 
-        retrievals = [
-            f"{index}. score {-score:.4f}: {chunk.id}, {chunk.document.name!r}"
-            for index, (chunk, score) in enumerate(chunks_with_scores, start=1)
-        ]
-        logger.info("Retrieved %d docs:\n  %s", len(chunks_with_scores), "\n  ".join(retrievals))
+def _filter_by_min_score(
+    chunks_with_scores: Sequence[Any], retrieval_k_min_score: float
+) -> Sequence[ChunkWithScore]:
+    retrievals = [
+        f"{index}. score {-score:.4f}: {chunk.id}, {chunk.document.name!r}"
+        for index, (chunk, score) in enumerate(chunks_with_scores, start=1)
+    ]
+    logger.info("Retrieved %d docs:\n  %s", len(chunks_with_scores), "\n  ".join(retrievals))
 
-        # Scores from the DB query are negated, presumably to reverse the default sort order
-        filtered_chunks_with_scores = [
-            ChunkWithScore(chunk, -score)
-            for chunk, score in chunks_with_scores
-            if -score >= retrieval_k_min_score
-        ]
-        if len(filtered_chunks_with_scores) < len(chunks_with_scores):
-            logger.info(
-                "Keeping only the top %d, which meet the %f score threshold.",
-                len(filtered_chunks_with_scores),
-                retrieval_k_min_score,
-            )
+    # Scores from the DB query are negated, presumably to reverse the default sort order
+    filtered_chunks_with_scores = [
+        ChunkWithScore(chunk, -score)
+        for chunk, score in chunks_with_scores
+        if -score >= retrieval_k_min_score
+    ]
+    if len(filtered_chunks_with_scores) < len(chunks_with_scores):
+        logger.info(
+            "Keeping only the top %d, which meet the %f score threshold.",
+            len(filtered_chunks_with_scores),
+            retrieval_k_min_score,
+        )
 
-        return filtered_chunks_with_scores
+    return filtered_chunks_with_scores
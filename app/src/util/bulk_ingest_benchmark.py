@@ -0,0 +1,98 @@
+"""
+Compares the time to save documents and chunks to the DB using the ORM versus COPY
+(see bulk_save_documents()). Both are run in transactions that are rolled back,
+so the DB is left unchanged.
+
+Usage: python -m src.util.bulk_ingest_benchmark [num_documents] [chunks_per_document]
+"""
+
+import logging
+import sys
+import time
+from typing import Callable, Sequence
+
+import numpy as np
+
+from src.adapters import db
+from src.app_config import app_config
+from src.db.models.document import EMBEDDING_DIMENSION, Chunk, Document
+from src.util.ingest_utils import bulk_save_documents
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_DATASET = "bulk_ingest_benchmark"
+
+
+def _create_documents(
+    num_documents: int, chunks_per_document: int
+) -> list[tuple[Document, list[Chunk]]]:
+    rng = np.random.default_rng(0)
+    documents_with_chunks = []
+    for i in range(num_documents):
+        document = Document(
+            name=f"Document {i}",
+            content=f"Content of document {i}",
+            source=f"https://example.com/{i}",
+            dataset=BENCHMARK_DATASET,
+            program="benchmark",
+            region="benchmark",
+        )
+        chunks = [
+            Chunk(
+                document=document,
+                content=f"Chunk {j} of document {i}",
+                tokens=5,
+                mpnet_embedding=rng.random(EMBEDDING_DIMENSION, dtype=np.float32),
+                headings=[f"Heading {j}"],
+                num_splits=chunks_per_document,
+                split_index=j,
+            )
+            for j in range(chunks_per_document)
+        ]
+        documents_with_chunks.append((document, chunks))
+    return documents_with_chunks
+
+
+def _orm_save(
+    db_session: db.Session, documents_with_chunks: Sequence[tuple[Document, list[Chunk]]]
+) -> None:
+    for document, chunks in documents_with_chunks:
+        db_session.add(document)
+        db_session.add_all(chunks)
+    db_session.flush()
+
+
+def _time_save(
+    save_func: Callable[[db.Session, Sequence[tuple[Document, list[Chunk]]]], None],
+    num_documents: int,
+    chunks_per_document: int,
+) -> float:
+    documents_with_chunks = _create_documents(num_documents, chunks_per_document)
+    with app_config.db_session() as db_session:
+        start = time.perf_counter()
+        save_func(db_session, documents_with_chunks)
+        elapsed = time.perf_counter() - start
+        db_session.rollback()
+    return elapsed
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    num_documents = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    chunks_per_document = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    orm_seconds = _time_save(_orm_save, num_documents, chunks_per_document)
+    bulk_seconds = _time_save(bulk_save_documents, num_documents, chunks_per_document)
+
+    logger.info(
+        "Saved %d documents with %d chunks each: ORM %.2fs, COPY %.2fs (%.1fx faster)",
+        num_documents,
+        chunks_per_document,
+        orm_seconds,
+        bulk_seconds,
+        orm_seconds / bulk_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
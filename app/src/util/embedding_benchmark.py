@@ -0,0 +1,111 @@
+"""
+Compares the CPU latency and throughput of encoding texts with the PyTorch and ONNX backends of
+the SentenceTransformer model in app_config.embedding_model_name, and how closely the ONNX
+embeddings match the PyTorch ones.
+
+If a quantization config (arm64, avx2, avx512 or avx512_vnni) is given, an int8-quantized ONNX
+model is exported to the model's directory and benchmarked instead of the full-precision one.
+This requires the optimum and onnxruntime packages.
+
+Usage: python -m src.util.embedding_benchmark [quantization_config] [num_texts]
+"""
+
+import logging
+import statistics
+import sys
+import time
+from typing import Any, Literal, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from src.app_config import app_config
+from src.embeddings.sentence_transformer import (
+    SentenceTransformerEmbedding,
+    export_quantized_onnx_model,
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of single-text encodes used to measure query latency
+NUM_QUERIES = 50
+
+BACKENDS: tuple[Literal["torch", "onnx"], ...] = ("torch", "onnx")
+
+_WORDS = (
+    "how do I apply for CalFresh benefits if my household income changed last month and we "
+    "recently moved to a new county with different eligibility rules for seniors and children"
+).split()
+
+
+def _create_texts(num_texts: int) -> list[str]:
+    # Texts of varying lengths, from short queries to chunk-sized passages
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(_WORDS, size=int(rng.integers(5, 200)))) for _ in range(num_texts)]
+
+
+def cosine_similarities(embeddings: Sequence[Any], other_embeddings: Sequence[Any]) -> npt.NDArray:
+    "Returns the cosine similarity of each pair of corresponding embeddings"
+    a = np.asarray(embeddings, dtype=np.float32)
+    b = np.asarray(other_embeddings, dtype=np.float32)
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def _time_model(
+    model: SentenceTransformerEmbedding, queries: Sequence[str], texts: list[str]
+) -> tuple[float, float, Any]:
+    # Warm up, e.g., so that one-time initialization isn't measured
+    model.encode(list(queries[:2]))
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        model.encode(query)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embeddings = model.encode(texts)
+    throughput = len(texts) / (time.perf_counter() - start)
+    return statistics.median(latencies) * 1000, throughput, embeddings
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    quantization_config = sys.argv[1] if len(sys.argv) > 1 else None
+    num_texts = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+
+    model_name = app_config.embedding_model_name
+    onnx_file_name = (
+        export_quantized_onnx_model(model_name, quantization_config)  # type: ignore[arg-type]
+        if quantization_config
+        else None
+    )
+    texts = _create_texts(num_texts)
+    queries = texts[:NUM_QUERIES]
+
+    results = {}
+    for backend in BACKENDS:
+        model = SentenceTransformerEmbedding(
+            model_name, backend=backend, onnx_file_name=onnx_file_name
+        )
+        results[backend] = _time_model(model, queries, texts)
+        logger.info(
+            "%s: median query latency %.1fms, throughput %.1f texts/s",
+            backend if backend == "torch" else onnx_file_name or "onnx",
+            results[backend][0],
+            results[backend][1],
+        )
+
+    similarities = cosine_similarities(results["torch"][2], results["onnx"][2])
+    logger.info(
+        "ONNX is %.1fx faster per query and %.1fx faster in batches; "
+        "cosine similarity to PyTorch embeddings: min %.4f, mean %.4f",
+        results["torch"][0] / results["onnx"][0],
+        results["onnx"][1] / results["torch"][1],
+        similarities.min(),
+        similarities.mean(),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,26 @@ import inspect
 import json
 import logging
 import os
+import uuid
+from hashlib import md5
 from logging import Logger
 from pathlib import Path
 from typing import Callable, NamedTuple, Optional, Sequence
 
+import numpy as np
+from pgvector.psycopg import register_vector_info
+from psycopg.types import TypeInfo
 from smart_open import open as smart_open
-from sqlalchemy import and_, delete, select
+from sqlalchemy import and_, delete, select, tuple_
 from sqlalchemy.sql import exists
 
 from src.adapters import db
 from src.app_config import app_config
+from src.db import bulk_ops
 from src.db.models.document import Chunk, Document
 from src.ingestion.markdown_chunking import ChunkingConfig
+from src.retrieve import mark_corpus_changed
+from src.util import datetime_util
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +31,18 @@ def drop_existing_dataset(db_session: db.Session, dataset: str) -> bool:
     dataset_exists = db_session.execute(select(Document).where(Document.dataset == dataset)).first()
     if dataset_exists:
         db_session.execute(delete(Document).where(Document.dataset == dataset))
+        mark_corpus_changed(db_session)
     return dataset_exists is not None
 
 
+def content_hash(*texts: str | None) -> str:
+    """
+    Returns a hash of the given texts, used to detect whether a document or chunk has changed.
+    """
+    content = "||".join(text or "" for text in texts).encode("utf-8")
+    return md5(content, usedforsecurity=False).hexdigest()
+
+
 def document_exists(db_session: db.Session, url: str, doc_attribs: dict[str, str]) -> bool:
     # Existing documents are determined by the source URL; could use document.content instead
     if db_session.query(
@@ -79,6 +96,7 @@ def process_and_ingest_sys_args(
     parser.add_argument("benefit_region")
     parser.add_argument("file_path")
     parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--incremental", action="store_true")
     parser.add_argument("--skip_db", action="store_true")
     args = parser.parse_args(argv[1:])
 
@@ -89,6 +107,12 @@ def process_and_ingest_sys_args(
                 f"Ingestion function does not support `resume`: {ingestion_call}"
             )
         logger.info("Enabled resuming from previous run.")
+    if args.incremental:
+        if "incremental" not in params:
+            raise NotImplementedError(
+                f"Ingestion function does not support `incremental`: {ingestion_call}"
+            )
+        logger.info("Only updating documents that changed.")
     if args.skip_db:
         if "skip_db" not in params:
             raise NotImplementedError(
@@ -111,6 +135,7 @@ def process_and_ingest_sys_args(
         ingest_config,
         skip_db=args.skip_db,
         resume=args.resume,
+        incremental=args.incremental,
     )
 
 
@@ -122,11 +147,17 @@ def start_ingestion(
     *,
     skip_db: bool = False,
     resume: bool = False,
+    incremental: bool = False,
 ) -> None:
     logger.info("Ingesting from %r: %r", file_path, config.doc_attribs)
+    if not skip_db:
+        app_config.check_embedding_dimension()
     with app_config.db_session() as db_session:
         if resume:
             ingestion_call(db_session, file_path, config, skip_db=skip_db, resume=resume)
+        elif incremental:
+            # Existing documents are updated rather than dropped
+            ingestion_call(db_session, file_path, config, skip_db=skip_db, incremental=True)
         else:
             if not skip_db:
                 dropped = drop_existing_dataset(db_session, config.dataset_label)
@@ -134,6 +165,9 @@ def start_ingestion(
                     logger.warning("Dropped existing dataset %s", config.dataset_label)
                 db_session.commit()
             ingestion_call(db_session, file_path, config, skip_db=skip_db)
+        if not skip_db:
+            # Ingestion calls may save documents without bulk_save_documents()
+            mark_corpus_changed(db_session)
         db_session.commit()
     logger.info("Finished ingesting %r (%s)", config.dataset_label, config.scraper_dataset)
 
@@ -161,9 +195,10 @@ def add_embeddings(
     # Generate all the embeddings in parallel for speed
     embeddings = embedding_model.encode([text for text in to_encode], show_progress_bar=False)
 
-    for chunk, embedding, text in zip(chunks, embeddings, to_encode, strict=True):
+    # Usually already counted when the chunks were created, so the counts are cached
+    token_lens = embedding_model.token_counter.count_batch(to_encode)
+    for chunk, embedding, token_len in zip(chunks, embeddings, token_lens, strict=True):
         chunk.mpnet_embedding = embedding  # type: ignore
-        token_len = embedding_model.token_length(text)
         if not chunk.tokens:
             chunk.tokens = token_len
         else:
@@ -173,6 +208,91 @@ def add_embeddings(
         ), f"Text too long for embedding model: {chunk.tokens} tokens: {len(chunk.content)} chars: {chunk.content[:80]}...{chunk.content[-50:]}"
 
 
+# Columns and their Postgres types for copying documents and chunks in binary format
+DOCUMENT_COPY_COLUMNS = {
+    "id": "uuid",
+    "name": "text",
+    "content": "text",
+    "source": "text",
+    "dataset": "text",
+    "program": "text",
+    "region": "text",
+    "content_hash": "text",
+    "created_at": "timestamptz",
+    "updated_at": "timestamptz",
+}
+CHUNK_COPY_COLUMNS = {
+    "id": "uuid",
+    "document_id": "uuid",
+    "content": "text",
+    "tokens": "int4",
+    "mpnet_embedding": "vector",
+    "page_number": "int4",
+    "headings": "text[]",
+    "num_splits": "int4",
+    "split_index": "int4",
+    "content_hash": "text",
+    "subsections": "jsonb",
+    "created_at": "timestamptz",
+    "updated_at": "timestamptz",
+}
+
+
+def bulk_save_documents(
+    db_session: db.Session,
+    documents_with_chunks: Sequence[tuple[Document, Sequence[Chunk]]],
+    *,
+    upsert: bool = False,
+) -> None:
+    """
+    Save documents and their embedded chunks using COPY, which is much faster than
+    adding them to db_session since the ORM inserts embeddings row by row.
+    The rows are written in db_session's transaction, but the objects are not added to db_session.
+    If upsert is True, existing documents (and their chunks) with the same source and dataset
+    as a given document are replaced.
+    """
+    now = datetime_util.utcnow()
+    for document, chunks in documents_with_chunks:
+        # Set the column defaults that the ORM would otherwise set when flushing
+        document.id = document.id or uuid.uuid4()
+        document.created_at = document.updated_at = now
+        for chunk in chunks:
+            chunk.id = chunk.id or uuid.uuid4()
+            chunk.document_id = document.id
+            chunk.created_at = chunk.updated_at = now
+            chunk.num_splits = 1 if chunk.num_splits is None else chunk.num_splits
+            chunk.split_index = 0 if chunk.split_index is None else chunk.split_index
+            chunk.mpnet_embedding = np.asarray(chunk.mpnet_embedding, dtype=np.float32)
+
+    if upsert:
+        keys = [(document.source, document.dataset) for document, _ in documents_with_chunks]
+        # Chunks are deleted by the ON DELETE CASCADE foreign key
+        db_session.execute(
+            delete(Document).where(tuple_(Document.source, Document.dataset).in_(keys))
+        )
+
+    mark_corpus_changed(db_session)
+    psycopg_connection = db_session.connection().connection.driver_connection
+    assert psycopg_connection
+    with psycopg_connection.cursor() as cur:
+        # Register the vector type on the cursor only, so other queries are unaffected
+        register_vector_info(cur, TypeInfo.fetch(psycopg_connection, "vector"))
+        bulk_ops.bulk_insert(
+            cur,
+            Document.__tablename__,
+            list(DOCUMENT_COPY_COLUMNS),
+            (document for document, _ in documents_with_chunks),
+            types=list(DOCUMENT_COPY_COLUMNS.values()),
+        )
+        bulk_ops.bulk_insert(
+            cur,
+            Chunk.__tablename__,
+            list(CHUNK_COPY_COLUMNS),
+            (chunk for _, chunks in documents_with_chunks for chunk in chunks),
+            types=list(CHUNK_COPY_COLUMNS.values()),
+        )
+
+
 def create_file_path(base_dir: str, common_base_url: str, source_url: str) -> str:
     assert common_base_url.endswith("/")
     relative_path = source_url.removeprefix(common_base_url)
@@ -210,7 +330,7 @@ def save_json(file_path: str, chunks: list[Chunk]) -> None:
         file.write("\n")
         for chunk in chunks:
             if not chunk.tokens:
-                chunk.tokens = app_config.embedding_model.token_length(chunk.content)
+                chunk.tokens = app_config.embedding_model.token_counter.count(chunk.content)
 
             file.write(f"---\nlength:   {chunk.tokens}\nheadings: {chunk.headings}\n---\n")
             file.write(chunk.content)
@@ -223,4 +343,4 @@ class DefaultChunkingConfig(ChunkingConfig):
         super().__init__(app_config.embedding_model.max_seq_length)
 
     def text_length(self, text: str) -> int:
-        return app_config.embedding_model.token_length(text)
+        return app_config.embedding_model.token_counter.count(text)
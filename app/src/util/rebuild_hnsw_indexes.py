@@ -0,0 +1,65 @@
+"""
+Rebuilds the HNSW indexes on chunk embeddings using app_config.hnsw_m and hnsw_ef_construction,
+which only take effect when an index is built. Each index is built concurrently under a new name
+and then swapped in, so retrieval keeps using the old index until the new one is ready.
+
+Usage: HNSW_M=32 HNSW_EF_CONSTRUCTION=128 python -m src.util.rebuild_hnsw_indexes
+"""
+
+import logging
+import re
+
+from sqlalchemy import text
+
+from src.adapters import db
+from src.app_config import app_config
+from src.db.models.document import QUANTIZED_EMBEDDING_INDEXES
+
+logger = logging.getLogger(__name__)
+
+HNSW_INDEXES = ["chunk_mpnet_embedding_idx", *QUANTIZED_EMBEDDING_INDEXES]
+
+
+def rebuild_hnsw_indexes(db_session: db.Session) -> list[str]:
+    "Rebuilds the existing HNSW_INDEXES and returns their names"
+    # CREATE INDEX CONCURRENTLY can't run in a transaction
+    connection = db_session.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+    index_definitions = connection.execute(
+        text(
+            "SELECT schemaname, indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND indexname = ANY(:names)"
+        ),
+        {"names": HNSW_INDEXES},
+    ).all()
+
+    storage_parameters = ", ".join(
+        f"{name} = {value:d}" for name, value in app_config.hnsw_index_options().items()
+    )
+    quote = connection.dialect.identifier_preparer.quote
+    for schema, name, definition in index_definitions:
+        new_name = f"{name}_rebuilt"
+        # e.g., CREATE INDEX name ON schema.chunk USING hnsw (...) WITH (m='16', ef_construction='64')
+        definition = definition.replace(
+            f"CREATE INDEX {name} ON", f"CREATE INDEX CONCURRENTLY {new_name} ON", 1
+        )
+        definition = re.sub(r" WITH \(.*\)$", "", definition) + f" WITH ({storage_parameters})"
+        logger.info("Rebuilding %s: %s", name, definition)
+        # e.g., left over from an interrupted rebuild
+        connection.execute(text(f"DROP INDEX IF EXISTS {quote(schema)}.{quote(new_name)}"))
+        connection.execute(text(definition))
+        connection.execute(text(f"DROP INDEX CONCURRENTLY {quote(schema)}.{quote(name)}"))
+        connection.execute(
+            text(f"ALTER INDEX {quote(schema)}.{quote(new_name)} RENAME TO {quote(name)}")
+        )
+    return [name for _, name, _ in index_definitions]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    with app_config.db_session() as db_session:
+        rebuilt = rebuild_hnsw_indexes(db_session)
+    logger.info("Rebuilt %d HNSW indexes with %s", len(rebuilt), app_config.hnsw_index_options())
+
+
+if __name__ == "__main__":
+    main()
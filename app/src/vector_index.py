@@ -0,0 +1,94 @@
+import logging
+import os
+import tempfile
+from typing import Any, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from src.db.models.document import ChunkData
+
+logger = logging.getLogger(__name__)
+
+# Retrieval filters and the document attribute that each one matches
+_FILTER_ATTRIBUTES = {"datasets": "dataset", "programs": "program", "regions": "region"}
+
+
+class NumpyVectorIndex:
+    """
+    In-process replica of the chunk embeddings that finds a query's top chunks with a single
+    matrix-vector product instead of a DB round trip, for corpora whose embeddings fit in memory.
+
+    The embeddings are stored in a memory-mapped file, so pages that aren't being searched can be
+    evicted by the OS rather than counting against the process's memory. Filters are applied using
+    boolean masks that are computed when the index is built.
+    Like pgvector's max_inner_product, search() returns negated inner products.
+    """
+
+    def __init__(
+        self,
+        chunks: Sequence[ChunkData],
+        embeddings: Sequence[Any],
+        corpus_version: str,
+        directory: str | None = None,
+    ):
+        """
+        Args:
+            chunks: Chunks to search, which are returned by search()
+            embeddings: Each chunk's embedding, in the same order as chunks
+            corpus_version: Version of the corpus that the chunks were loaded from;
+                            see src.retrieve.corpus_version()
+            directory: Where the memory-mapped file is created; defaults to the temp directory
+        """
+        self.chunks = list(chunks)
+        self.corpus_version = corpus_version
+        self._embeddings = _memory_mapped(np.asarray(embeddings, dtype=np.float32), directory)
+        # For each filter, a mask of the chunks whose document has each attribute value
+        self._masks: dict[str, dict[str | None, npt.NDArray[np.bool_]]] = {}
+        for filter_name, attribute in _FILTER_ATTRIBUTES.items():
+            values = np.array([getattr(chunk.document, attribute) for chunk in self.chunks])
+            self._masks[filter_name] = {value: values == value for value in set(values.tolist())}
+        logger.info("Built vector index of %d chunks (corpus %s)", len(self.chunks), corpus_version)
+
+    def search(
+        self, query_embedding: Any, retrieval_k: int, **filters: Sequence[str] | None
+    ) -> list[tuple[ChunkData, float]]:
+        "Returns the retrieval_k chunks with the highest inner product, with negated scores"
+        candidates = self._candidates(filters)
+        if not len(candidates) or retrieval_k <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = self._embeddings[candidates] @ query
+        k = min(retrieval_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.chunks[candidates[i]], -float(scores[i])) for i in top]
+
+    def _candidates(self, filters: dict[str, Sequence[str] | None]) -> npt.NDArray[np.intp]:
+        unknown_filters = filters.keys() - _FILTER_ATTRIBUTES.keys()
+        if unknown_filters:
+            raise ValueError(f"Unknown filters: {unknown_filters}")
+
+        mask = np.ones(len(self.chunks), dtype=bool)
+        for filter_name, values in filters.items():
+            # Empty filters aren't applied, like in the SQL query
+            if values:
+                masks = self._masks[filter_name]
+                mask &= np.any([masks[value] for value in values if value in masks], axis=0)
+        return np.flatnonzero(mask)
+
+
+def _memory_mapped(
+    embeddings: npt.NDArray[np.float32], directory: str | None
+) -> npt.NDArray[np.float32]:
+    if not embeddings.size:
+        return embeddings
+    file_descriptor, path = tempfile.mkstemp(suffix=".npy", dir=directory)
+    os.close(file_descriptor)
+    try:
+        np.save(path, embeddings)
+        return np.load(path, mmap_mode="r")
+    finally:
+        # The mapping stays valid after the file is removed, which frees it once it's unused
+        os.remove(path)
@@ -4,12 +4,16 @@ import _pytest.monkeypatch
 import boto3
 import moto
 import pytest
+from sqlalchemy import text
 
 import src.adapters.db as db
 import tests.src.db.models.factories as factories
 from src.app_config import AppConfig
+from src.chat_engine import IMAGINE_LA_INTENTS, ImagineLaEngine
 from src.db import models
-from src.db.models.document import ChunkWithScore
+from src.db.models.document import QUANTIZED_EMBEDDING_INDEXES, ChunkWithScore
+from src.intent_router import IntentRouter
+from src.retrieve import retrieval_cache
 from src.util.local import load_local_env_vars
 from tests.lib import db_testing
 from tests.mock.mock_embedding_model import MockEmbeddingModel
@@ -107,10 +111,43 @@ def enable_factory_create(monkeypatch, db_session) -> db.Session:
     return db_session
 
 
+@pytest.fixture
+def quantization_supported(db_session):
+    version = db_session.execute(
+        text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    ).scalar_one()
+    if tuple(int(part) for part in version.split(".")[:2]) < (0, 7):
+        pytest.skip(f"Quantized embeddings require pgvector 0.7+, not {version}")
+
+
+@pytest.fixture
+def quantized_indexes(db_session, quantization_supported):
+    # The test schema is created from the models, so it lacks the indexes created by migrations
+    for name, expression in QUANTIZED_EMBEDDING_INDEXES.items():
+        db_session.execute(text(f"CREATE INDEX {name} ON chunk USING hnsw ({expression})"))
+    db_session.commit()
+    yield
+    for name in QUANTIZED_EMBEDDING_INDEXES:
+        db_session.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    db_session.commit()
+
+
 @pytest.fixture
 def app_config(monkeypatch, db_client: db.DBClient):
     monkeypatch.setattr(AppConfig, "db_session", lambda _self: db_client.get_session())
+    monkeypatch.setattr(AppConfig, "async_db_session", lambda _self: db_client.get_async_session())
     monkeypatch.setattr(AppConfig, "embedding_model", MockEmbeddingModel())
+    # Tests change documents without committing them through ingestion, which would invalidate
+    # cached retrievals; see test_retrieve for tests of the cache
+    monkeypatch.setattr(retrieval_cache, "max_size", 0)
+
+
+@pytest.fixture(autouse=True)
+def intent_router(monkeypatch):
+    "Classifies messages using the mock embedding model instead of loading the real one"
+    router = IntentRouter(IMAGINE_LA_INTENTS, min_score=0.9, embedding_model=MockEmbeddingModel())
+    monkeypatch.setattr(ImagineLaEngine, "intent_router", router)
+    return router
 
 
 ####################
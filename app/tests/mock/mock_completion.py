@@ -1,3 +1,4 @@
+import asyncio
 import json
 from types import SimpleNamespace
 
@@ -26,3 +27,17 @@ def mock_completion(model, messages, **kwargs):
         return chunks
 
     return completion(model, messages, mock_response=mock_response)
+
+
+async def mock_acompletion(model, messages, **kwargs):
+    response = mock_completion(model, messages, **kwargs)
+    if not kwargs.get("stream", False):
+        return response
+
+    async def stream_chunks():
+        for chunk in response:
+            # Yield control to the event loop between chunks, like a real network stream would
+            await asyncio.sleep(0)
+            yield chunk
+
+    return stream_chunks()
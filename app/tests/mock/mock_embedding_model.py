@@ -75,3 +75,15 @@ class MockEmbeddingModel(EmbeddingModel):
         if isinstance(texts, str):
             return self._encode_one(texts)
         return [self._encode_one(text) for text in texts]
+
+
+class BagOfWordsEmbeddingModel(MockEmbeddingModel):
+    "Embeds texts by the words in them so that similar texts have similar embeddings"
+
+    def __init__(self, vocabulary: list[str]):
+        super().__init__(embedding_size=len(vocabulary) + 1)
+        self.vocabulary = vocabulary
+
+    def _encode_one(self, text: str) -> list[float]:
+        words = text.lower().replace("?", "").split()
+        return [float(words.count(word)) for word in self.vocabulary] + [0.1]
@@ -105,3 +105,29 @@ def test_bulk_upsert(db_session: db.Session):
         expected_objects = original_objects + updated_and_inserted_objects
         expected_objects.sort(key=operator.attrgetter("id"))
         assert records == expected_objects
+
+
+def test_bulk_insert(db_session: db.Session):
+    db_client = db.PostgresDBClient()
+    conn = db_client.get_raw_connection()
+
+    with conn.cursor(row_factory=rows.class_row(Number)) as cur:  # type: ignore
+        table = "temp_insert_table"
+        cur.execute(
+            sql.SQL("CREATE TEMP TABLE {table} (id TEXT NOT NULL, num INT)").format(
+                table=sql.Identifier(table)
+            )
+        )
+        text_objects = [get_random_number_object() for i in range(10)]
+        binary_objects = [get_random_number_object() for i in range(10)]
+
+        bulk_ops.bulk_insert(cur, table, ["id", "num"], text_objects)
+        bulk_ops.bulk_insert(cur, table, ["id", "num"], binary_objects, types=["text", "int4"])
+        conn.commit()
+
+        cur.execute(sql.SQL("SELECT id, num FROM {table}").format(table=sql.Identifier(table)))
+        records = cur.fetchall()
+        expected_objects = text_objects + binary_objects
+        assert sorted(records, key=operator.attrgetter("id")) == sorted(
+            expected_objects, key=operator.attrgetter("id")
+        )
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from src.embeddings.cache import CachedEmbeddingModel
+from tests.mock.mock_embedding_model import MockEmbeddingModel
+
+
+def _cached_model(**kwargs):
+    return CachedEmbeddingModel(MockEmbeddingModel(), "mock-model", **kwargs)
+
+
+def test_cached_embedding_model__caches_queries():
+    model = _cached_model()
+
+    with patch.object(model._model, "encode", wraps=model._model.encode) as encode:
+        first = model.encode("How do I apply for CalFresh?")
+        # Queries differing only by whitespace share an entry
+        second = model.encode("  How do I apply   for CalFresh? ")
+        model.encode("Another question")
+
+    assert first == second == MockEmbeddingModel().encode("How do I apply for CalFresh?")
+    assert encode.call_count == 2
+    assert model.cache_info() == {"hits": 1, "misses": 2, "size": 2, "max_size": 1024}
+
+
+def test_cached_embedding_model__does_not_cache_lists():
+    model = _cached_model()
+    texts = ["First sentence.", "Second sentence."]
+
+    assert model.encode(texts) == MockEmbeddingModel().encode(texts)
+    assert model.encode(texts) == MockEmbeddingModel().encode(texts)
+    assert model.cache_info()["size"] == 0
+    assert model.max_seq_length == 512
+    assert model.token_length("two words") == 2
+
+
+def test_cached_embedding_model__evicts_least_recently_used():
+    model = _cached_model(max_size=2)
+
+    model.encode("a")
+    model.encode("bb")
+    model.encode("a")
+    model.encode("ccc")
+
+    assert model.cache_info()["size"] == 2
+    model.encode("a")
+    assert model.hits == 2
+    model.encode("bb")
+    assert model.misses == 4
+
+
+def test_cached_embedding_model__thread_safe():
+    model = _cached_model(max_size=10)
+    queries = [f"question {i % 20}" for i in range(200)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        embeddings = list(executor.map(model.encode, queries))
+
+    assert embeddings == [MockEmbeddingModel().encode(query) for query in queries]
+    assert model.hits + model.misses == 200
+    assert model.cache_info()["size"] == 10
+
+
+def test_cached_embedding_model__persists_to_disk(tmp_path):
+    cache_path = str(tmp_path / "embeddings.pickle")
+    model = _cached_model(cache_path=cache_path)
+    embedding = model.encode("persisted query")
+    model.save()
+
+    reloaded = _cached_model(cache_path=cache_path)
+    assert reloaded.encode("persisted query") == embedding
+    assert reloaded.cache_info()["hits"] == 1
+
+    # Entries for a different model are not reused
+    other_model = CachedEmbeddingModel(MockEmbeddingModel(), "other-model", cache_path=cache_path)
+    assert other_model.cache_info()["size"] == 0
+
+
+def test_cached_embedding_model__ignores_corrupt_cache_file(tmp_path):
+    cache_path = tmp_path / "embeddings.pickle"
+    cache_path.write_bytes(b"not a pickle")
+
+    model = _cached_model(cache_path=str(cache_path))
+
+    assert model.cache_info()["size"] == 0
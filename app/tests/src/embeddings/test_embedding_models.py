@@ -1,3 +1,18 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from openai import NOT_GIVEN
+
+from src.embeddings import cohere, openai, sentence_transformer
+from src.embeddings.cohere import CohereEmbedding
+from src.embeddings.model import truncate_embeddings
+from src.embeddings.openai import OpenAIEmbedding
+from src.embeddings.sentence_transformer import (
+    SentenceTransformerEmbedding,
+    export_quantized_onnx_model,
+)
+from src.util.embedding_benchmark import cosine_similarities
 from tests.mock.mock_embedding_model import MockEmbeddingModel
 
 
@@ -37,3 +52,126 @@ def test_mock_embedding_model():
     # Check deterministic behavior - same text should always produce same embedding
     assert model.encode(text1) == emb1
     assert model.encode(text2) == emb2
+
+
+def test_truncate_embeddings():
+    embeddings = truncate_embeddings([[3.0, 4.0, 12.0], [0.0, 2.0, 1.0]], 2)
+
+    assert embeddings == [pytest.approx([0.6, 0.8]), pytest.approx([0.0, 1.0])]
+
+
+class _FakeOpenAIEmbeddings:
+    def __init__(self):
+        self.kwargs = {}
+
+    def create(self, **kwargs):
+        self.kwargs = kwargs
+        dimensions = kwargs["dimensions"] or 1536
+        return SimpleNamespace(
+            data=[SimpleNamespace(embedding=[0.1] * dimensions) for _ in kwargs["input"]]
+        )
+
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    embeddings = _FakeOpenAIEmbeddings()
+    monkeypatch.setattr(openai, "OpenAI", lambda: SimpleNamespace(embeddings=embeddings))
+    monkeypatch.setattr(openai.tiktoken, "get_encoding", lambda name: None)
+    return embeddings
+
+
+def test_openai_embedding_dimensions(fake_openai):
+    assert len(OpenAIEmbedding("text-embedding-3-small", 768).encode("text")) == 768
+    assert fake_openai.kwargs["dimensions"] == 768
+
+    # Full-size embeddings are requested without the dimensions option
+    OpenAIEmbedding("text-embedding-3-small", 1536).encode(["text"])
+    assert fake_openai.kwargs["dimensions"] is NOT_GIVEN
+
+    with pytest.raises(ValueError):
+        OpenAIEmbedding("text-embedding-ada-002", 768)
+    with pytest.raises(ValueError):
+        OpenAIEmbedding("text-embedding-3-small", 3072)
+
+
+class _FakeCohereClient:
+    def __init__(self):
+        self.kwargs = {}
+
+    def embed(self, **kwargs):
+        self.kwargs = kwargs
+        dimensions = kwargs.get("output_dimension", 1536)
+        float_ = [[1.0] * dimensions for _ in kwargs["texts"]]
+        return SimpleNamespace(embeddings=SimpleNamespace(float_=float_))
+
+
+@pytest.fixture
+def fake_cohere(monkeypatch):
+    client = _FakeCohereClient()
+    monkeypatch.setattr(cohere.cohere, "ClientV2", lambda: client)
+    return client
+
+
+def test_cohere_embedding_dimensions(fake_cohere):
+    assert len(CohereEmbedding("embed-v4.0", 512).encode("text")) == 512
+    assert fake_cohere.kwargs["output_dimension"] == 512
+
+    # Sizes that the API doesn't support are truncated from the next larger size
+    embedding = CohereEmbedding("embed-v4.0", 768).encode("text")
+    assert fake_cohere.kwargs["output_dimension"] == 1024
+    assert len(embedding) == 768
+    assert np.linalg.norm(embedding) == pytest.approx(1.0)
+
+    CohereEmbedding("embed-v4.0").encode("text")
+    assert "output_dimension" not in fake_cohere.kwargs
+
+    with pytest.raises(ValueError):
+        CohereEmbedding("embed-v4.0", 2048)
+
+
+class FakeSentenceTransformer:
+    def __init__(self, model_name, **kwargs):
+        self.kwargs = kwargs
+
+    def get_sentence_embedding_dimension(self):
+        return 768
+
+
+def test_sentence_transformer_backend_arguments(monkeypatch):
+    monkeypatch.setattr(sentence_transformer, "SentenceTransformer", FakeSentenceTransformer)
+
+    # sentence-transformers before 3.2 doesn't accept backend or model_kwargs
+    model = SentenceTransformerEmbedding("model", onnx_file_name="onnx/model_qint8_avx2.onnx")
+    assert model._model.kwargs == {}
+
+    model = SentenceTransformerEmbedding("model", backend="onnx")
+    assert model._model.kwargs == {"backend": "onnx"}
+
+    model = SentenceTransformerEmbedding(
+        "model", backend="onnx", onnx_file_name="onnx/model_qint8_avx2.onnx"
+    )
+    assert model._model.kwargs == {
+        "backend": "onnx",
+        "model_kwargs": {"file_name": "onnx/model_qint8_avx2.onnx"},
+    }
+
+
+def test_onnx_embeddings_match_torch(tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("optimum.onnxruntime")
+    from sentence_transformers import SentenceTransformer
+
+    # A small model, saved locally since quantized models are saved to the model's directory
+    model_path = str(tmp_path / "model")
+    SentenceTransformer("sentence-transformers/paraphrase-MiniLM-L3-v2").save(model_path)
+    texts = ["How do I apply for CalFresh?", "Household income limits for seniors " * 20]
+    torch_embeddings = SentenceTransformerEmbedding(model_path).encode(texts)
+
+    onnx_embeddings = SentenceTransformerEmbedding(model_path, backend="onnx").encode(texts)
+    assert cosine_similarities(torch_embeddings, onnx_embeddings).min() > 0.999
+
+    onnx_file_name = export_quantized_onnx_model(model_path, "avx2")
+    quantized_embeddings = SentenceTransformerEmbedding(
+        model_path, backend="onnx", onnx_file_name=onnx_file_name
+    ).encode(texts)
+    assert cosine_similarities(torch_embeddings, quantized_embeddings).min() > 0.95
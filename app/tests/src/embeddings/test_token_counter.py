@@ -0,0 +1,78 @@
+from unittest.mock import patch
+
+from src.app_config import app_config as app_config_for_test
+from src.db.models.document import Chunk
+from src.embeddings.cache import CachedEmbeddingModel
+from src.embeddings.token_counter import TokenCounter
+from src.ingester import Split
+from src.util.ingest_utils import add_embeddings
+from tests.mock.mock_embedding_model import MockEmbeddingModel
+
+
+def _word_counts(texts):
+    return [len(text.split()) for text in texts]
+
+
+def test_token_counter__memoizes_counts():
+    with patch(__name__ + "._word_counts", wraps=_word_counts) as token_lengths:
+        counter = TokenCounter(token_lengths)
+        assert counter.count("one two") == 2
+        assert counter.count("one two") == 2
+        assert counter.count_batch(["one two", "three", "four five six", "three"]) == [2, 1, 3, 1]
+
+    # Only texts that weren't counted before are tokenized, each one once
+    assert [call.args[0] for call in token_lengths.call_args_list] == [
+        ["one two"],
+        ["three", "four five six"],
+    ]
+    assert counter.cache_info() == {"hits": 2, "misses": 3, "size": 3, "max_size": 200_000}
+
+    counter.clear()
+    assert counter.cache_info()["size"] == 0
+
+
+def test_token_counter__evicts_least_recently_used():
+    counter = TokenCounter(_word_counts, max_size=2)
+
+    counter.count("a")
+    counter.count("b b")
+    counter.count("a")
+    counter.count("c c c")
+
+    assert counter.cache_info()["size"] == 2
+    counter.count("a")
+    assert counter.hits == 2
+    counter.count("b b")
+    assert counter.misses == 4
+
+
+def test_token_counter__prime():
+    counter = TokenCounter(_word_counts)
+    counter.prime(["one two", "three"], [5, 1])
+
+    # Primed counts are used instead of tokenizing the texts
+    assert counter.count_batch(["one two", "three", "four"]) == [5, 1, 1]
+    assert counter.cache_info() == {"hits": 2, "misses": 1, "size": 3, "max_size": 200_000}
+
+
+def test_embedding_model_token_counter():
+    model = MockEmbeddingModel()
+    assert model.token_counter is model.token_counter
+    assert model.token_counter.count_batch(["one two", "three"]) == model.token_lengths(
+        ["one two", "three"]
+    )
+
+    # The cache shares the wrapped model's counts
+    assert CachedEmbeddingModel(model, "mock-model").token_counter is model.token_counter
+
+
+def test_split_and_add_embeddings_tokenize_once(app_config):
+    split = Split(["Heading"], "Some text", "Heading")
+    chunk = Chunk(content=split.text, tokens=split.token_count)
+    add_embeddings([chunk], [split.text_to_encode])
+
+    assert chunk.tokens == 3
+    # add_embeddings() reuses the count from when the Split was created
+    token_counter = app_config_for_test.embedding_model.token_counter
+    assert token_counter.cache_info()["misses"] == 1
+    assert token_counter.cache_info()["hits"] == 1
@@ -29,8 +29,18 @@ def mock_git_commit():
 def mock_retrieval_func(test_document):
     """Mock the create_retrieval_function."""
     retrieval_func = create_mock_retrieval_func(test_document)
-    with mock.patch(
-        "src.evaluation.cli.evaluate.create_retrieval_function", return_value=retrieval_func
+
+    def batch_retrieval_func(queries, k):
+        return [retrieval_func(query, k) for query in queries]
+
+    with (
+        mock.patch(
+            "src.evaluation.cli.evaluate.create_retrieval_function", return_value=retrieval_func
+        ),
+        mock.patch(
+            "src.evaluation.cli.evaluate.create_batch_retrieval_function",
+            return_value=batch_retrieval_func,
+        ),
     ):
         yield retrieval_func
 
@@ -179,6 +189,8 @@ def test_create_parser():
     assert args.qa_pairs_version is None
     assert isinstance(args.output_dir, Path)
     assert args.min_score == -1.0
+    assert args.exact_search is False
+    assert args.filter_retrieval is False
     assert args.sampling is None
     assert args.random_seed is None
     assert args.commit is None
@@ -352,6 +364,8 @@ def test_argument_parsing():
             "0.1",
             "--random-seed",
             "42",
+            "--exact-search",
+            "--filter-retrieval",
         ]
     )
     assert args.dataset == ["ca_ftb", "la_policy"]
@@ -359,6 +373,8 @@ def test_argument_parsing():
     assert args.min_score == 0.5
     assert args.sampling == 0.1
     assert args.random_seed == 42
+    assert args.exact_search is True
+    assert args.filter_retrieval is True
 
 
 def validate_positive_int(value):
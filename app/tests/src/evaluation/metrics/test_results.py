@@ -8,6 +8,7 @@ import pytest
 from src.db.models.document import ChunkWithScore
 from src.evaluation.data_models import EvaluationResult, ExpectedChunk, RetrievedChunk
 from src.evaluation.metrics.results import (
+    RETRIEVAL_BATCH_SIZE,
     batch_process_results,
     generate_qa_pair_id,
     process_retrieved_chunks,
@@ -183,3 +184,27 @@ def test_batch_process_results(test_document, test_question, enable_factory_crea
     assert results[0].question == test_question["question"]
     assert results[0].retrieval_time_ms > 0
     assert results[0].correct_chunk_retrieved is True
+
+
+def test_batch_process_results_with_batch_retrieval_func(test_document, test_question):
+    """Test that questions are retrieved in batches if a batch retrieval function is provided."""
+    questions = [
+        {**test_question, "question": f"question {i}?"} for i in range(RETRIEVAL_BATCH_SIZE + 1)
+    ]
+    batches = []
+
+    def batch_retrieval_func(queries: list[str], k: int):
+        batches.append(queries)
+        return [[ChunkWithScore(chunk=test_document.chunks[0], score=0.85)] for _ in queries]
+
+    def retrieval_func(query: str, k: int):
+        raise AssertionError("Should not be called")
+
+    results = batch_process_results(
+        questions, retrieval_func, 1, batch_retrieval_func=batch_retrieval_func
+    )
+
+    assert [len(batch) for batch in batches] == [RETRIEVAL_BATCH_SIZE, 1]
+    assert [result.question for result in results] == [q["question"] for q in questions]
+    assert all(result.correct_chunk_retrieved for result in results)
+    assert all(result.retrieval_time_ms > 0 for result in results)
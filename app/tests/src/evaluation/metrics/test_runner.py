@@ -10,7 +10,12 @@ from unittest.mock import patch
 import pytest
 
 from src.db.models.document import ChunkWithScore
-from src.evaluation.metrics.runner import EvaluationRunner, run_evaluation
+from src.evaluation.metrics.runner import (
+    EvaluationRunner,
+    create_batch_retrieval_function,
+    create_retrieval_function,
+    run_evaluation,
+)
 from tests.src.db.models.factories import ChunkFactory, DocumentFactory
 
 
@@ -103,6 +108,18 @@ def find_log_files(log_dir: Path) -> tuple[Path, Path, Path]:
     return batch_file, results_file, metrics_file
 
 
+def test_create_retrieval_functions_with_datasets():
+    """Test that retrieval functions filter by the given datasets."""
+    with patch("src.evaluation.metrics.runner.retrieve_with_scores") as retrieve_with_scores:
+        create_retrieval_function(datasets=["CA EDD"])("question", 5)
+    assert retrieve_with_scores.call_args.kwargs["datasets"] == ["CA EDD"]
+
+    with patch("src.evaluation.metrics.runner.retrieve_many") as retrieve_many:
+        create_batch_retrieval_function(exact_search=True)(["question"], 5)
+    assert retrieve_many.call_args.kwargs["datasets"] is None
+    assert retrieve_many.call_args.kwargs["exact_search"] is True
+
+
 def test_evaluation_runner_init(test_document):
     """Test EvaluationRunner initialization."""
     retrieval_func = create_mock_retrieval_func(test_document)
@@ -161,6 +178,61 @@ def test_run_evaluation_batch(
         assert "overall_metrics" in metrics_data
 
 
+def test_run_evaluation_batch_with_batch_retrieval_func(
+    test_document, test_questions_csv, tmp_path, mock_git_commit, mock_datetime
+):
+    """Test that the batch retrieval function is used for all questions if provided."""
+    retrieval_func = create_mock_retrieval_func(test_document)
+    batch_calls = []
+
+    def batch_retrieval_func(queries, k):
+        batch_calls.append((queries, k))
+        return [retrieval_func(query, k) for query in queries]
+
+    log_dir = tmp_path / "eval_logs"
+    runner = EvaluationRunner(retrieval_func, str(log_dir), batch_retrieval_func)
+
+    questions = runner.load_questions(test_questions_csv)
+    runner.run_evaluation_batch(questions, k=5)
+
+    assert batch_calls == [(["test question 1?", "test question 2?"], 5)]
+    _, results_file, _ = find_log_files(log_dir)
+    with open(results_file) as f:
+        results = [line for line in f if line.strip()]
+        assert len(results) == 2
+
+
+def test_run_evaluation_retrieves_once_for_all_k_values(
+    test_document, test_questions_csv, tmp_path, mock_git_commit, mock_datetime
+):
+    """Test that chunks are retrieved once at the largest k and sliced for smaller k values."""
+    other_chunks = [ChunkFactory.build(document=test_document) for _ in range(4)]
+    retrieval_calls = []
+
+    def retrieval_func(query: str, k: int):
+        retrieval_calls.append((query, k))
+        chunks = other_chunks + test_document.chunks
+        return [ChunkWithScore(chunk=chunk, score=0.85) for chunk in chunks[:k]]
+
+    log_dir = tmp_path / "eval_logs"
+    runner = EvaluationRunner(retrieval_func, str(log_dir))
+    runner.run_evaluation(questions_file=test_questions_csv, k_values=[2, 5])
+
+    assert retrieval_calls == [("test question 1?", 5), ("test question 2?", 5)]
+
+    # Separate batch logs are still written for each k, with results sliced to k
+    retrieved_counts_by_k = {}
+    for batch_file in (log_dir / "2024-01-01").glob("batch_*.json"):
+        with open(batch_file) as f:
+            k = json.load(f)["evaluation_config"]["k_value"]
+        results_file = batch_file.with_name(batch_file.name.replace("batch_", "results_") + "l")
+        with open(results_file) as f:
+            results = [json.loads(line) for line in f if line.strip()]
+        retrieved_counts_by_k[k] = [len(result["retrieved_chunks"]) for result in results]
+
+    assert retrieved_counts_by_k == {2: [2, 2], 5: [5, 5]}
+
+
 def test_run_evaluation_with_filtering(
     test_document, test_questions_csv, tmp_path, mock_git_commit, mock_datetime
 ):
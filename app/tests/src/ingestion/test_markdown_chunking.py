@@ -31,6 +31,17 @@ def test_chunk_tree(markdown_text, prepped_tree):  # noqa: F811
     logger.info(prepped_tree.format())
     logger.info(pformat(chunks, width=140))
     assert len(chunks) == 8
+    # Guards against changes in how the tree is traversed while gradually chunking it
+    assert [(chunk.id, chunk.length) for chunk in chunks] == [
+        ("0:D_1", 126),
+        ("1:D_1", 161),
+        ("2:T_28[0]:P_26", 135),
+        ("3:T_28[1]:TR_31", 136),
+        ("4:T_28[2]:TR_32", 136),
+        ("5:P_38", 145),
+        ("6:_S3_36", 174),
+        ("7:D_1", 54),
+    ]
 
     for chunk in chunks:
         assert chunk.length <= config.max_length
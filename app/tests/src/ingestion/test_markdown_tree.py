@@ -539,6 +539,24 @@ def test_remove_children(caplog, tiny_tree):
         assert any("found only ['LI_8']" in msg for msg in caplog.messages)
 
 
+def test_cached_rendering_is_invalidated(tiny_tree):
+    doc_node = copy_subtree("TINY", tiny_tree.first_child())
+    list_node = doc_node.tree["L_7"]
+    assert "* Item 2" in render_subtree_as_md(doc_node)
+    assert list_node.rendered_md == "* Item 1\n* Item 2\n\n"
+
+    # Modifying a node clears the cached rendering of the node and its ancestors
+    list_node.last_child().remove()
+    assert list_node.rendered_md is None
+    assert doc_node.rendered_md is None
+    md = render_subtree_as_md(doc_node)
+    assert "* Item 1" in md
+    assert "* Item 2" not in md
+    # Rendering uses the cache only for copied trees, like those used for chunking
+    assert render_subtree_as_md(tiny_tree["L_7"]) == "* Item 1\n* Item 2\n\n"
+    assert tiny_tree["L_7"].rendered_md is None
+
+
 @pytest.fixture
 def str_tree():
     tree = Tree("test tree")
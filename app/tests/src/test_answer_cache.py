@@ -0,0 +1,56 @@
+import pytest
+
+from src.answer_cache import AnswerCache, AnswerCacheKey, CachedAnswer
+from src.generate import MessageAttributes
+from tests.mock.mock_embedding_model import BagOfWordsEmbeddingModel
+
+KEY = AnswerCacheKey("imagine-la", "settings", "gpt-4o", "corpus-1")
+
+
+def _answer(question, response="Apply online."):
+    attributes = MessageAttributes(needs_context=True, users_language="en", translated_message="")
+    return CachedAnswer(question, response, "system prompt", attributes, [], [])
+
+
+@pytest.fixture
+def cache():
+    embedding_model = BagOfWordsEmbeddingModel(["apply", "calfresh", "medi-cal", "renew"])
+    return AnswerCache(max_size=2, min_score=0.95, embedding_model=embedding_model)
+
+
+def test_get__similar_question(cache):
+    assert cache.get(KEY, "How do I apply for CalFresh?") is None
+
+    answer = _answer("How do I apply for CalFresh?")
+    cache.put(KEY, answer)
+    assert cache.get(KEY, "  How do I apply for CalFresh?") is answer
+    assert cache.get(KEY, "how can I apply for calfresh") is answer
+    assert cache.get(KEY, "How do I apply for Medi-Cal?") is None
+
+    assert cache.cache_info() == {"hits": 2, "misses": 2, "size": 1, "max_size": 2}
+
+
+def test_get__other_key(cache):
+    cache.put(KEY, _answer("How do I apply for CalFresh?"))
+    assert cache.get(KEY._replace(settings_hash="other"), "How do I apply for CalFresh?") is None
+    assert cache.get(KEY._replace(llm="other"), "How do I apply for CalFresh?") is None
+
+
+def test_get__new_corpus_version(cache):
+    cache.put(KEY, _answer("How do I apply for CalFresh?"))
+    new_key = KEY._replace(corpus_version="corpus-2")
+    assert cache.get(new_key, "How do I apply for CalFresh?") is None
+    # Answers for the old corpus version are dropped
+    assert cache.cache_info()["size"] == 0
+    assert cache.get(KEY, "How do I apply for CalFresh?") is None
+
+
+def test_put__evicts_least_recently_used(cache):
+    cache.put(KEY, _answer("How do I apply for CalFresh?"))
+    cache.put(KEY, _answer("How do I apply for Medi-Cal?"))
+    assert cache.get(KEY, "How do I apply for CalFresh?")
+
+    cache.put(KEY, _answer("How do I renew CalFresh?"))
+    assert cache.get(KEY, "How do I apply for CalFresh?")
+    assert cache.get(KEY, "How do I renew CalFresh?")
+    assert cache.get(KEY, "How do I apply for Medi-Cal?") is None
@@ -0,0 +1,34 @@
+import pytest
+
+import src.app_config
+from src.app_config import app_config as app_config_instance
+
+
+def test_check_embedding_dimension(app_config, monkeypatch):
+    app_config_instance.check_embedding_dimension()
+
+    monkeypatch.setattr(app_config_instance, "embedding_dimension", 384)
+    with pytest.raises(ValueError, match="Chunk.mpnet_embedding has 768 dimensions"):
+        app_config_instance.check_embedding_dimension()
+
+    # As if the model changed without migrating the DB
+    monkeypatch.setattr(src.app_config, "EMBEDDING_DIMENSION", 384)
+    with pytest.raises(ValueError, match="column in the DB has 768 dimensions"):
+        app_config_instance.check_embedding_dimension()
+
+
+def test_check_quantized_embedding_index(app_config, monkeypatch):
+    app_config_instance.check_quantized_embedding_index()
+
+    # The test schema is created from the models, which don't have the quantized indexes
+    monkeypatch.setattr(app_config_instance, "retrieval_quantization", "halfvec")
+    with pytest.raises(ValueError, match="no valid chunk_mpnet_embedding_halfvec_idx index"):
+        app_config_instance.check_quantized_embedding_index()
+
+
+@pytest.mark.parametrize("quantization", ["halfvec", "binary"])
+def test_check_quantized_embedding_index__exists(
+    app_config, monkeypatch, quantized_indexes, quantization
+):
+    monkeypatch.setattr(app_config_instance, "retrieval_quantization", quantization)
+    app_config_instance.check_quantized_embedding_index()
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from types import SimpleNamespace
 
 import pytest
 from fastapi import HTTPException
@@ -20,7 +21,7 @@ from src.chat_api import (
 )
 from src.chat_engine import ImagineLA_MessageAttributes, OnMessageResult
 from src.citations import CitationFactory, split_into_subsections
-from src.db.models.conversation import Feedback, Step, Thread, User
+from src.db.models.conversation import ChatMessage, Feedback, Step, Thread, User
 from src.generate import MessageAttributes
 from tests.src.db.models.factories import ChunkFactory, UserSessionFactory
 from tests.src.test_chainlit_data import clear_data_layer_data
@@ -353,7 +354,7 @@ def subsections():
 @pytest.mark.asyncio
 async def test_run_query__1_citation(subsections):
     class MockChatEngine:
-        def on_message(self, question, chat_history):
+        async def on_message_async(self, question, chat_history):
             return OnMessageResult(
                 "Response from LLM (citation-2)",
                 "Some system prompt",
@@ -373,7 +374,7 @@ async def test_run_query__1_citation(subsections):
 @pytest.mark.asyncio
 async def test_run_query__2_citations(subsections):
     class MockChatEngine:
-        def on_message(self, question, chat_history):
+        async def on_message_async(self, question, chat_history):
             return OnMessageResult(
                 "Response from LLM (citation-2)(citation-3)",
                 "Some system prompt",
@@ -403,7 +404,7 @@ async def test_run_query__2_citations(subsections):
 @pytest.mark.asyncio
 async def test_run_query__unknown_citation(subsections, caplog):
     class MockChatEngine:
-        def on_message(self, question, chat_history):
+        async def on_message_async(self, question, chat_history):
             return OnMessageResult(
                 "Response from LLM (citation-2)(citation-44)",
                 "Some system prompt",
@@ -548,11 +549,6 @@ async def test_query_stream_basic(async_client, monkeypatch, db_session):
 
     monkeypatch.setattr(chat_api, "get_chat_engine", lambda session: MockEngine())
 
-    async def mock_run_query(engine, question, chat_history, streaming=True):
-        return QueryResponse(response_text="final", alert_message=None, citations=[]), {}
-
-    monkeypatch.setattr(chat_api, "run_query", mock_run_query)
-
     # Initialize streaming query
     init_response = await async_client.post(
         "/api/query_init",
@@ -574,8 +570,12 @@ async def test_query_stream_basic(async_client, monkeypatch, db_session):
     assert "event: chunk" in events
     assert "data: hello " in events
     assert "data: world" in events
+    assert "event: remapped_response" in events
+    assert "data: hello world" in events
     assert "event: done" in events
-    assert any("final" in line for line in events), f"Events: {events}"
+    assert any(
+        line.startswith("data: {") and "hello world" in line for line in events
+    ), f"Events: {events}"
 
 
 @pytest.mark.asyncio
@@ -599,11 +599,6 @@ async def test_query_stream_with_alert(async_client, monkeypatch, db_session):
 
     monkeypatch.setattr(chat_api, "get_chat_engine", lambda session: MockEngine())
 
-    async def mock_run_query(engine, question, chat_history, streaming=True):
-        return QueryResponse(response_text="done", alert_message="ALERT!", citations=[]), {}
-
-    monkeypatch.setattr(chat_api, "run_query", mock_run_query)
-
     # Initialize streaming query
     init_response = await async_client.post(
         "/api/query_init",
@@ -631,3 +626,98 @@ async def test_query_stream_with_alert(async_client, monkeypatch, db_session):
     assert "event: chunk" in events
     assert "data: data1" in events
     assert "event: done" in events
+
+
+@pytest.mark.asyncio
+async def test_query_stream__client_disconnects(async_client, monkeypatch, db_session):
+    closed = []
+
+    class MockEngine:
+        async def on_message_streaming(self, question, chat_history):
+            async def gen():
+                try:
+                    yield "hello "
+                    yield "world"
+                finally:
+                    closed.append(True)
+
+            attributes = MessageAttributes(
+                needs_context=False, users_language="en", translated_message=""
+            )
+            return gen(), attributes, []
+
+    monkeypatch.setattr(chat_api, "get_chat_engine", lambda session: MockEngine())
+    is_disconnected_results = iter([False, True])
+
+    async def is_disconnected(_request):
+        return next(is_disconnected_results, True)
+
+    monkeypatch.setattr(chat_api.Request, "is_disconnected", is_disconnected)
+
+    init_response = await async_client.post(
+        "/api/query_init",
+        json={"user_id": "user4", "session_id": "session4", "new_session": True, "message": "Hi"},
+    )
+    message_id = init_response.json()["message_id"]
+
+    url = f"/api/query_stream?id={message_id}&user_id=user4&session_id=session4"
+    async with async_client.stream("GET", url) as response:
+        events = [line async for line in response.aiter_lines() if line.strip()]
+
+    assert "data: hello " in events
+    assert "data: world" not in events
+    # The partial response isn't sent or saved as the final answer
+    assert "event: remapped_response" not in events
+    assert "event: done" not in events
+    assert closed == [True]
+    roles = db_session.execute(
+        select(ChatMessage.role).where(ChatMessage.session_id == "session4")
+    ).scalars()
+    assert list(roles) == ["user"]
+
+
+@pytest.mark.asyncio
+async def test_query_stream_calls_llm_once_per_prompt(async_client, monkeypatch, db_session):
+    llm_calls = []
+
+    async def mock_acompletion(model, messages, **kwargs):
+        llm_calls.append(kwargs)
+        if "response_format" in kwargs:
+            # Response to analyze_message, which the Imagine LA engine streams
+            content = ImagineLA_MessageAttributes(
+                needs_context=False,
+                users_language="en",
+                translated_message="",
+                benefit_program="",
+                canned_response="",
+                alert_message="",
+            ).model_dump_json()
+            chunks = [content[:20], content[20:]]
+        else:
+            chunks = ["Streamed ", "answer"]
+
+        async def stream_chunks():
+            for chunk in chunks:
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))]
+                )
+
+        return stream_chunks()
+
+    monkeypatch.setattr("src.generate.acompletion", mock_acompletion)
+
+    init_response = await async_client.post(
+        "/api/query_init",
+        json={"user_id": "user3", "session_id": "session3", "new_session": True, "message": "Hi"},
+    )
+    message_id = init_response.json()["message_id"]
+
+    url = f"/api/query_stream?id={message_id}&user_id=user3&session_id=session3"
+    async with async_client.stream("GET", url) as response:
+        events = [line async for line in response.aiter_lines() if line.strip()]
+
+    assert "event: done" in events
+    assert "data: Streamed answer" in events
+    # One call to analyze the message (system_prompt_1) and one streaming call (system_prompt_2)
+    assert len(llm_calls) == 2
+    assert ["response_format" in call for call in llm_calls] == [True, False]
@@ -1,7 +1,35 @@
+import asyncio
+
 import pytest
 
 from src import chat_engine
-from src.chat_engine import CaEddWebEngine, ImagineLA_MessageAttributes, ImagineLaEngine
+from src.answer_cache import AnswerCache
+from src.chat_engine import BaseEngine, CaEddWebEngine, ImagineLA_MessageAttributes, ImagineLaEngine
+from src.db.models.document import ChunkWithScore
+from src.generate import MessageAttributes
+from src.intent_router import Intent, IntentRouter
+from tests.mock.mock_embedding_model import BagOfWordsEmbeddingModel, MockEmbeddingModel
+from tests.src.db.models.factories import ChunkFactory
+
+
+def mock_async(return_value):
+    async def mock_async_fn(*_args, **_kwargs):
+        return return_value
+
+    return mock_async_fn
+
+
+def mock_analysis_stream(attributes, chunk_size=8, delay=0.0):
+    "Mocks analyze_message_streaming_async() to stream the attributes as JSON in small chunks"
+    response = attributes.model_dump_json()
+
+    async def analyze_message_streaming_async(*_args, **_kwargs):
+        for i in range(0, len(response), chunk_size):
+            if delay:
+                await asyncio.sleep(delay)
+            yield response[i : i + chunk_size]
+
+    return analyze_message_streaming_async
 
 
 def test_available_engines():
@@ -110,26 +138,30 @@ def test_on_message_Imagine_LA_needs_context_False(monkeypatch):
 async def test_on_message_streaming_Imagine_LA_canned_response(monkeypatch):
     monkeypatch.setattr(
         chat_engine,
-        "analyze_message",
-        lambda *_, **_kw: ImagineLA_MessageAttributes(
-            needs_context=True,
-            users_language="en",
-            translated_message="",
-            benefit_program="",
-            canned_response="This is a canned response",
-            alert_message="",
+        "analyze_message_streaming_async",
+        mock_analysis_stream(
+            ImagineLA_MessageAttributes(
+                needs_context=True,
+                users_language="en",
+                translated_message="",
+                benefit_program="",
+                canned_response="This is a canned response",
+                alert_message="",
+            )
         ),
     )
 
     engine = chat_engine.create_engine("imagine-la")
     generator, attributes, subsections = await engine.on_message_streaming("What is AI?")
 
-    # For canned responses, we should get the exact response in a single chunk
+    # The canned response is streamed as it arrives from analyze_message
     chunks = []
     async for chunk in generator:
         chunks.append(chunk)
 
-    assert chunks == ["This is a canned response"]
+    assert len(chunks) > 1
+    assert "".join(chunks) == "This is a canned response"
+    assert attributes.canned_response == "This is a canned response"
     assert not attributes.benefit_program
     assert not attributes.alert_message
     assert not subsections
@@ -139,14 +171,16 @@ async def test_on_message_streaming_Imagine_LA_canned_response(monkeypatch):
 async def test_on_message_streaming_Imagine_LA_with_context(monkeypatch):
     monkeypatch.setattr(
         chat_engine,
-        "analyze_message",
-        lambda *_, **_kw: ImagineLA_MessageAttributes(
-            needs_context=True,
-            users_language="en",
-            translated_message="",
-            benefit_program="CalFresh",
-            canned_response="",
-            alert_message="Some alert message",
+        "analyze_message_streaming_async",
+        mock_analysis_stream(
+            ImagineLA_MessageAttributes(
+                needs_context=True,
+                users_language="en",
+                translated_message="",
+                benefit_program="CalFresh",
+                canned_response="",
+                alert_message="Some alert message",
+            )
         ),
     )
 
@@ -158,7 +192,7 @@ async def test_on_message_streaming_Imagine_LA_with_context(monkeypatch):
 
     monkeypatch.setattr(chat_engine, "generate_streaming_async", mock_generate_streaming)
     # Mock retrieval to return empty results (but still exercise the code path)
-    monkeypatch.setattr(chat_engine, "retrieve_with_scores", lambda *_, **_kw: [])
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_async([]))
 
     engine = chat_engine.create_engine("imagine-la")
     generator, attributes, subsections = await engine.on_message_streaming("What is AI?")
@@ -171,4 +205,410 @@ async def test_on_message_streaming_Imagine_LA_with_context(monkeypatch):
     assert chunks == ["First chunk", " second chunk", " final chunk"]
     assert attributes.benefit_program == "CalFresh"
     assert attributes.alert_message == "Some alert message"
-    assert subsections == []  # Empty because we mocked retrieve_with_scores to return []
+    assert subsections == []  # Empty because we mocked retrieve_with_scores_async to return []
+
+
+@pytest.mark.asyncio
+async def test_on_message_async_Imagine_LA_canned_response(monkeypatch):
+    monkeypatch.setattr(
+        chat_engine,
+        "analyze_message_streaming_async",
+        mock_analysis_stream(
+            ImagineLA_MessageAttributes(
+                needs_context=True,
+                users_language="en",
+                translated_message="",
+                benefit_program="",
+                canned_response="This is a canned response",
+                alert_message="",
+            )
+        ),
+    )
+
+    engine = chat_engine.create_engine("imagine-la")
+    result = await engine.on_message_async("What is AI?")
+    assert result.response == "This is a canned response"
+    assert not result.subsections
+
+
+@pytest.mark.asyncio
+async def test_on_message_async_Imagine_LA_with_context(monkeypatch):
+    monkeypatch.setattr(
+        chat_engine,
+        "analyze_message_streaming_async",
+        mock_analysis_stream(
+            ImagineLA_MessageAttributes(
+                needs_context=True,
+                users_language="es",
+                translated_message="What is CalFresh?",
+                benefit_program="CalFresh",
+                canned_response="",
+                alert_message="Some alert message",
+            )
+        ),
+    )
+    retrieval_queries = []
+
+    async def mock_retrieve(query, **_kwargs):
+        retrieval_queries.append(query)
+        return []
+
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_retrieve)
+    monkeypatch.setattr(chat_engine, "generate_async", mock_async("This is a generated response"))
+
+    engine = chat_engine.create_engine("imagine-la")
+    result = await engine.on_message_async("¿Qué es CalFresh?")
+    assert result.response == "This is a generated response"
+    assert result.attributes.alert_message == "Some alert message"
+    assert retrieval_queries == ["What is CalFresh?"]
+
+
+@pytest.mark.asyncio
+async def test_on_message_and_on_message_async_build_the_same_response(monkeypatch):
+    attributes = MessageAttributes(
+        needs_context=True, users_language="es", translated_message="What is CalFresh?"
+    )
+    chunks_with_scores = [ChunkWithScore(ChunkFactory.build(), 0.9)]
+    retrieval_queries = []
+    contexts = []
+
+    def mock_retrieve(query, **_kwargs):
+        retrieval_queries.append(query)
+        return chunks_with_scores
+
+    def mock_generate(_llm, _system_prompt, _query, context_text, _chat_history):
+        contexts.append(context_text)
+        return "This is a generated response"
+
+    monkeypatch.setattr(chat_engine, "analyze_message", lambda *_args: attributes)
+    monkeypatch.setattr(chat_engine, "analyze_message_async", mock_async(attributes))
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores", mock_retrieve)
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_async(chunks_with_scores))
+    monkeypatch.setattr(chat_engine, "generate", mock_generate)
+
+    async def mock_generate_async(*args):
+        return mock_generate(*args)
+
+    monkeypatch.setattr(chat_engine, "generate_async", mock_generate_async)
+
+    engine = chat_engine.create_engine("ca-edd-web")
+    result = engine.on_message("¿Qué es CalFresh?")
+    async_result = await engine.on_message_async("¿Qué es CalFresh?")
+
+    assert retrieval_queries == ["What is CalFresh?"]
+    assert contexts[0] and contexts[0] == contexts[1]
+    for on_message_result in [result, async_result]:
+        assert on_message_result.response == "This is a generated response"
+        assert on_message_result.system_prompt == engine.system_prompt_2
+        assert on_message_result.chunks_with_scores == chunks_with_scores
+        assert [subsection.id for subsection in on_message_result.subsections] == ["citation-1"]
+
+
+def _slow_analyze_message(attributes):
+    async def analyze_message_async(*_args, **_kwargs):
+        # Give the speculative retrieval a chance to start
+        await asyncio.sleep(0.01)
+        return attributes
+
+    return analyze_message_async
+
+
+def _mock_slow_analysis(monkeypatch, attributes, stream_message_analysis):
+    monkeypatch.setattr(ImagineLaEngine, "stream_message_analysis", stream_message_analysis)
+    if stream_message_analysis:
+        monkeypatch.setattr(
+            chat_engine,
+            "analyze_message_streaming_async",
+            mock_analysis_stream(attributes, delay=0.001),
+        )
+    else:
+        monkeypatch.setattr(chat_engine, "analyze_message_async", _slow_analyze_message(attributes))
+
+
+def _imagine_la_attributes(**kwargs):
+    attributes = {
+        "needs_context": True,
+        "users_language": "en",
+        "translated_message": "",
+        "benefit_program": "CalFresh",
+        "canned_response": "",
+        "alert_message": "",
+    }
+    return ImagineLA_MessageAttributes(**(attributes | kwargs))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream_message_analysis", [True, False])
+@pytest.mark.parametrize(
+    "question,translated_message,expected_queries",
+    [
+        # The context retrieved while analyzing the message is used
+        ("What is CalFresh?", "", ["What is CalFresh?"]),
+        ("What is  CalFresh?", "What is CalFresh?", ["What is  CalFresh?"]),
+        # Context is retrieved again for the translated question
+        ("¿Qué es CalFresh?", "What is CalFresh?", ["¿Qué es CalFresh?", "What is CalFresh?"]),
+    ],
+)
+async def test_on_message_async__speculative_retrieval(
+    monkeypatch, stream_message_analysis, question, translated_message, expected_queries
+):
+    _mock_slow_analysis(
+        monkeypatch,
+        _imagine_la_attributes(translated_message=translated_message),
+        stream_message_analysis,
+    )
+    retrieval_queries = []
+
+    async def mock_retrieve(query, **_kwargs):
+        retrieval_queries.append(query)
+        return [ChunkWithScore(ChunkFactory.build(), 0.9)]
+
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_retrieve)
+    monkeypatch.setattr(chat_engine, "generate_async", mock_async("This is a generated response"))
+
+    engine = chat_engine.create_engine("imagine-la")
+    result = await engine.on_message_async(question)
+    assert result.response == "This is a generated response"
+    assert retrieval_queries == expected_queries
+    assert len(result.chunks_with_scores) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stream_message_analysis", [True, False])
+async def test_on_message_streaming__speculative_retrieval_is_cancelled(
+    monkeypatch, stream_message_analysis
+):
+    _mock_slow_analysis(
+        monkeypatch,
+        _imagine_la_attributes(canned_response="This is a canned response"),
+        stream_message_analysis,
+    )
+    cancelled_queries = []
+
+    async def mock_retrieve(query, **_kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled_queries.append(query)
+            raise
+
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_retrieve)
+
+    engine = chat_engine.create_engine("imagine-la")
+    _, _, subsections = await engine.on_message_streaming("What is AI?")
+    await asyncio.sleep(0)
+
+    assert not subsections
+    # Context isn't needed for a canned response, so the retrieval is stopped
+    assert cancelled_queries == ["What is AI?"]
+
+
+def _pausing_analysis_stream(attributes, pause_after, resume):
+    "Mocks analyze_message_streaming_async() to stop streaming after pause_after until resumed"
+    response = attributes.model_dump_json()
+    pause_at = response.index(pause_after) + len(pause_after)
+
+    async def analyze_message_streaming_async(*_args, **_kwargs):
+        yield response[:pause_at]
+        await resume.wait()
+        yield response[pause_at:]
+
+    return analyze_message_streaming_async
+
+
+@pytest.mark.asyncio
+async def test_on_message_async__retrieves_while_analysis_streams(monkeypatch):
+    retrieving = asyncio.Event()
+    attributes = _imagine_la_attributes(
+        users_language="es", translated_message="What is CalFresh?", alert_message="Some alert"
+    )
+    monkeypatch.setattr(
+        chat_engine,
+        "analyze_message_streaming_async",
+        _pausing_analysis_stream(
+            attributes, '"translated_message":"What is CalFresh?",', retrieving
+        ),
+    )
+    retrieval_queries = []
+
+    async def mock_retrieve(query, **_kwargs):
+        retrieval_queries.append(query)
+        if query == "What is CalFresh?":
+            retrieving.set()
+        return [ChunkWithScore(ChunkFactory.build(), 0.9)]
+
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_retrieve)
+    monkeypatch.setattr(chat_engine, "generate_async", mock_async("This is a generated response"))
+
+    engine = chat_engine.create_engine("imagine-la")
+    # The rest of the analysis only arrives once context is being retrieved for the translation
+    result = await asyncio.wait_for(engine.on_message_async("¿Qué es CalFresh?"), timeout=5)
+    assert result.attributes == attributes
+    # The speculative retrieval for the untranslated question was cancelled before it started
+    assert retrieval_queries == ["What is CalFresh?"]
+    assert len(result.chunks_with_scores) == 1
+
+
+@pytest.mark.asyncio
+async def test_on_message_streaming__streams_canned_response_while_analysis_streams(monkeypatch):
+    resume = asyncio.Event()
+    attributes = _imagine_la_attributes(
+        needs_context=False, canned_response="This is a canned response", alert_message="Alert"
+    )
+    monkeypatch.setattr(
+        chat_engine,
+        "analyze_message_streaming_async",
+        _pausing_analysis_stream(attributes, '"canned_response":"This is', resume),
+    )
+
+    engine = chat_engine.create_engine("imagine-la")
+    generator, streamed_attributes, subsections = await engine.on_message_streaming("Hi")
+
+    # The start of the canned response is streamed before the analysis is complete
+    assert await anext(generator) == "This is"
+    resume.set()
+    assert [chunk async for chunk in generator] == [" a canned response"]
+    # The attributes are completed once the response has been streamed
+    assert streamed_attributes == attributes
+    assert not subsections
+
+
+def _password_reset_router(shadow):
+    intent = Intent(
+        "Password reset",
+        ["How do I reset my password?"],
+        canned_response="Use [forgot password](https://example.com/forgot)",
+    )
+    return IntentRouter(
+        [intent], min_score=0.99, shadow=shadow, embedding_model=MockEmbeddingModel()
+    )
+
+
+@pytest.mark.asyncio
+async def test_on_message_async__routes_intent_without_llm(monkeypatch):
+    monkeypatch.setattr(ImagineLaEngine, "intent_router", _password_reset_router(shadow=False))
+
+    async def analyze_message_streaming_async(*_args, **_kwargs):
+        raise AssertionError("The message shouldn't be analyzed by the LLM")
+        yield
+
+    monkeypatch.setattr(
+        chat_engine, "analyze_message_streaming_async", analyze_message_streaming_async
+    )
+
+    engine = chat_engine.create_engine("imagine-la")
+    result = await engine.on_message_async("How do I reset my password?")
+    assert result.response == "Use [forgot password](https://example.com/forgot)"
+    assert engine.intent_router.stats()["hit_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_on_message_streaming__records_llm_agreement_in_shadow_mode(monkeypatch):
+    router = _password_reset_router(shadow=True)
+    monkeypatch.setattr(ImagineLaEngine, "intent_router", router)
+    monkeypatch.setattr(
+        chat_engine,
+        "analyze_message_streaming_async",
+        mock_analysis_stream(
+            _imagine_la_attributes(
+                canned_response="Use [forgot password](https://example.com/forgot)"
+            )
+        ),
+    )
+
+    engine = chat_engine.create_engine("imagine-la")
+    generator, _, _ = await engine.on_message_streaming("How do I reset my password?")
+    assert "".join([chunk async for chunk in generator]).startswith("Use [forgot password]")
+    # The LLM's response is recorded once the message has been classified
+    await asyncio.sleep(0.1)
+
+    assert router.stats() == {
+        "messages": 1,
+        "hit_rate": 1.0,
+        "agreement": 1.0,
+        "compared": 1,
+        "missed": 0,
+    }
+
+
+def _mock_answer_cache(monkeypatch, corpus_version="corpus-1"):
+    embedding_model = BagOfWordsEmbeddingModel(["apply", "calfresh", "medi-cal"])
+    cache = AnswerCache(max_size=10, min_score=0.95, embedding_model=embedding_model)
+    monkeypatch.setattr(BaseEngine, "answer_cache", cache)
+    monkeypatch.setattr(chat_engine, "corpus_version", lambda: corpus_version)
+    monkeypatch.setattr(chat_engine, "corpus_version_async", mock_async(corpus_version))
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_on_message_async__reuses_cached_answer(monkeypatch):
+    cache = _mock_answer_cache(monkeypatch)
+    monkeypatch.setattr(
+        chat_engine,
+        "analyze_message_streaming_async",
+        mock_analysis_stream(_imagine_la_attributes()),
+    )
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_async([]))
+    responses = iter(["First response", "Second response", "Third response"])
+
+    async def generate_async(*_args, **_kwargs):
+        return next(responses)
+
+    monkeypatch.setattr(chat_engine, "generate_async", generate_async)
+
+    engine = chat_engine.create_engine("imagine-la")
+    result = await engine.on_message_async("How do I apply for CalFresh?")
+    assert result.response == "First response"
+    cached = await engine.on_message_async("how can I apply for calfresh")
+    assert cached.response == "First response"
+    assert cached.attributes == result.attributes
+
+    # Answers to follow-up questions depend on the conversation
+    chat_history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+    result = await engine.on_message_async("How do I apply for CalFresh?", chat_history)
+    assert result.response == "Second response"
+
+    # Answers aren't reused once the corpus is re-ingested
+    monkeypatch.setattr(chat_engine, "corpus_version_async", mock_async("corpus-2"))
+    result = await engine.on_message_async("How do I apply for CalFresh?")
+    assert result.response == "Third response"
+
+    assert cache.cache_info() == {"hits": 1, "misses": 2, "size": 1, "max_size": 10}
+
+
+@pytest.mark.asyncio
+async def test_on_message_streaming__replays_cached_answer(monkeypatch):
+    _mock_answer_cache(monkeypatch)
+    monkeypatch.setattr(
+        chat_engine,
+        "analyze_message_streaming_async",
+        mock_analysis_stream(_imagine_la_attributes(alert_message="Some alert message")),
+    )
+    monkeypatch.setattr(chat_engine, "retrieve_with_scores_async", mock_async([]))
+
+    async def generate_streaming_async(*_args, **_kwargs):
+        for chunk in ["Apply ", "online at ", "BenefitsCal."]:
+            yield chunk
+
+    monkeypatch.setattr(chat_engine, "generate_streaming_async", generate_streaming_async)
+
+    engine = chat_engine.create_engine("imagine-la")
+    generator, _, _ = await engine.on_message_streaming("How do I apply for CalFresh?")
+    assert "".join([chunk async for chunk in generator]) == "Apply online at BenefitsCal."
+
+    async def fail(*_args, **_kwargs):
+        raise AssertionError("The cached answer should be reused")
+        yield
+
+    monkeypatch.setattr(chat_engine, "analyze_message_streaming_async", fail)
+    generator, attributes, subsections = await engine.on_message_streaming(
+        "how can I apply for calfresh"
+    )
+    chunks = [chunk async for chunk in generator]
+    assert chunks == ["Apply ", "online ", "at ", "BenefitsCal."]
+    assert attributes.alert_message == "Some alert message"
+    assert subsections == []
+
+    result = engine.on_message("How do I apply for CalFresh?")
+    assert result.response == "Apply online at BenefitsCal."
+    assert result.system_prompt == engine.system_prompt_2
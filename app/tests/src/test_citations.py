@@ -1,12 +1,15 @@
 import copy
 from textwrap import dedent
+from unittest.mock import patch
 
 import pytest
 
 from src.citations import (
     CitationFactory,
     basic_chunk_splitter,
+    compute_subsections,
     create_prompt_context,
+    default_chunk_splitter,
     merge_contiguous_cited_subsections,
     move_citations_after_punctuation,
     remap_citation_ids,
@@ -154,6 +157,23 @@ def test_tree_based_chunk_splitter():
     ]
 
 
+def test_default_chunk_splitter__uses_stored_subsections():
+    chunk = ChunkFactory.build(content=CHUNK_CONTENT, headings=["Heading 1"])
+    chunk.subsections = compute_subsections(chunk)
+    assert [
+        (subsection["headings"], subsection["text"]) for subsection in chunk.subsections
+    ] == EXPECTED_SUBSECTIONS
+
+    with patch("src.citations.tree_based_chunk_splitter") as mock_splitter:
+        subsections = default_chunk_splitter(chunk, CitationFactory())
+    mock_splitter.assert_not_called()
+    assert [subsection.id for subsection in subsections] == [f"citation-{i}" for i in range(1, 6)]
+    assert [subsection.subsection_index for subsection in subsections] == list(range(5))
+    assert [
+        (subsection.text_headings, subsection.text) for subsection in subsections
+    ] == EXPECTED_SUBSECTIONS
+
+
 def test_replace_citation_ids():
     assert replace_citation_ids("No citations", {}) == "No citations"
 
@@ -1,11 +1,24 @@
+import asyncio
+import json
 import os
+from types import SimpleNamespace
 
 import ollama
 import pytest
 
 from src.chat_engine import PROMPT
 from src.citations import create_prompt_context, split_into_subsections
-from src.generate import generate, generate_streaming_async, get_models
+from src.generate import (
+    MessageAttributes,
+    PartialJsonObject,
+    analyze_message,
+    analyze_message_async,
+    analyze_message_streaming_async,
+    generate,
+    generate_async,
+    generate_streaming_async,
+    get_models,
+)
 from tests.mock import mock_completion
 
 
@@ -159,9 +172,112 @@ def test_generate_with_context_with_score(monkeypatch, chunks_with_scores):
     assert generate("gpt-4o", PROMPT, "some query", context_text) == expected_response
 
 
+@pytest.mark.asyncio
+async def test_generate_async(monkeypatch):
+    monkeypatch.setattr("src.generate.acompletion", mock_completion.mock_acompletion)
+    expected_response = (
+        'Called gpt-4o with [{"content": "'
+        + PROMPT
+        + '", "role": "system"}, {"content": "some query", "role": "user"}]'
+    )
+    assert await generate_async("gpt-4o", PROMPT, "some query") == expected_response
+
+
+def _mock_analyze_completion(model, messages, **kwargs):
+    assert kwargs["response_format"] == MessageAttributes
+    return mock_completion.completion(
+        model,
+        messages,
+        mock_response='{"needs_context": true, "users_language": "es", "translated_message": "Hi"}',
+    )
+
+
+def test_analyze_message(monkeypatch):
+    monkeypatch.setattr("src.generate.completion", _mock_analyze_completion)
+    attributes = analyze_message("gpt-4o", "Analyze", "Hola", MessageAttributes)
+    assert attributes == MessageAttributes(
+        needs_context=True, users_language="es", translated_message="Hi"
+    )
+
+
+@pytest.mark.asyncio
+async def test_analyze_message_async(monkeypatch):
+    async def mock_acompletion(model, messages, **kwargs):
+        return _mock_analyze_completion(model, messages, **kwargs)
+
+    monkeypatch.setattr("src.generate.acompletion", mock_acompletion)
+    attributes = await analyze_message_async("gpt-4o", "Analyze", "Hola", MessageAttributes)
+    assert attributes == MessageAttributes(
+        needs_context=True, users_language="es", translated_message="Hi"
+    )
+
+
+@pytest.mark.asyncio
+async def test_analyze_message_streaming_async(monkeypatch):
+    response = '{"needs_context": true, "users_language": "es", "translated_message": "Hi"}'
+    streaming_calls = []
+
+    async def mock_acompletion(model, messages, **kwargs):
+        assert kwargs["response_format"] == MessageAttributes
+        streaming_calls.append(kwargs["stream"])
+
+        async def stream_chunks():
+            for i in range(0, len(response), 10):
+                yield SimpleNamespace(
+                    choices=[SimpleNamespace(delta=SimpleNamespace(content=response[i : i + 10]))]
+                )
+
+        return stream_chunks()
+
+    monkeypatch.setattr("src.generate.acompletion", mock_acompletion)
+    chunks = [
+        chunk
+        async for chunk in analyze_message_streaming_async(
+            "gpt-4o", "Analyze", "Hola", MessageAttributes
+        )
+    ]
+    assert streaming_calls == [True]
+    assert len(chunks) > 1
+    assert "".join(chunks) == response
+
+
+def test_partial_json_object():
+    response = PartialJsonObject()
+    response.feed('{"needs_context": tr')
+    assert response.fields == {}
+
+    response.feed('ue, "count": 12')
+    # The number may not be complete yet
+    assert response.fields == {"needs_context": True}
+
+    response.feed('3, "text": "Line 1\\nLine \\u00')
+    assert response.fields == {"needs_context": True, "count": 123}
+    # Incomplete escape sequences are left out of the partial value
+    assert response.value_so_far("text") == "Line 1\nLine "
+    assert response.value_so_far("other") is None
+
+    response.feed('e9 \\"2\\"", "other": null}')
+    assert response.done
+    assert response.fields == json.loads(response.text)
+    assert response.value_so_far("text") == 'Line 1\nLine é "2"'
+
+
+def test_partial_json_object__one_character_at_a_time():
+    text = json.dumps(
+        {"needs_context": False, "translated_message": '¿Qué? \\ "Sí"', "values": [1, {"a": 2}]}
+    )
+    response = PartialJsonObject()
+    for char in text:
+        response.feed(char)
+        if (partial_value := response.value_so_far("translated_message")) is not None:
+            assert '¿Qué? \\ "Sí"'.startswith(partial_value)
+    assert response.done
+    assert response.fields == json.loads(text)
+
+
 @pytest.mark.asyncio
 async def test_generate_streaming_async(monkeypatch):
-    monkeypatch.setattr("src.generate.completion", mock_completion.mock_completion)
+    monkeypatch.setattr("src.generate.acompletion", mock_completion.mock_acompletion)
 
     # Collect the streamed chunks
     result = []
@@ -185,3 +301,29 @@ async def test_generate_streaming_async(monkeypatch):
         + '{"content": "some query", "role": "user"}]'
     )
     assert complete_response == expected_response
+
+
+@pytest.mark.asyncio
+async def test_generate_streaming_async__concurrent_streams_interleave(monkeypatch):
+    monkeypatch.setattr("src.generate.acompletion", mock_completion.mock_acompletion)
+
+    received: list[str] = []
+
+    async def consume(query: str) -> str:
+        result = []
+        async for piece in generate_streaming_async("gpt-4o", PROMPT, query):
+            received.append(query)
+            result.append(piece)
+        return "".join(result)
+
+    queries = [f"query {i}" for i in range(5)]
+    responses = await asyncio.gather(*[consume(query) for query in queries])
+
+    for query, response in zip(queries, responses, strict=True):
+        assert response.endswith('{"content": "' + query + '", "role": "user"}]')
+
+    # If streams were served one after another, each query's chunks would be contiguous.
+    # Instead, every stream should be in progress before any single stream finishes.
+    last_chunk_index = {query: len(received) - 1 - received[::-1].index(query) for query in queries}
+    first_chunk_index = {query: received.index(query) for query in queries}
+    assert max(first_chunk_index.values()) < min(last_chunk_index.values())
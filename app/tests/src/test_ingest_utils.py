@@ -8,10 +8,11 @@ import pytest
 from smart_open import open
 from sqlalchemy import delete, select
 
-from src.db.models.document import Document
+from src.db.models.document import Chunk, Document
 from src.util.ingest_utils import (
     IngestConfig,
     add_embeddings,
+    bulk_save_documents,
     drop_existing_dataset,
     process_and_ingest_sys_args,
     save_json,
@@ -190,6 +191,28 @@ def test_process_and_ingest_sys_args_resume(db_session, app_config, caplog, enab
         assert db_session.execute(select(Document).where(Document.dataset == "CA EDD")).one()
 
 
+def test_process_and_ingest_sys_args_incremental(
+    db_session, app_config, caplog, enable_factory_create
+):
+    db_session.execute(delete(Document))
+    logger = logging.getLogger(__name__)
+    args = ["ingest-edd-web", "CA EDD", "employment", "California", "/some/folder", "--incremental"]
+    with pytest.raises(NotImplementedError):
+        process_and_ingest_sys_args(args, logger, Mock(), default_config)
+
+    def ingest_incrementally(
+        db_session, json_filepath, doc_attribs, skip_db=False, incremental=False
+    ) -> None:
+        logger.info("Ingesting incrementally: %r", incremental)
+
+    DocumentFactory.create(dataset="CA EDD")
+    with caplog.at_level(logging.INFO):
+        process_and_ingest_sys_args(args, logger, ingest_incrementally, default_config)
+        assert "Ingesting incrementally: True" in caplog.text
+        assert "Dropped existing dataset" not in caplog.text
+        assert db_session.execute(select(Document).where(Document.dataset == "CA EDD")).one()
+
+
 def test__add_embeddings(app_config):
     embedding_model = MockEmbeddingModel()
     chunks = ChunkFactory.build_batch(3, tokens=None, mpnet_embedding=None)
@@ -209,6 +232,99 @@ def test__add_embeddings_with_texts_to_encode(app_config):
         assert chunk.mpnet_embedding == embedding_model.encode(text)
 
 
+def _documents_with_embedded_chunks(source_prefix, dataset="bulk", count=2):
+    documents_with_chunks = []
+    for i in range(count):
+        document = DocumentFactory.build(
+            name=f"Document {i}",
+            content=f"Content {i}",
+            source=f"{source_prefix}{i}",
+            dataset=dataset,
+            program="SNAP",
+            region="CA",
+        )
+        chunks = [
+            ChunkFactory.build(
+                document=document, content=f"Document {i} chunk {j}", headings=["Heading", str(j)]
+            )
+            for j in range(3)
+        ]
+        chunks[0].headings = None
+        chunks[1].page_number = 7
+        documents_with_chunks.append((document, chunks))
+    return documents_with_chunks
+
+
+def _saved_rows(db_session, dataset):
+    documents = db_session.execute(
+        select(Document).where(Document.dataset == dataset).order_by(Document.source)
+    ).scalars()
+    return [
+        (
+            document.name,
+            document.content,
+            document.source,
+            document.program,
+            document.region,
+            [
+                (
+                    chunk.content,
+                    chunk.tokens,
+                    list(chunk.mpnet_embedding),
+                    chunk.page_number,
+                    chunk.headings,
+                    chunk.num_splits,
+                    chunk.split_index,
+                )
+                for chunk in sorted(document.chunks, key=lambda chunk: chunk.content)
+            ],
+        )
+        for document in documents
+    ]
+
+
+def test__bulk_save_documents_matches_orm(app_config, db_session):
+    db_session.execute(delete(Document))
+    orm_documents = _documents_with_embedded_chunks("https://orm/", dataset="orm")
+    for document, chunks in orm_documents:
+        db_session.add(document)
+        db_session.add_all(chunks)
+    db_session.flush()
+
+    bulk_documents = _documents_with_embedded_chunks("https://orm/", dataset="bulk")
+    bulk_save_documents(db_session, bulk_documents)
+    db_session.expire_all()
+
+    assert _saved_rows(db_session, "bulk") == _saved_rows(db_session, "orm")
+    assert db_session.get(Document, bulk_documents[0][0].id).created_at is not None
+
+
+def test__bulk_save_documents_upsert(app_config, db_session):
+    db_session.execute(delete(Document))
+    bulk_save_documents(db_session, _documents_with_embedded_chunks("https://a/"))
+    # Same source in another dataset is not replaced
+    bulk_save_documents(db_session, _documents_with_embedded_chunks("https://a/", dataset="other"))
+
+    replacement = _documents_with_embedded_chunks("https://a/", count=1)
+    replacement[0][0].name = "Replacement"
+    bulk_save_documents(db_session, replacement, upsert=True)
+
+    documents = db_session.execute(
+        select(Document.source, Document.dataset, Document.name).order_by(
+            Document.dataset, Document.source
+        )
+    ).all()
+    assert [(source, dataset) for source, dataset, _ in documents] == [
+        ("https://a/0", "bulk"),
+        ("https://a/1", "bulk"),
+        ("https://a/0", "other"),
+        ("https://a/1", "other"),
+    ]
+    assert documents[0].name == "Replacement"
+    # The replaced document's chunks were deleted
+    assert db_session.query(Chunk).count() == 4 * 3
+
+
 @pytest.mark.parametrize("file_location", ["local", "s3"])
 def test__save_json(file_location, mock_s3_bucket_resource):
     chunks = ChunkFactory.build_batch(2)
@@ -1,14 +1,19 @@
 import json
 import logging
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
 import pytest
 from sqlalchemy import delete, select
 
+from src import ingester
 from src.app_config import app_config as app_config_for_test
-from src.db.models.document import Document
+from src.citations import compute_subsections
+from src.db.models.document import Chunk, Document
 from src.ingest_runner import get_ingester_config
-from src.ingester import ingest_json
+from src.ingester import Split, chunk_documents, ingest_json, save_incrementally, save_to_db
+from src.util.ingest_utils import DefaultChunkingConfig, content_hash
+from tests.mock.mock_embedding_model import MockEmbeddingModel
 
 
 @pytest.fixture
@@ -153,6 +158,12 @@ def check_database_contents(db_session, caplog):
     # All chunks have the same heading
     for chunk in doc0.chunks:
         assert chunk.headings == ["Nonindustrial Disability Insurance FAQs"]
+        # Citation subsections are stored with each chunk
+        assert chunk.subsections == compute_subsections(chunk)
+    assert doc0.chunks[1].subsections[0]["headings"] == [
+        "Nonindustrial Disability Insurance FAQs",
+        "Will the State continue to contribute to my health, dental, and vision benefits if I am unable to work and receive NDI benefits?",
+    ]
 
     # Document[1] is short
     doc1 = documents[1]
@@ -189,3 +200,210 @@ def check_database_contents(db_session, caplog):
     # Last section
     assert doc2.chunks[3].headings == ["State Unemployment Tax Act Dumping"]
     assert doc2.chunks[3].content.startswith("### [SUTA Dumping Schemes]")
+
+
+def _documents_with_splits(count, splits_per_document=2):
+    return [
+        (
+            Document(
+                name=f"Doc {i}",
+                content=f"Content {i}",
+                source=f"source-{i}",
+                dataset="test",
+                program="test",
+                region="test",
+            ),
+            [
+                Split([f"Heading {i}"], f"Text {i} {j}", "", f"Text {i} {j}")
+                for j in range(splits_per_document)
+            ],
+        )
+        for i in range(count)
+    ]
+
+
+def test_save_to_db__embeds_in_batches_across_documents(app_config, db_session, monkeypatch):
+    db_session.execute(delete(Document))
+    monkeypatch.setattr(MockEmbeddingModel, "batch_size", 5)
+    all_splits = _documents_with_splits(5)
+    all_splits.insert(
+        2,
+        (
+            Document(
+                name="Empty",
+                content="",
+                source="empty",
+                dataset="test",
+                program="test",
+                region="test",
+            ),
+            [],
+        ),
+    )
+
+    embedding_model = app_config_for_test.embedding_model
+    with patch.object(embedding_model, "encode", wraps=embedding_model.encode) as encode:
+        save_to_db(db_session, all_splits)
+
+    # Whole documents are batched, up to the batch size
+    assert [len(call.args[0]) for call in encode.call_args_list] == [4, 4, 2]
+
+    documents = db_session.execute(select(Document).order_by(Document.name)).scalars().all()
+    assert [document.name for document in documents] == [f"Doc {i}" for i in range(5)]
+    chunks = db_session.execute(select(Chunk).order_by(Chunk.content)).scalars().all()
+    assert [chunk.content for chunk in chunks] == [
+        f"Text {i} {j}" for i in range(5) for j in range(2)
+    ]
+    assert all(chunk.mpnet_embedding is not None for chunk in chunks)
+
+
+def test_save_to_db__commits_completed_batches(app_config, db_session, monkeypatch):
+    db_session.execute(delete(Document))
+    db_session.commit()
+    monkeypatch.setattr(MockEmbeddingModel, "batch_size", 2)
+    embedding_model = app_config_for_test.embedding_model
+    encode = embedding_model.encode
+
+    def failing_encode(texts, show_progress_bar=False):
+        if "Text 1 0" in texts:
+            raise RuntimeError("Embedding failed")
+        return encode(texts, show_progress_bar)
+
+    with patch.object(embedding_model, "encode", side_effect=failing_encode):
+        with pytest.raises(RuntimeError, match="Embedding failed"):
+            save_to_db(db_session, _documents_with_splits(3))
+
+    # The first batch was committed, so resuming only needs to ingest the remaining documents
+    db_session.rollback()
+    assert db_session.execute(select(Document.name)).scalars().all() == ["Doc 0"]
+
+
+def _incremental_splits(contents):
+    all_splits = []
+    for source, texts in contents.items():
+        document = Document(
+            name=source,
+            content="\n".join(texts),
+            source=source,
+            dataset="test",
+            program="test",
+            region="test",
+            content_hash=content_hash(source, *texts),
+        )
+        all_splits.append((document, [Split([source], text, "", text) for text in texts]))
+    return all_splits
+
+
+def _chunk_ids_by_content(db_session):
+    db_session.expire_all()
+    return {chunk.content: chunk.id for chunk in db_session.scalars(select(Chunk))}
+
+
+def test_save_incrementally(app_config, db_session):
+    db_session.execute(delete(Document))
+    doc_attribs = {"dataset": "test", "program": "test", "region": "test"}
+    contents = {"unchanged": ["A", "B"], "changed": ["C", "D"], "removed": ["E"]}
+    save_incrementally(db_session, _incremental_splits(contents), doc_attribs)
+    original_ids = _chunk_ids_by_content(db_session)
+    assert set(original_ids) == {"A", "B", "C", "D", "E"}
+
+    embedding_model = app_config_for_test.embedding_model
+    with patch.object(embedding_model, "encode", wraps=embedding_model.encode) as encode:
+        # Nothing changed
+        save_incrementally(db_session, _incremental_splits(contents), doc_attribs)
+        assert encode.call_count == 0
+        assert _chunk_ids_by_content(db_session) == original_ids
+
+        contents = {"unchanged": ["A", "B"], "changed": ["C", "D2", "F"], "new": ["G"]}
+        save_incrementally(db_session, _incremental_splits(contents), doc_attribs)
+
+    # Only new or changed chunks are embedded
+    assert encode.call_args.args[0] == ["D2", "F", "G"]
+    chunk_ids = _chunk_ids_by_content(db_session)
+    assert set(chunk_ids) == {"A", "B", "C", "D2", "F", "G"}
+    for content in ["A", "B", "C"]:
+        assert chunk_ids[content] == original_ids[content]
+
+    documents = db_session.scalars(select(Document).order_by(Document.source)).all()
+    assert [document.source for document in documents] == ["changed", "new", "unchanged"]
+    changed_chunks = sorted(documents[0].chunks, key=lambda chunk: chunk.split_index)
+    assert [chunk.content for chunk in changed_chunks] == ["C", "D2", "F"]
+    assert all(chunk.num_splits == 3 for chunk in changed_chunks)
+    assert all(chunk.mpnet_embedding is not None for chunk in changed_chunks)
+
+
+def test_save_incrementally__keeps_documents_without_splits(app_config, db_session):
+    db_session.execute(delete(Document))
+    doc_attribs = {"dataset": "test", "program": "test", "region": "test"}
+    save_incrementally(
+        db_session, _incremental_splits({"kept": ["A"], "removed": ["B"]}), doc_attribs
+    )
+    original_ids = _chunk_ids_by_content(db_session)
+
+    save_incrementally(db_session, _incremental_splits({"kept": []}), doc_attribs)
+
+    assert _chunk_ids_by_content(db_session) == {"A": original_ids["A"]}
+
+
+def test_ingest_json__incremental_keeps_documents_that_fail_to_chunk(
+    app_config, db_session, local_file, monkeypatch
+):
+    db_session.execute(delete(Document))
+    # Chunk in this process so that _chunk_page can be patched
+    monkeypatch.setattr(app_config_for_test, "chunking_workers", 1)
+    config = get_ingester_config("edd")
+    failing_url = "https://edd.ca.gov/en/payroll_taxes/suta_dumping/"
+    with TemporaryDirectory(suffix="edd_md") as md_base_dir:
+        ingest_json(db_session, local_file, config, md_base_dir=md_base_dir, incremental=True)
+    original_ids = _chunk_ids_by_content(db_session)
+
+    chunk_page = ingester._chunk_page
+
+    def failing_chunk_page(document, chunking_config):
+        if document.source == failing_url:
+            raise ValueError("Can't parse page")
+        return chunk_page(document, chunking_config)
+
+    monkeypatch.setattr(ingester, "_chunk_page", failing_chunk_page)
+    # Use a new directory so that the pages are chunked again rather than loaded from files
+    with TemporaryDirectory(suffix="edd_md") as md_base_dir:
+        ingest_json(db_session, local_file, config, md_base_dir=md_base_dir, incremental=True)
+
+    # The page that failed to chunk and its embeddings are still in the DB
+    assert _chunk_ids_by_content(db_session) == original_ids
+    assert db_session.scalars(select(Document.source).where(Document.source == failing_url)).one()
+
+
+def test_ingest_json__resume_and_incremental(app_config, db_session, local_file):
+    with pytest.raises(ValueError, match="resume"):
+        ingest_json(
+            db_session,
+            local_file,
+            get_ingester_config("edd"),
+            resume=True,
+            incremental=True,
+        )
+
+
+def test_chunk_documents(app_config):
+    documents = [
+        Document(name=f"Doc {i}", source=f"https://example.com/{i}", content=content)
+        for i, content in enumerate(
+            [
+                "# Heading 1\n\nSome text.\n\n## Heading 2\n\n- Item 1\n- Item 2",
+                None,  # can't be chunked
+                "Intro paragraph.\n\n# Heading\n\nMore text.",
+            ]
+        )
+    ]
+    config = DefaultChunkingConfig()
+
+    serial_results = chunk_documents(documents, config, max_workers=1)
+    parallel_results = chunk_documents(documents, config, max_workers=2)
+
+    # Results are in the same order as the documents, with None for the failed document
+    assert [splits is None for splits in parallel_results] == [False, True, False]
+    assert [
+        [split.__dict__ for split in splits] if splits else splits for splits in parallel_results
+    ] == [[split.__dict__ for split in splits] if splits else splits for splits in serial_results]
+    assert parallel_results[2][0].headings == ["Doc 2"]
@@ -0,0 +1,93 @@
+import pytest
+
+from src.intent_router import Intent, IntentRouter
+from tests.mock.mock_embedding_model import BagOfWordsEmbeddingModel
+
+VOCABULARY = ["password", "reset", "forgot", "id", "card", "food", "bank", "calfresh"]
+
+INTENTS = [
+    Intent(
+        "Password reset",
+        ["How do I reset my password?", "I forgot my password"],
+        canned_response="Click [forgot password](https://example.com/forgot).",
+    ),
+    Intent(
+        "ID card",
+        ["How do I get an ID card?"],
+        canned_response="Here's a link: [Get an ID card](https://example.com/id).",
+    ),
+    Intent("Food bank alert", ["Where is a food bank?"], alert_message="Food banks are open."),
+]
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(
+        INTENTS, min_score=0.9, embedding_model=BagOfWordsEmbeddingModel(VOCABULARY)
+    )
+
+
+def test_intent_is_in():
+    password_reset, _, food_bank_alert = INTENTS
+    # Links are kept when the LLM translates the response
+    assert password_reset.is_in("Haga clic en [olvidé](https://example.com/forgot).")
+    assert not password_reset.is_in("Here's a link: [Get an ID card](https://example.com/id).")
+    assert not password_reset.is_in("")
+
+    # Responses without links are compared by their text
+    assert food_bank_alert.is_in("Food banks  are open.")
+    assert not food_bank_alert.is_in("Food banks are closed.")
+
+
+def test_classify(router):
+    match = router.classify("I forgot my password")
+    assert match.intent.name == "Password reset"
+    assert match.example == "I forgot my password"
+    assert match.score == pytest.approx(1.0)
+
+    assert router.classify("Where can I get an ID card?").intent.name == "ID card"
+
+
+def test_should_route(router):
+    match = router.classify("How do I reset my password?")
+    # Shadow mode only measures agreement with the LLM
+    assert not router.should_route(match)
+
+    router.shadow = False
+    assert router.should_route(match)
+    assert not router.should_route(router.classify("Is CalFresh available?"))
+    assert router.stats() == {
+        "messages": 1,
+        "hit_rate": 1.0,
+        "agreement": 0.0,
+        "compared": 0,
+        "missed": 0,
+    }
+
+
+def test_stats(router):
+    password_reset, id_card, _ = INTENTS
+    router.record_llm_result(
+        router.classify("I forgot my password"), password_reset.canned_response
+    )
+    router.record_llm_result(
+        router.classify("How do I get an ID card?"), password_reset.canned_response
+    )
+    router.record_llm_result(router.classify("CalFresh ID card"), id_card.canned_response)
+    router.record_llm_result(router.classify("Is CalFresh available?"), "")
+
+    assert router.stats() == {
+        "messages": 4,
+        "hit_rate": 0.5,
+        "agreement": 0.5,
+        "compared": 2,
+        "missed": 1,
+    }
+    # Stats for another min_score are computed from the same messages
+    assert router.stats(min_score=0.0) == {
+        "messages": 4,
+        "hit_rate": 1.0,
+        "agreement": 0.5,
+        "compared": 4,
+        "missed": 0,
+    }
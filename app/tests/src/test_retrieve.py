@@ -1,8 +1,25 @@
+import numpy as np
 import pytest
-from sqlalchemy import delete
+from sqlalchemy import delete, event, func, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
 
-from src.db.models.document import Document
-from src.retrieve import retrieve_with_scores
+from src import retrieve
+from src.app_config import AppConfig
+from src.app_config import app_config as app_config_instance
+from src.db.models.document import EMBEDDING_DIMENSION, ChunkData, Document, DocumentData
+from src.retrieve import (
+    _retrieval_statement,
+    _search_settings_statement,
+    corpus_version,
+    corpus_version_async,
+    mark_corpus_changed,
+    retrieval_cache,
+    retrieve_many,
+    retrieve_with_scores,
+    retrieve_with_scores_async,
+)
+from src.util.ingest_utils import drop_existing_dataset
 from tests.src.db.models.factories import ChunkFactory, DocumentFactory
 
 
@@ -90,3 +107,417 @@ def test_retrieve_with_scores(app_config, db_session, enable_factory_create):
     assert results[0].score == 0.7071067690849304
     assert results[1].chunk.id == medium_chunk.id
     assert results[1].score == 0.25881901383399963
+
+
+@pytest.fixture
+def sql_statements():
+    statements: list[str] = []
+
+    def record_statement(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record_statement)
+    yield statements
+    event.remove(Engine, "before_cursor_execute", record_statement)
+
+
+def test_retrieve_with_scores__round_trips(
+    app_config, db_session, enable_factory_create, sql_statements
+):
+    db_session.execute(delete(Document))
+    _create_chunks(document=DocumentFactory.create())
+    _create_chunks(document=DocumentFactory.create())
+    sql_statements.clear()
+
+    results = retrieve_with_scores("Very tiny words.", retrieval_k=4, retrieval_k_min_score=-1)
+
+    # One statement to configure the search and one to retrieve chunks with their documents
+    assert len(sql_statements) == 2
+    retrieval_sql = sql_statements[1]
+    assert "chunk.mpnet_embedding AS" not in retrieval_sql
+    assert "document.content" not in retrieval_sql
+
+    # Results are detached copies, so using them doesn't query the DB
+    assert len(results) == 4
+    for result in results:
+        assert isinstance(result.chunk, ChunkData)
+        assert isinstance(result.chunk.document, DocumentData)
+        assert result.chunk.document.name
+        assert not hasattr(result.chunk, "__dict__")
+    # Chunks of the same document share it
+    assert len({id(result.chunk.document) for result in results}) == 2
+    assert len(sql_statements) == 2
+
+
+def test_retrieve_with_scores__exact_search(app_config, db_session, enable_factory_create):
+    db_session.execute(delete(Document))
+    long_chunk, medium_chunk, short_chunk = _create_chunks()
+
+    results = retrieve_with_scores(
+        "Very tiny words.", retrieval_k=3, retrieval_k_min_score=-1, exact_search=True
+    )
+
+    assert _chunk_ids(results) == [short_chunk.id, medium_chunk.id, long_chunk.id]
+    assert results[0].score == 0.7071067690849304
+
+
+def test_retrieve_many(app_config, db_session, enable_factory_create):
+    db_session.execute(delete(Document))
+    _create_chunks(document=DocumentFactory.create(dataset="Other"))
+    long_chunk, medium_chunk, short_chunk = _create_chunks(
+        document=DocumentFactory.create(dataset="SNAP")
+    )
+    queries = [
+        "Very tiny words.",
+        "Extraordinarily incomprehensible terminology",
+        "Very tiny words.",
+    ]
+
+    results = retrieve_many(queries, retrieval_k=2, retrieval_k_min_score=-1, datasets=["SNAP"])
+
+    assert [_chunk_ids(query_results) for query_results in results] == [
+        [short_chunk.id, medium_chunk.id],
+        [long_chunk.id, medium_chunk.id],
+        [short_chunk.id, medium_chunk.id],
+    ]
+    # Results match retrieving for each query individually
+    for query, query_results in zip(queries, results, strict=True):
+        expected = retrieve_with_scores(
+            query, retrieval_k=2, retrieval_k_min_score=-1, datasets=["SNAP"]
+        )
+        assert [(r.chunk.id, r.score) for r in query_results] == [
+            (r.chunk.id, r.score) for r in expected
+        ]
+    assert results[0][0].chunk.document.dataset == "SNAP"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("quantization", [None, "halfvec", "binary"])
+async def test_retrieve__filtered_dataset_is_small_part_of_corpus(
+    app_config, db_session, enable_factory_create, monkeypatch, request, quantization
+):
+    if quantization:
+        request.getfixturevalue("quantized_indexes")
+        monkeypatch.setattr(app_config_instance, "retrieval_quantization", quantization)
+    search_settings_statement = retrieve._search_settings_statement
+
+    def use_index(retrieval_k, exact_search):
+        # Like for a large corpus, make the planner use the HNSW index rather than scanning
+        # the few test rows
+        return search_settings_statement(retrieval_k, exact_search).add_columns(
+            func.set_config("enable_seqscan", "on" if exact_search else "off", True)
+        )
+
+    monkeypatch.setattr(retrieve, "_search_settings_statement", use_index)
+    db_session.execute(delete(Document))
+    query_embedding = np.asarray(app_config_instance.embedding_model.encode("Very tiny words."))
+    rng = np.random.default_rng(0)
+    # The rest of the corpus is nearest to the query, so the HNSW index's ef_search nearest chunks
+    # are all in the wrong dataset
+    other_document = DocumentFactory.create(dataset="Other")
+    for _ in range(200):
+        ChunkFactory.create(
+            document=other_document,
+            mpnet_embedding=query_embedding + rng.normal(scale=0.01, size=len(query_embedding)),
+        )
+    small_document = DocumentFactory.create(dataset="Small")
+    small_chunks = [
+        ChunkFactory.create(
+            document=small_document,
+            mpnet_embedding=-query_embedding + rng.normal(scale=0.01, size=len(query_embedding)),
+        )
+        for _ in range(5)
+    ]
+    db_session.commit()
+    assert app_config_instance.hnsw_ef_search == AppConfig().hnsw_ef_search
+
+    expected_ids = {chunk.id for chunk in small_chunks}
+    results = retrieve_with_scores(
+        "Very tiny words.", retrieval_k=5, retrieval_k_min_score=-2, datasets=["Small"]
+    )
+    assert set(_chunk_ids(results)) == expected_ids
+    results = await retrieve_with_scores_async(
+        "Very tiny words.", retrieval_k=5, retrieval_k_min_score=-2, datasets=["Small"]
+    )
+    assert set(_chunk_ids(results)) == expected_ids
+    [results] = retrieve_many(
+        ["Very tiny words."], retrieval_k=5, retrieval_k_min_score=-2, datasets=["Small"]
+    )
+    assert set(_chunk_ids(results)) == expected_ids
+
+
+def test_retrieve_many__min_score(app_config, db_session, enable_factory_create):
+    db_session.execute(delete(Document))
+    _, _, short_chunk = _create_chunks()
+
+    results = retrieve_many(["Very tiny words."], retrieval_k=3, retrieval_k_min_score=0.5)
+
+    assert [_chunk_ids(query_results) for query_results in results] == [[short_chunk.id]]
+    assert retrieve_many([], retrieval_k=3, retrieval_k_min_score=0.5) == []
+
+
+@pytest.mark.asyncio
+async def test_retrieve_with_scores_async(app_config, db_session, enable_factory_create):
+    db_session.execute(delete(Document))
+    _, medium_chunk, short_chunk = _create_chunks(document=DocumentFactory.create(dataset="SNAP"))
+    _create_chunks(document=DocumentFactory.create(dataset="Other"))
+
+    results = await retrieve_with_scores_async(
+        "Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0, datasets=["SNAP"]
+    )
+
+    assert _chunk_ids(results) == [short_chunk.id, medium_chunk.id]
+    assert results[0].score == 0.7071067690849304
+    # The document is loaded with the chunk and can be accessed after the session is closed
+    assert results[0].chunk.document.dataset == "SNAP"
+
+
+@pytest.mark.asyncio
+async def test_corpus_version(app_config, db_session, enable_factory_create, monkeypatch):
+    # By default, changes by other processes are noticed on every call
+    assert app_config_instance.corpus_version_ttl == AppConfig().corpus_version_ttl == 0
+    db_session.execute(delete(Document))
+    empty_version = corpus_version()
+
+    document = DocumentFactory.create()
+    version = corpus_version()
+    assert version != empty_version
+    assert await corpus_version_async() == version
+
+    # Re-ingesting a document updates it
+    document.content = "Updated content"
+    db_session.commit()
+    updated_version = corpus_version()
+    assert updated_version != version
+
+    # The version is only checked once the TTL has passed
+    monkeypatch.setattr(app_config_instance, "corpus_version_ttl", 60)
+    db_session.execute(delete(Document))
+    assert corpus_version() == updated_version
+
+
+def test_corpus_version__changes_when_marked_changes_commit(app_config, db_session):
+    version = corpus_version()
+
+    mark_corpus_changed(db_session)
+    db_session.rollback()
+    assert corpus_version() == version
+
+    mark_corpus_changed(db_session)
+    db_session.commit()
+    assert corpus_version() != version
+
+
+@pytest.fixture
+def enabled_retrieval_cache(monkeypatch):
+    monkeypatch.setattr(retrieval_cache, "max_size", 10)
+    retrieval_cache.clear()
+    yield retrieval_cache
+    retrieval_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_retrieve_with_scores__cached(
+    app_config, db_session, enable_factory_create, sql_statements, enabled_retrieval_cache
+):
+    db_session.execute(delete(Document))
+    _create_chunks(document=DocumentFactory.create(dataset="SNAP"))
+    results = retrieve_with_scores("Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0)
+    sql_statements.clear()
+
+    # The same query doesn't search again, even from the async version; only the corpus version
+    # is checked
+    cached_results = await retrieve_with_scores_async(
+        "Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0
+    )
+    assert _chunk_ids(cached_results) == _chunk_ids(results)
+    [statement] = sql_statements
+    assert "count(document.id)" in statement
+
+    # Other retrieval parameters are searched
+    retrieve_with_scores("Very tiny words.", retrieval_k=3, retrieval_k_min_score=0.0)
+    retrieve_with_scores(
+        "Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0, datasets=["Other"]
+    )
+    # Each checks the corpus version and searches; no chunks match the filter, so an exact search
+    # follows the index search
+    assert len(sql_statements) == 1 + 2 + 6
+
+    cache_info = enabled_retrieval_cache.cache_info()
+    assert cache_info["hits"] == 1
+    assert cache_info["misses"] == 3
+    assert cache_info["hit_rate"] == 0.25
+    assert cache_info["saved_ms"] > 0
+
+
+def test_retrieve_with_scores__cache_invalidated_by_ingestion(
+    app_config, db_session, enable_factory_create, enabled_retrieval_cache
+):
+    db_session.execute(delete(Document))
+    _create_chunks(document=DocumentFactory.create(dataset="SNAP"))
+    db_session.commit()
+    assert retrieve_with_scores("Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0)
+
+    assert drop_existing_dataset(db_session, "SNAP")
+    db_session.commit()
+    assert not retrieve_with_scores("Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0)
+    assert enabled_retrieval_cache.cache_info()["hits"] == 0
+
+
+@pytest.fixture
+def numpy_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(app_config_instance, "retrieval_backend", "numpy")
+    monkeypatch.setattr(app_config_instance, "vector_index_dir", str(tmp_path))
+
+
+@pytest.mark.asyncio
+async def test_retrieve_with_scores__numpy_backend_matches_pgvector(
+    app_config, db_session, enable_factory_create, monkeypatch, numpy_backend
+):
+    db_session.execute(delete(Document))
+    _create_chunks(document=DocumentFactory.create(dataset="SNAP", program="CalFresh"))
+    # Chunks have different embeddings so that both backends order them the same way
+    other_document = DocumentFactory.create(dataset="Other", program="CalFresh")
+    ChunkFactory.create(document=other_document, content="Moderately sized words here.")
+    ChunkFactory.create(document=other_document, content="Sesquipedalian words.")
+    ChunkFactory.create(document=DocumentFactory.create(dataset="SNAP"), content="Tiny words.")
+    mark_corpus_changed(db_session)
+    db_session.commit()
+
+    # Queries that don't have the same score for two chunks
+    queries = ["Very tiny words.", "Extraordinarily sophisticated vocabulary.", "Short question"]
+    filters_list = [{}, {"datasets": ["SNAP"]}, {"datasets": ["SNAP"], "programs": ["CalFresh"]}]
+    for query in queries:
+        for filters in filters_list:
+            numpy_results = retrieve_with_scores(
+                query, retrieval_k=4, retrieval_k_min_score=0.0, **filters
+            )
+            async_numpy_results = await retrieve_with_scores_async(
+                query, retrieval_k=4, retrieval_k_min_score=0.0, **filters
+            )
+            monkeypatch.setattr(app_config_instance, "retrieval_backend", "pgvector")
+            pgvector_results = retrieve_with_scores(
+                query, retrieval_k=4, retrieval_k_min_score=0.0, exact_search=True, **filters
+            )
+            monkeypatch.setattr(app_config_instance, "retrieval_backend", "numpy")
+
+            assert numpy_results
+            assert _chunk_ids(numpy_results) == _chunk_ids(pgvector_results)
+            assert _chunk_ids(async_numpy_results) == _chunk_ids(pgvector_results)
+            assert [result.score for result in numpy_results] == pytest.approx(
+                [result.score for result in pgvector_results], abs=1e-6
+            )
+            for numpy_result, pgvector_result in zip(numpy_results, pgvector_results, strict=True):
+                assert numpy_result.chunk.content == pgvector_result.chunk.content
+                assert numpy_result.chunk.document.name == pgvector_result.chunk.document.name
+
+
+def test_retrieve_with_scores__numpy_backend_reloads_when_corpus_changes(
+    app_config, db_session, enable_factory_create, numpy_backend
+):
+    db_session.execute(delete(Document))
+    mark_corpus_changed(db_session)
+    db_session.commit()
+    assert not retrieve_with_scores("Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0)
+
+    _create_chunks()
+    mark_corpus_changed(db_session)
+    db_session.commit()
+    assert (
+        len(retrieve_with_scores("Very tiny words.", retrieval_k=2, retrieval_k_min_score=0.0)) == 2
+    )
+
+
+def _compile(statement):
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+@pytest.mark.parametrize(
+    "quantization,distance",
+    [
+        (
+            "halfvec",
+            f"CAST(chunk.mpnet_embedding AS halfvec({EMBEDDING_DIMENSION})) <#> CAST(CAST(",
+        ),
+        (
+            "binary",
+            f"CAST(binary_quantize(chunk.mpnet_embedding) AS BIT({EMBEDDING_DIMENSION})) "
+            "<~> binary_quantize(",
+        ),
+    ],
+)
+def test_retrieval_statement__quantized(monkeypatch, quantization, distance):
+    monkeypatch.setattr(app_config_instance, "retrieval_quantization", quantization)
+    monkeypatch.setattr(app_config_instance, "quantized_rerank_factor", 10)
+    monkeypatch.setattr(app_config_instance, "hnsw_ef_search", 40)
+    query_embedding = [0.1] * EMBEDDING_DIMENSION
+
+    statement = _retrieval_statement(query_embedding, retrieval_k=5, datasets=["SNAP"])
+    sql = _compile(statement)
+    # Candidates are found using the quantized embeddings and re-scored using the full ones
+    assert distance in sql
+    assert "ORDER BY chunk.mpnet_embedding <#> CAST(" in sql
+    assert 50 in statement.compile().params.values()
+    # The HNSW index is searched for all the candidates
+    settings_params = _search_settings_statement(5, exact_search=False).compile().params
+    assert "50" in settings_params.values()
+
+    # Exact search compares the full embeddings of all chunks
+    sql = _compile(_retrieval_statement(query_embedding, retrieval_k=5, exact_search=True))
+    assert "candidates" not in sql
+
+
+@pytest.mark.parametrize(
+    "quantization,index_name",
+    [
+        ("halfvec", "chunk_mpnet_embedding_halfvec_idx"),
+        ("binary", "chunk_mpnet_embedding_binary_idx"),
+    ],
+)
+def test_retrieval_statement__quantized_uses_index(
+    app_config, db_session, monkeypatch, quantized_indexes, quantization, index_name
+):
+    monkeypatch.setattr(app_config_instance, "retrieval_quantization", quantization)
+    statement = _retrieval_statement([0.1] * EMBEDDING_DIMENSION, retrieval_k=5)
+    sql = statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+
+    db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = "\n".join(db_session.execute(text(f"EXPLAIN {sql}")).scalars())
+    db_session.rollback()
+    # The query's expression must match the index's, including the dimension
+    assert index_name in plan
+
+
+@pytest.mark.parametrize("quantization", ["halfvec", "binary"])
+def test_retrieve_with_scores__quantized_matches_exact_search(
+    app_config, db_session, enable_factory_create, monkeypatch, quantization_supported, quantization
+):
+    db_session.execute(delete(Document))
+    _create_chunks(document=DocumentFactory.create(dataset="SNAP"))
+    _create_chunks(document=DocumentFactory.create(dataset="Other"))
+    monkeypatch.setattr(app_config_instance, "retrieval_quantization", quantization)
+    # Re-score all chunks so that the results don't depend on the quantization's accuracy
+    monkeypatch.setattr(app_config_instance, "quantized_rerank_factor", 6)
+
+    for filters in [{}, {"datasets": ["SNAP"]}]:
+        results = retrieve_with_scores(
+            "Very tiny words.", retrieval_k=1, retrieval_k_min_score=-1, **filters
+        )
+        exact_results = retrieve_with_scores(
+            "Very tiny words.",
+            retrieval_k=1,
+            retrieval_k_min_score=-1,
+            exact_search=True,
+            **filters,
+        )
+        assert _chunk_ids(results) == _chunk_ids(exact_results)
+        # Scores are computed using the full embeddings
+        assert [result.score for result in results] == [result.score for result in exact_results]
+
+    results_by_query = retrieve_many(
+        ["Very tiny words.", "Extraordinarily sophisticated vocabulary."],
+        retrieval_k=2,
+        retrieval_k_min_score=-1,
+        datasets=["SNAP"],
+    )
+    assert [len(results) for results in results_by_query] == [2, 2]
@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+
+from src.db.models.document import ChunkData, DocumentData
+from src.vector_index import NumpyVectorIndex
+
+
+def _chunk(dataset, program=None):
+    document = DocumentData(
+        id=uuid.uuid4(),
+        name="Document",
+        source="https://example.com",
+        dataset=dataset,
+        program=program,
+        region=None,
+    )
+    return ChunkData(
+        id=uuid.uuid4(),
+        document=document,
+        content="Content",
+        tokens=1,
+        page_number=None,
+        headings=None,
+        num_splits=1,
+        split_index=0,
+        content_hash=None,
+        subsections=None,
+    )
+
+
+@pytest.fixture
+def chunks():
+    return [_chunk("SNAP", "CalFresh"), _chunk("SNAP"), _chunk("Other", "CalFresh")]
+
+
+@pytest.fixture
+def index(chunks, tmp_path):
+    embeddings = [[1.0, 0.0], [0.6, 0.8], [0.0, 1.0]]
+    return NumpyVectorIndex(chunks, embeddings, "corpus-1", directory=str(tmp_path))
+
+
+def test_search(index, chunks, tmp_path):
+    results = index.search([1.0, 0.0], retrieval_k=2)
+    assert [chunk for chunk, _ in results] == [chunks[0], chunks[1]]
+    # Scores are negated, like pgvector's max_inner_product
+    assert [score for _, score in results] == pytest.approx([-1.0, -0.6])
+
+    assert len(index.search([1.0, 0.0], retrieval_k=10)) == 3
+    # The memory-mapped file is removed once it's mapped
+    assert not list(tmp_path.iterdir())
+
+
+def test_search__filters(index, chunks):
+    results = index.search([0.0, 1.0], retrieval_k=3, datasets=["SNAP"])
+    assert [chunk for chunk, _ in results] == [chunks[1], chunks[0]]
+
+    results = index.search([0.0, 1.0], retrieval_k=3, datasets=["SNAP"], programs=["CalFresh"])
+    assert [chunk for chunk, _ in results] == [chunks[0]]
+
+    assert len(index.search([0.0, 1.0], retrieval_k=3, datasets=[])) == 3
+    assert index.search([0.0, 1.0], retrieval_k=3, datasets=["Unknown"]) == []
+
+    with pytest.raises(ValueError):
+        index.search([0.0, 1.0], retrieval_k=3, unknown=["value"])
+
+
+def test_search__empty_index():
+    index = NumpyVectorIndex([], [], "corpus-1")
+    assert index.search([1.0, 0.0], retrieval_k=2) == []
@@ -0,0 +1,21 @@
+from sqlalchemy import text
+
+from src.app_config import app_config as app_config_instance
+from src.util.rebuild_hnsw_indexes import rebuild_hnsw_indexes
+
+
+def test_rebuild_hnsw_indexes(app_config, db_session, monkeypatch):
+    monkeypatch.setattr(app_config_instance, "hnsw_m", 8)
+    monkeypatch.setattr(app_config_instance, "hnsw_ef_construction", 32)
+
+    with app_config_instance.db_session() as session:
+        assert rebuild_hnsw_indexes(session) == ["chunk_mpnet_embedding_idx"]
+
+    index_definition = db_session.execute(
+        text(
+            "SELECT indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND indexname = 'chunk_mpnet_embedding_idx'"
+        )
+    ).scalar_one()
+    assert "USING hnsw (mpnet_embedding vector_ip_ops)" in index_definition
+    assert index_definition.endswith("WITH (m='8', ef_construction='32')")